@@ -0,0 +1,182 @@
+"""Generates a synthetic source tree to extract strings from
+
+The corpus is built from a seeded random number generator and doesn't depend
+on anything else, so the same parameters always produce byte-for-byte the same
+files. Bump ``CORPUS_VERSION`` whenever the output changes so results from
+different corpora don't get compared.
+
+"""
+
+import os
+import random
+
+CORPUS_VERSION = 1
+
+WORDS = (
+    "account add all already another back cancel change check choose close "
+    "confirm continue copy create current delete details done download edit "
+    "email enter error every file find first folder help here home image "
+    "invalid item language last learn link list log manage message more name "
+    "new next notification number open page password please preferences "
+    "previous privacy profile remove report required save search select send "
+    "settings share show sign start subscribe support team try update upload "
+    "user view welcome window"
+).split()
+
+CONTEXTS = ["button", "menu", "title", "tooltip", "verb", "noun"]
+
+HTML_FILLER = [
+    '<div class="row"><span>{{ item.name }}</span></div>',
+    '<a href="{{ url }}">{{ item.name }}</a>',
+    "{% if user.is_authenticated %}<span>{{ user.name }}</span>{% endif %}",
+    "{% for item in items %}<li>{{ item.title }}</li>{% endfor %}",
+    '<img src="{{ static("img/logo.png") }}" alt="">',
+    "<p>{{ item.description|safe }}</p>",
+]
+
+PY_FILLER = [
+    "obj = get_object_or_404(Item, pk=pk)",
+    "items = Item.objects.filter(owner=request.user)[:{n}]",
+    "if not items:\n    return redirect('home')",
+    "context = {{'items': items, 'count': {n}}}",
+    "template = 'page_{n}.html'",
+]
+
+
+class CorpusGenerator:
+    """Builds the files of a corpus
+
+    :arg seed: seed for the random number generator
+    :arg vocabulary: number of distinct strings to pick from; smaller numbers
+        mean more strings show up in several files
+
+    """
+
+    def __init__(self, seed, vocabulary=2000):
+        self.rng = random.Random(seed)
+        self.strings = [self.sentence() for i in range(vocabulary)]
+
+    def sentence(self, min_words=2, max_words=9):
+        words = self.rng.sample(WORDS, self.rng.randint(min_words, max_words))
+        return " ".join(words).capitalize()
+
+    def string(self):
+        return self.rng.choice(self.strings)
+
+    def template(self):
+        rng = self.rng
+        lines = ['{% extends "base.html" %}', "{% block content %}"]
+        for i in range(rng.randint(20, 80)):
+            kind = rng.random()
+            if kind < 0.45:
+                lines.append(rng.choice(HTML_FILLER))
+            elif kind < 0.7:
+                lines.append("<p>{{ _('%s') }}</p>" % self.string())
+            elif kind < 0.78:
+                lines.append(
+                    "<h2>{{ _('%s, %%(name)s', name=user.name) }}</h2>" % self.string()
+                )
+            elif kind < 0.86:
+                lines.append(
+                    "{{ pgettext('%s', '%s') }}" % (rng.choice(CONTEXTS), self.string())
+                )
+            elif kind < 0.9:
+                lines.append(
+                    "{{ npgettext('%s', '%s', '%s', count) }}"
+                    % (rng.choice(CONTEXTS), self.string(), self.string())
+                )
+            elif kind < 0.97:
+                lines.append("{# L10n: %s #}" % self.sentence())
+                lines.append("{% trans %}")
+                for j in range(rng.randint(2, 5)):
+                    lines.append("  " + self.sentence(4, 12))
+                lines.append("{% endtrans %}")
+            else:
+                lines.append("{% trans count=items|length %}")
+                lines.append("  %s one item" % self.string())
+                lines.append("{% pluralize %}")
+                lines.append("  %s {{ count }} items" % self.string())
+                lines.append("{% endtrans %}")
+        lines.append("{% endblock %}")
+        return "\n".join(lines) + "\n"
+
+    def python_body(self, with_strings):
+        rng = self.rng
+        lines = []
+        for i in range(rng.randint(4, 12)):
+            kind = rng.random() if with_strings else 0
+            if kind < 0.6:
+                lines.extend(rng.choice(PY_FILLER).format(n=i).split("\n"))
+            elif kind < 0.8:
+                lines.append("message = _(%r)" % self.string())
+            elif kind < 0.88:
+                lines.append("# L10n: %s" % self.sentence())
+                lines.append("message = _(%r) %% {'n': %d}" % (self.string(), i))
+            elif kind < 0.95:
+                lines.append(
+                    "label = pgettext(%r, %r)" % (rng.choice(CONTEXTS), self.string())
+                )
+            else:
+                lines.append("label = npgettext(")
+                lines.append("    %r," % rng.choice(CONTEXTS))
+                lines.append("    %r," % self.string())
+                lines.append("    %r," % self.string())
+                lines.append("    len(items),")
+                lines.append(")")
+        lines.append("return render(request, template, context)")
+        return lines
+
+    def python(self, with_strings=True):
+        lines = [
+            "from django.shortcuts import get_object_or_404, redirect, render",
+            "",
+            "from django.utils.translation import gettext as _, npgettext, pgettext",
+        ]
+        for i in range(self.rng.randint(3, 10)):
+            lines.extend(["", "", "def view_%d(request, pk):" % i])
+            lines.extend("    " + line for line in self.python_body(with_strings))
+        return "\n".join(lines) + "\n"
+
+
+def generate_corpus(base_dir, files, seed, vocabulary=2000):
+    """Writes a corpus to ``base_dir``
+
+    About two thirds of the files are Jinja2 templates in ``templates/`` and
+    the rest are Python modules, one in ten of which has no strings at all.
+    Files are spread over ``apps/appNN/`` directories.
+
+    :arg base_dir: directory to write the files to
+    :arg files: number of files to write
+    :arg seed: seed for the random number generator
+    :arg vocabulary: number of distinct strings to pick from
+
+    :returns: dict describing the corpus
+
+    """
+    generator = CorpusGenerator(seed, vocabulary)
+    total_bytes = 0
+    for index in range(files):
+        app_dir = os.path.join(base_dir, "apps", "app%02d" % (index % 20))
+        if index % 3:
+            path = os.path.join(app_dir, "templates", "page_%04d.html" % index)
+            data = generator.template()
+        elif index % 30 == 0:
+            path = os.path.join(app_dir, "utils_%04d.py" % index)
+            data = generator.python(with_strings=False)
+        else:
+            path = os.path.join(app_dir, "views_%04d.py" % index)
+            data = generator.python()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = data.encode("utf-8")
+        with open(path, "wb") as fp:
+            fp.write(data)
+        total_bytes += len(data)
+
+    return {
+        "corpus_version": CORPUS_VERSION,
+        "files": files,
+        "seed": seed,
+        "vocabulary": vocabulary,
+        "bytes": total_bytes,
+    }
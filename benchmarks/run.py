@@ -0,0 +1,493 @@
+"""Times extracting, writing, merging and rendering strings for a synthetic corpus
+
+Run it from the root of the repository::
+
+    $ python benchmarks/run.py --json results.json
+
+To compare against another commit, save results there and pass them with
+``--compare``. The corpus only depends on ``--files``, ``--seed`` and
+``--vocabulary``, so results for the same parameters are comparable::
+
+    $ git checkout main
+    $ python benchmarks/run.py --json main.json
+    $ git checkout my-branch
+    $ python benchmarks/run.py --compare main.json
+
+``--compare`` exits with status 1 if any benchmark got slower by more than
+``--threshold``.
+
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Benchmark the puente in this checkout and not whatever is installed
+sys.path.insert(0, ROOT)
+
+from benchmarks.corpus import generate_corpus  # noqa: E402
+
+DOMAIN_METHODS = {
+    "django": [
+        ("apps/**.py", "python"),
+        ("apps/**/templates/**.html", "jinja2"),
+    ],
+    "javascript": [
+        ("apps/**/templates/**.html", "jinja2"),
+    ],
+}
+
+JINJA2_CONFIG = {
+    "**.html": {
+        "extensions": "puente.ext.i18n",
+        "silent": "False",
+    },
+}
+
+LANGUAGES = ["de", "en_US", "es", "fr", "ja"]
+
+
+def setup_django():
+    import django
+    from django.conf import settings
+
+    settings.configure(
+        INSTALLED_APPS=["puente"],
+        PUENTE={"JINJA2_CONFIG": JINJA2_CONFIG},
+        USE_I18N=True,
+    )
+    django.setup()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Benchmarks:
+    """The benchmarks to run against a corpus in ``base_dir``
+
+    Every ``bench_*`` method is a benchmark. It does its setup and returns a
+    function that does the work to time.
+
+    """
+
+    def __init__(self, base_dir, jobs, languages):
+        from puente import settings as puente_settings
+
+        self.base_dir = base_dir
+        self.jobs = jobs
+        self.languages = languages
+        self.settings = puente_settings
+        self.locale_dir = os.path.join(base_dir, "locale")
+        self.pot_dir = os.path.join(self.locale_dir, "templates", "LC_MESSAGES")
+
+    def names(self):
+        return [name[6:] for name in sorted(dir(self)) if name.startswith("bench_")]
+
+    def extract(self):
+        from puente.commands import extract_command
+
+        return extract_command(
+            outputdir=self.pot_dir,
+            domain_methods=DOMAIN_METHODS,
+            text_domain=self.settings.TEXT_DOMAIN,
+            keywords=self.settings.KEYWORDS,
+            comment_tags=self.settings.COMMENT_TAGS,
+            base_dir=self.base_dir,
+            project=self.settings.PROJECT,
+            version=self.settings.VERSION,
+            msgid_bugs_address=self.settings.MSGID_BUGS_ADDRESS,
+            jobs=self.jobs,
+        )
+
+    def pot_path(self, domain):
+        return os.path.join(self.pot_dir, "%s.pot" % domain)
+
+    def read_catalog(self, domain):
+        from babel.messages.pofile import read_po
+
+        if not os.path.exists(self.pot_path(domain)):
+            self.extract()
+        with open(self.pot_path(domain), "rb") as fp:
+            return read_po(fp)
+
+    def files(self, extension):
+        found = []
+        for root, dirs, files in os.walk(os.path.join(self.base_dir, "apps")):
+            dirs.sort()
+            for filename in sorted(files):
+                if filename.endswith(extension):
+                    found.append(os.path.join(root, filename))
+        return found
+
+    def bench_extract(self):
+        """Extract all domains with the extract command"""
+
+        def run():
+            for domain in DOMAIN_METHODS:
+                if os.path.exists(self.pot_path(domain)):
+                    os.remove(self.pot_path(domain))
+            self.extract()
+
+        return run
+
+    def _bench_extract_method(self, method, extension):
+        from puente.commands import generate_options_map
+        from puente.extract import extract_file
+
+        options = generate_options_map()["**.html"] if method == "jinja2" else {}
+        filepaths = self.files(extension)
+
+        def run():
+            for filepath in filepaths:
+                extract_file(
+                    filepath,
+                    method,
+                    options,
+                    self.settings.KEYWORDS,
+                    self.settings.COMMENT_TAGS,
+                )
+
+        return run
+
+    def bench_extract_jinja2(self):
+        """Extract strings from every template in process"""
+        return self._bench_extract_method("jinja2", ".html")
+
+    def bench_extract_python(self):
+        """Extract strings from every Python module in process"""
+        return self._bench_extract_method("python", ".py")
+
+    def bench_collapse_whitespace(self):
+        """Collapse whitespace of every message wrapped over several lines"""
+        from puente.utils import collapse_whitespace
+
+        messages = [
+            "\n    ".join(message.id.split(" ")) + "\n"
+            for message in self.read_catalog("django")
+            if isinstance(message.id, str) and message.id
+        ]
+
+        def run():
+            for message in messages:
+                collapse_whitespace(message)
+
+        return run
+
+    def bench_write_pot(self):
+        """Render the .pot file of the django domain"""
+        from babel.messages.pofile import write_po
+
+        catalog = self.read_catalog("django")
+
+        def run():
+            write_po(io.BytesIO(), catalog, width=80)
+
+        return run
+
+    def _bench_render(self, instrumented):
+        from django.conf import settings
+        from jinja2 import Environment
+
+        from puente.instrumentation import collect
+
+        puente_settings = settings.PUENTE
+        settings.PUENTE = dict(puente_settings, INSTRUMENTATION=instrumented)
+        try:
+            env = Environment(autoescape=True, extensions=["puente.ext.i18n"])
+        finally:
+            settings.PUENTE = puente_settings
+        tmpl = env.from_string(
+            "{% for context, message in messages %}"
+            "{{ pgettext(context, message, name=name) }}"
+            "{{ npgettext(context, message, message, loop.index, name=name) }}"
+            "{% endfor %}"
+        )
+        messages = []
+        for message in self.read_catalog("django"):
+            if message.context and isinstance(message.id, str):
+                messages.append((message.context, message.id))
+                messages.append((message.context, message.id + ", %(name)s"))
+
+        def run():
+            tmpl.render(messages=messages, name="<b>Jane</b>")
+
+        def run_collecting():
+            with collect():
+                run()
+
+        return run_collecting if instrumented else run
+
+    def bench_render_pgettext(self):
+        """Render pgettext and npgettext calls with and without variables"""
+        return self._bench_render(instrumented=False)
+
+    def bench_render_instrumented(self):
+        """Render like bench_render_pgettext while collecting stats"""
+        return self._bench_render(instrumented=True)
+
+    def bench_interpolate(self):
+        """Interpolate variables into translations like pgettext does"""
+        from markupsafe import Markup
+
+        from puente.ext import interpolate
+
+        messages = []
+        for message in self.read_catalog("django"):
+            if isinstance(message.id, str) and message.id:
+                messages.append(Markup(message.id))
+                messages.append(Markup(message.id + ", %(name)s"))
+
+        def run():
+            for message in messages:
+                interpolate(message, {"name": "<b>Jane</b>"})
+
+        return run
+
+    def _bench_merge(self, engine):
+        from puente.commands import merge_command
+
+        for domain in DOMAIN_METHODS:
+            self.read_catalog(domain)
+        # Start from scratch so engines don't see each other's .po files
+        for name in os.listdir(self.locale_dir):
+            path = os.path.join(self.locale_dir, name)
+            if name == "templates":
+                continue
+            elif os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+        def run():
+            merge_command(
+                create=True,
+                backup=False,
+                base_dir=self.base_dir,
+                domain_methods=DOMAIN_METHODS,
+                languages=self.languages,
+                jobs=self.jobs,
+                engine=engine,
+                force=True,
+            )
+
+        # The first run creates the .po files; time updating existing ones
+        # since that's what happens most of the time
+        run()
+        return run
+
+    def bench_merge(self):
+        """Merge the .pot files into the .po files of every language"""
+        if shutil.which("msgmerge") is None:
+            return None
+        return self._bench_merge("gettext")
+
+    def bench_compile(self):
+        """Compile the .po files of every language"""
+        from puente.commands import compile_command
+
+        if not os.path.exists(os.path.join(self.locale_dir, self.languages[0])):
+            self._bench_merge("python")()
+
+        def run():
+            compile_command(
+                base_dir=self.base_dir,
+                domain_methods=DOMAIN_METHODS,
+                jobs=self.jobs,
+                force=True,
+            )
+
+        return run
+
+    def bench_merge_python(self):
+        """Merge like bench_merge, but in process with Babel"""
+        return self._bench_merge("python")
+
+
+def measure(func, repeat, warmup):
+    """Returns list of how many seconds each call of ``func`` took"""
+    timings = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for i in range(warmup):
+            func()
+        for i in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_benchmarks(args, base_dir):
+    benchmarks = Benchmarks(base_dir, args.jobs, args.languages)
+    names = args.only or benchmarks.names()
+    unknown = set(names) - set(benchmarks.names())
+    if unknown:
+        raise SystemExit("Unknown benchmarks: %s" % ", ".join(sorted(unknown)))
+
+    results = {}
+    for name in names:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            func = getattr(benchmarks, "bench_" + name)()
+        if func is None:
+            print("%-24s skipped" % name)
+            continue
+
+        timings = measure(func, args.repeat, args.warmup)
+        results[name] = {
+            "min": min(timings),
+            "median": statistics.median(timings),
+            "max": max(timings),
+            "timings": timings,
+        }
+        print(
+            "%-24s min %8.4fs  median %8.4fs  max %8.4fs"
+            % (name, min(timings), statistics.median(timings), max(timings))
+        )
+    return results
+
+
+def compare(data, baseline, threshold):
+    """Prints how results compare to a baseline
+
+    Benchmarks are compared by their fastest run since that's the one that
+    was disturbed the least by everything else going on on the machine.
+
+    :returns: list of names of benchmarks that got slower by more than
+        ``threshold``
+
+    """
+    if data["corpus"] != baseline["corpus"]:
+        raise SystemExit(
+            "Can not compare results for different corpora: %r != %r"
+            % (data["corpus"], baseline["corpus"])
+        )
+
+    print("")
+    print("Compared to %s:" % (baseline.get("revision") or "baseline"))
+    regressions = []
+    for name, result in sorted(data["results"].items()):
+        if name not in baseline["results"]:
+            continue
+        ratio = result["min"] / baseline["results"][name]["min"]
+        marker = ""
+        if ratio > 1 + threshold:
+            marker = "  SLOWER"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            marker = "  faster"
+        print("%-24s %6.2fx%s" % (name, ratio, marker))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--files", type=int, default=300, help="number of files (default: 300)"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=1, help="seed for the corpus (default: 1)"
+    )
+    parser.add_argument(
+        "--vocabulary",
+        type=int,
+        default=2000,
+        help="number of distinct strings in the corpus (default: 2000)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="number of timed runs of each benchmark (default: 5)",
+    )
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=1,
+        help="number of untimed runs before timing (default: 1)",
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=1, help="--jobs for the extract and merge commands"
+    )
+    parser.add_argument(
+        "--languages",
+        nargs="+",
+        default=LANGUAGES,
+        help="languages to merge (default: %s)" % " ".join(LANGUAGES),
+    )
+    parser.add_argument(
+        "--only", nargs="+", metavar="NAME", help="only run these benchmarks"
+    )
+    parser.add_argument(
+        "--corpus-dir",
+        help="generate the corpus in this directory and keep it around",
+    )
+    parser.add_argument("--json", metavar="PATH", help="write results to PATH")
+    parser.add_argument(
+        "--compare", metavar="PATH", help="compare with results saved with --json"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="fraction a benchmark can get slower by with --compare (default: 0.1)",
+    )
+    args = parser.parse_args(argv)
+
+    setup_django()
+
+    with contextlib.ExitStack() as stack:
+        base_dir = args.corpus_dir
+        if base_dir is None:
+            base_dir = stack.enter_context(tempfile.TemporaryDirectory())
+        elif os.path.exists(os.path.join(base_dir, "apps")):
+            raise SystemExit("%s already has a corpus in it" % base_dir)
+        corpus = generate_corpus(base_dir, args.files, args.seed, args.vocabulary)
+        print(
+            "Corpus: %(files)d files, %(bytes)d bytes, seed %(seed)d, "
+            "vocabulary %(vocabulary)d" % corpus
+        )
+        results = run_benchmarks(args, base_dir)
+
+    import puente
+
+    data = {
+        "revision": git_revision(),
+        "puente_version": puente.__version__,
+        "python_version": platform.python_version(),
+        "jobs": args.jobs,
+        "corpus": corpus,
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as fp:
+            json.dump(data, fp, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)
+        if compare(data, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import hashlib
+import os
+import threading
+from io import BytesIO
+
+from django.utils.translation import trans_real
+from jinja2.bccache import Bucket, BytecodeCache
+
+import puente
+from puente.utils import atomic_write
+
+
+class PuenteBytecodeCache(BytecodeCache):
+    """Jinja2 bytecode cache that's safe to share between configurations
+
+    Jinja2's bytecode caches key templates by name and source only, but what
+    a template compiles to also depends on the version of Puente, which
+    collapses whitespace in trans blocks, on the extensions of the
+    environment, on whether it uses newstyle gettext and, for environments
+    from :py:func:`puente.ext.get_translated_environment`, on the language
+    and its catalog. This cache keys templates by all of those, so
+    environments that differ in any of them never load each other's
+    bytecode.
+
+    Entries are files in ``directory``. The cache keeps a running total of
+    their size, which it seeds by scanning the directory once when it's
+    created. When the total gets more than 10% over ``max_size`` bytes, it
+    scans the directory and removes the least recently used entries until
+    they fit in ``max_size`` again, so most writes don't scan the directory.
+    Processes that share the directory each keep their own total, which the
+    scans correct.
+
+    :arg directory: directory to keep entries in; it's created if it doesn't
+        exist
+    :arg max_size: maximum number of bytes of all entries
+
+    """
+
+    SUFFIX = ".jinja2cache"
+    # How far past max_size entries can grow before they're evicted
+    HIGH_WATER_MARK = 1.1
+
+    def __init__(self, directory, max_size=100 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.size = sum(size for mtime, size, path in self._entries())
+
+    def get_catalog_key(self, environment):
+        """Returns a hash of the catalog an environment translates with at
+        compile time or None
+
+        The hash is kept on the environment until catalogs are reloaded.
+
+        """
+        language = getattr(environment, "puente_language", None)
+        if language is None:
+            return None
+        if environment.puente_catalog_key is None:
+            catalog = trans_real.translation(language)._catalog
+            digest = hashlib.sha1()
+            for item in sorted(repr(item) for item in catalog.items()):
+                digest.update(item.encode("utf-8"))
+            environment.puente_catalog_key = digest.hexdigest()
+        return environment.puente_catalog_key
+
+    def get_environment_key(self, environment):
+        """Returns a string of everything about the environment that changes
+        what templates compile to
+
+        """
+        return repr(
+            (
+                puente.__version__,
+                sorted(environment.extensions),
+                getattr(environment, "newstyle_gettext", False),
+                getattr(environment, "puente_language", None),
+                self.get_catalog_key(environment),
+            )
+        )
+
+    def get_bucket(self, environment, name, filename, source):
+        key = hashlib.sha1(
+            (
+                "%s|%s"
+                % (
+                    self.get_cache_key(name, filename),
+                    self.get_environment_key(environment),
+                )
+            ).encode("utf-8")
+        ).hexdigest()
+        bucket = Bucket(environment, key, self.get_source_checksum(source))
+        self.load_bytecode(bucket)
+        return bucket
+
+    def _path(self, bucket):
+        return os.path.join(self.directory, bucket.key + self.SUFFIX)
+
+    def load_bytecode(self, bucket):
+        path = self._path(bucket)
+        try:
+            with open(path, "rb") as fp:
+                bucket.load_bytecode(fp)
+            # Entries are evicted by modification time, so touch the ones
+            # that get used
+            os.utime(path)
+        except (FileNotFoundError, PermissionError):
+            # Another process may have evicted it
+            return
+
+    def dump_bytecode(self, bucket):
+        buf = BytesIO()
+        bucket.write_bytecode(buf)
+        data = buf.getvalue()
+        path = self._path(bucket)
+        try:
+            old_size = os.path.getsize(path)
+        except FileNotFoundError:
+            old_size = 0
+        atomic_write(path, data)
+        with self._lock:
+            self.size += len(data) - old_size
+            full = self.size > self.max_size * self.HIGH_WATER_MARK
+        if full:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(self.SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """Removes least recently used entries until they fit in ``max_size``"""
+        entries = self._entries()
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self._lock:
+            self.size = total
+
+    def clear(self):
+        for mtime, size, path in self._entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self.size = 0
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+
+import babel
+import jinja2
+
+import puente
+from puente.utils import atomic_write
+
+
+class ExtractionCache:
+    """On-disk cache of messages extracted from files
+
+    Entries are stored by filename and extraction method and are only valid
+    if the key matches. The key covers the file contents, the extraction
+    method and its options, the keywords and comment tags and the versions of
+    Puente, Babel and Jinja2, so a change to any of those causes the file to
+    be extracted again.
+
+    Only entries that are looked up or stored during a run are written back by
+    :py:meth:`save`, so entries for files that were deleted or no longer match
+    a method get evicted automatically.
+
+    :arg cache_dir: the directory to keep the cache in; it's created if it
+        doesn't exist
+    :arg keywords: KEYWORDS setting
+    :arg comment_tags: COMMENT_TAGS setting
+
+    """
+
+    FILENAME = "extract.json"
+    FORMAT_VERSION = 1
+
+    def __init__(self, cache_dir, keywords, comment_tags):
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, self.FILENAME)
+        self.settings_key = json.dumps(
+            [
+                self.FORMAT_VERSION,
+                puente.__version__,
+                babel.__version__,
+                jinja2.__version__,
+                keywords,
+                list(comment_tags),
+            ],
+            sort_keys=True,
+        )
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = {}
+        self._seen = {}
+        try:
+            with open(self.path) as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            data = None
+        if data and data.get("settings_key") == self.settings_key:
+            self._entries = data["entries"]
+
+    def make_key(self, data, method, options):
+        """Returns the cache key for file contents
+
+        :arg data: the contents of the file as bytes
+        :arg method: the extraction method
+        :arg options: the options for the extraction method
+
+        """
+        hasher = hashlib.sha1(data)
+        hasher.update(json.dumps([method, options], sort_keys=True).encode("utf-8"))
+        return hasher.hexdigest()
+
+    def get(self, filename, method, key):
+        """Returns cached messages or None if there's no valid entry
+
+        :returns: list of ``(lineno, msg, comments, context)`` tuples
+
+        """
+        entry_name = "%s:%s" % (method, filename)
+        entry = self._entries.get(entry_name)
+        if entry is None or entry["key"] != key:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._seen[entry_name] = entry
+        return [
+            # JSON turns the tuples of plural msgids into lists
+            (lineno, tuple(msg) if isinstance(msg, list) else msg, comments, context)
+            for lineno, msg, comments, context in entry["messages"]
+        ]
+
+    def set(self, filename, method, key, messages):
+        """Stores the messages extracted from a file"""
+        self._seen["%s:%s" % (method, filename)] = {
+            "key": key,
+            "messages": [list(message) for message in messages],
+        }
+
+    def save(self, evict=True):
+        """Writes the entries to disk
+
+        :arg evict: whether to drop entries that weren't looked up or stored
+            during this run
+
+        """
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        entries = self._seen
+        if not evict:
+            entries = dict(self._entries, **self._seen)
+        data = {
+            "settings_key": self.settings_key,
+            "entries": entries,
+        }
+        atomic_write(self.path, json.dumps(data, sort_keys=True).encode("utf-8"))
+
+
+class Manifest:
+    """Records what went into and came out of building files
+
+    For every entry, the manifest keeps a hash of the input a file was built
+    from and a hash of the file that came out. If both still match, building
+    it again wouldn't change anything and can be skipped. The merge command
+    uses this with .pot files as inputs and .po files as outputs and the
+    compile command with .po files as inputs and .mo files as outputs.
+
+    Like :py:class:`ExtractionCache`, only entries that are looked up or
+    stored during a run are written back by :py:meth:`save`.
+
+    :arg path: the path of the manifest file
+    :arg settings: list of things that affect the output like the engine
+        used; entries recorded with different settings don't count
+
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, path, settings):
+        self.path = path
+        self.settings_key = json.dumps(
+            [self.FORMAT_VERSION, puente.__version__] + list(settings)
+        )
+
+        self._entries = {}
+        self._seen = {}
+        try:
+            with open(self.path) as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            data = None
+        if data and data.get("settings_key") == self.settings_key:
+            self._entries = data["entries"]
+
+    @staticmethod
+    def hash_data(data):
+        """Returns the hash of the contents of a file as bytes"""
+        return hashlib.sha1(data).hexdigest()
+
+    def hash_file(self, path):
+        """Returns the hash of a file's contents or None if it doesn't exist"""
+        try:
+            with open(path, "rb") as fp:
+                return self.hash_data(fp.read())
+        except FileNotFoundError:
+            return None
+
+    def is_unchanged(self, name, input_hash, output_path):
+        """Returns whether an output file is up to date with its input
+
+        :arg name: the name of the entry
+        :arg input_hash: hash of the input from :py:meth:`hash_data`
+        :arg output_path: path to the output file
+
+        """
+        entry = self._entries.get(name)
+        if entry is None or entry["input"] != input_hash:
+            return False
+        if entry["output"] != self.hash_file(output_path):
+            return False
+        self._seen[name] = entry
+        return True
+
+    def set(self, name, input_hash, output_path):
+        """Records that an output file was built from an input"""
+        self._seen[name] = {
+            "input": input_hash,
+            "output": self.hash_file(output_path),
+        }
+
+    def save(self):
+        """Writes the entries to disk"""
+        data = {
+            "settings_key": self.settings_key,
+            "entries": self._seen,
+        }
+        atomic_write(self.path, json.dumps(data, sort_keys=True).encode("utf-8"))
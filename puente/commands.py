@@ -1,14 +1,39 @@
+import copy
 import os
-from subprocess import PIPE, Popen, call
-from tempfile import TemporaryFile
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+from subprocess import PIPE, STDOUT, Popen, call
 
+import babel
 from babel.messages.catalog import Catalog
-from babel.messages.extract import extract_from_dir
-from babel.messages.pofile import write_po
+from babel.messages.mofile import write_mo
+from babel.messages.pofile import read_po, write_po
+from babel.util import distinct
 from django.conf import settings
 from django.core.management.base import CommandError
 
-from puente.utils import monkeypatch_i18n
+from puente.cache import ExtractionCache, Manifest
+from puente.extract import (
+    build_prefilter,
+    extract_files,
+    match_files,
+    walk_files,
+    walk_order_key,
+)
+from puente.fuzzy import update_catalog
+from puente.profiling import ExtractionProfile
+from puente.store import (
+    FORMAT_VERSION as STORE_FORMAT_VERSION,
+    STORE_SUFFIX,
+    write_store,
+)
+from puente.untranslated import read_dumps
+from puente.utils import atomic_write, monkeypatch_i18n
+from puente.warmup import find_jinja2_engine, warmup
 
 
 def generate_options_map():
@@ -73,6 +98,14 @@ def extract_command(
     project,
     version,
     msgid_bugs_address,
+    jobs=1,
+    cache_dir=None,
+    prefilter=False,
+    since=None,
+    exclude_dirs=None,
+    profile=False,
+    profile_json=None,
+    profile_top=10,
 ):
     """Extracts strings into .pot files
 
@@ -87,6 +120,24 @@ def extract_command(
     :arg project: PROJECT setting
     :arg version: VERSION setting
     :arg msgid_bugs_address: MSGID_BUGS_ADDRESS setting
+    :arg jobs: number of processes to extract strings with; 0 means one
+        per CPU
+    :arg cache_dir: directory to cache extracted strings in so files that
+        haven't changed since the last run don't get parsed again; None
+        disables the cache
+    :arg prefilter: whether to skip parsing files that have no gettext
+        keywords or trans tags in them
+    :arg since: git ref; if set, only extract strings from files that changed
+        since this ref and update the existing .pot files with them
+    :arg exclude_dirs: EXCLUDE_DIRS setting
+    :arg profile: whether to print a report of how long extracting took
+        per file, per method and per domain
+    :arg profile_json: path to write the profile to as JSON; None doesn't
+        write it
+    :arg profile_top: number of slowest files to list in the profile
+
+    :returns: list of domains whose .pot files changed; .pot files that
+        would only change in volatile headers are left untouched
 
     """
     # Must monkeypatch first to fix i18n extensions stomping issues!
@@ -98,18 +149,179 @@ def extract_command(
         print("Creating output dir %s ..." % outputdir)
         os.makedirs(outputdir)
 
-    domains = domain_methods.keys()
+    profiler = None
+    if profile or profile_json:
+        profiler = ExtractionProfile()
+    start = phase_start = time.perf_counter()
+
+    def end_phase(name):
+        nonlocal phase_start
+        now = time.perf_counter()
+        if profiler is not None:
+            profiler.add_phase(name, now - phase_start)
+        phase_start = now
+
+    domains = list(domain_methods.keys())
+    options_map = generate_options_map()
+
+    if since:
+        # Start from the previous .pot files and only extract from files that
+        # changed
+        previous = {}
+        for domain in domains:
+            domain_pot = os.path.join(outputdir, "%s.pot" % domain)
+            if not os.path.isfile(domain_pot):
+                raise CommandError(
+                    "Can not find %s.pot; extract without --since first." % domain
+                )
+            with open(domain_pot, "rb") as fp:
+                previous[domain] = read_po(fp)
+
+        changed = _git_changed_files(base_dir, since)
+        print(
+            "Extracting strings in domains %s from %d files changed since %s..."
+            % (", ".join(domains), len(changed), since)
+        )
+        files = list(
+            match_files(base_dir, changed, domain_methods, options_map, exclude_dirs)
+        )
+    else:
+        print("Extracting all strings in domains %s..." % ", ".join(domains))
+        # Walk the tree once for all domains
+        files = list(walk_files(base_dir, domain_methods, options_map, exclude_dirs))
+
+    end_phase("find files")
+
+    cache = None
+    if cache_dir:
+        cache = ExtractionCache(cache_dir, keywords, comment_tags)
+    counts = {"tasks": 0, "extracted": 0, "skipped": 0}
+
+    def extract_records(files):
+        """Returns dict of domain -> list of (sort key, (filename, lineno,
+        msg, cmts, ctxt)) for ``files``
+
+        """
+        # Parse each file once per extraction method no matter how many
+        # domains want it
+        tasks = []
+        for filename, filepath, options, methods in files:
+            for method in distinct(methods.values()):
+                tasks.append((filename, filepath, method, options))
+
+        results = [None] * len(tasks)
+        timings = [0.0] * len(tasks)
+        cache_keys = {}
+        if cache is not None:
+            for i, (filename, filepath, method, options) in enumerate(tasks):
+                with open(filepath, "rb") as fp:
+                    key = cache.make_key(fp.read(), method, options)
+                results[i] = cache.get(filename, method, key)
+                cache_keys[i] = key
+            end_phase("cache lookup")
 
-    def callback(filename, method, options):
-        if method != "ignore":
+        to_extract = [i for i, result in enumerate(results) if result is None]
+        cached_tasks = set(range(len(tasks))) - set(to_extract)
+        extracted = extract_files(
+            [tasks[i][1:] for i in to_extract],
+            keywords,
+            comment_tags,
+            jobs=jobs,
+            prefilter=build_prefilter(keywords) if prefilter else None,
+        )
+        for i, (messages, seconds) in zip(to_extract, extracted):
+            timings[i] = seconds
+            if messages is None:
+                counts["skipped"] += 1
+                messages = []
+            results[i] = messages
+            if cache is not None:
+                filename, filepath, method, options = tasks[i]
+                cache.set(filename, method, cache_keys[i], messages)
+        counts["tasks"] += len(tasks)
+        counts["extracted"] += len(to_extract)
+        end_phase("extract")
+
+        records = {domain: [] for domain in domains}
+        results = iter(enumerate(results))
+        for filename, filepath, options, methods in files:
             print("  %s" % filename)
+            key = walk_order_key(filename)
+            for method in distinct(methods.values()):
+                i, messages = next(results)
+                if profiler is not None:
+                    profiler.add_file(
+                        filename,
+                        method,
+                        [domain for domain, m in methods.items() if m == method],
+                        seconds=timings[i],
+                        size=os.path.getsize(filepath),
+                        messages=len(messages),
+                        cached=i in cached_tasks,
+                    )
+                for domain, domain_method in methods.items():
+                    if domain_method != method:
+                        continue
+                    records[domain].extend(
+                        ((key, i), (filename, lineno, msg, cmts, ctxt))
+                        for i, (lineno, msg, cmts, ctxt) in enumerate(messages)
+                    )
+        return records
 
-    # Extract string for each domain
-    for domain in domains:
-        print("Extracting all strings in domain %s..." % domain)
+    # Map of domain -> list of (sort key, (filename, lineno, msg, cmts, ctxt))
+    records = extract_records(files)
 
-        methods = domain_methods[domain]
+    if since:
+        # A .pot file doesn't know which location each auto comment came
+        # from, so the comments of a message can only be carried over if
+        # none of its locations were extracted again. Extract the other
+        # files of every message that extracted files have or had until
+        # that's the case.
+        extracted = set(changed)
+        while True:
+            more = set()
+            for domain in domains:
+                keys = {
+                    _message_key(msg, ctxt)
+                    for _, (filename, lineno, msg, cmts, ctxt) in records[domain]
+                }
+                for message in previous[domain]:
+                    filenames = {filename for filename, lineno in message.locations}
+                    if filenames <= extracted:
+                        continue
+                    if filenames & extracted or (
+                        message.id and _message_key(message.id, message.context) in keys
+                    ):
+                        more.update(filenames - extracted)
+            if not more:
+                break
+            extracted.update(more)
+            more_files = match_files(
+                base_dir, more, domain_methods, options_map, exclude_dirs
+            )
+            more_records = extract_records(list(more_files))
+            for domain in domains:
+                records[domain].extend(more_records[domain])
+
+        for domain in domains:
+            records[domain].extend(_catalog_records(previous[domain], extracted))
+            # Put everything in the order a full extraction would have it
+            records[domain].sort(key=lambda record: record[0])
 
+    if cache is not None:
+        # Only a full extraction knows which entries are stale
+        cache.save(evict=not since)
+        print(
+            "Reused cached strings for %d of %d files." % (cache.hits, counts["tasks"])
+        )
+    if prefilter:
+        print(
+            "Pre-filter skipped %d of %d files."
+            % (counts["skipped"], counts["extracted"])
+        )
+
+    changed_domains = []
+    for domain in domains:
         catalog = Catalog(
             header_comment="",
             project=project,
@@ -117,27 +329,138 @@ def extract_command(
             msgid_bugs_address=msgid_bugs_address,
             charset="utf-8",
         )
-        extracted = extract_from_dir(
-            base_dir,
-            method_map=methods,
-            options_map=generate_options_map(),
-            keywords=keywords,
-            comment_tags=comment_tags,
-            callback=callback,
-        )
-
-        for filename, lineno, msg, cmts, ctxt in extracted:
+        for _, (filename, lineno, msg, cmts, ctxt) in records[domain]:
             catalog.add(
                 msg, None, [(filename, lineno)], auto_comments=cmts, context=ctxt
             )
 
-        with open(os.path.join(outputdir, "%s.pot" % domain), "wb") as fp:
-            write_po(fp, catalog, width=80)
+        fp = BytesIO()
+        write_po(fp, catalog, width=80)
+        domain_pot = os.path.join(outputdir, "%s.pot" % domain)
+        if _pot_unchanged(domain_pot, fp.getvalue()):
+            print("%s.pot is unchanged" % domain)
+            continue
 
-    print("Done")
+        atomic_write(domain_pot, fp.getvalue())
+        print("Wrote %s.pot" % domain)
+        changed_domains.append(domain)
 
+    end_phase("write")
+
+    if profiler is not None:
+        profiler.add_phase("total", time.perf_counter() - start)
+        if profile:
+            print(profiler.format_report(profile_top))
+        if profile_json:
+            profiler.write_json(profile_json, profile_top)
+
+    print("Done; %d of %d .pot files changed" % (len(changed_domains), len(domains)))
+    return changed_domains
+
+
+# Header lines in .pot files that change every time we extract
+VOLATILE_HEADERS_RE = re.compile(rb'^"POT-Creation-Date: [^\n]*\n', re.MULTILINE)
+
+
+def _pot_unchanged(path, data):
+    """Returns whether the .pot file at ``path`` already has ``data``
+
+    Volatile headers like ``POT-Creation-Date`` are ignored.
 
-def merge_command(create, backup, base_dir, domain_methods, languages):
+    """
+    try:
+        with open(path, "rb") as fp:
+            existing = fp.read()
+    except FileNotFoundError:
+        return False
+    return VOLATILE_HEADERS_RE.sub(b"", existing) == VOLATILE_HEADERS_RE.sub(b"", data)
+
+
+def _git_changed_files(base_dir, ref):
+    """Returns files under ``base_dir`` that changed since a git ref
+
+    This covers files that were modified, added or deleted since ``ref`` as
+    well as untracked files that aren't ignored.
+
+    :arg base_dir: directory in a git working tree
+    :arg ref: git ref to compare against
+
+    :returns: set of ``/`` separated paths relative to ``base_dir``
+
+    """
+    commands = [
+        ["git", "diff", "--name-only", "--no-renames", "--relative", "-z", ref, "--"],
+        ["git", "ls-files", "--others", "--exclude-standard", "-z"],
+    ]
+    changed = set()
+    for command in commands:
+        p = Popen(command, cwd=base_dir, stdout=PIPE, stderr=PIPE)
+        stdout, stderr = p.communicate()
+        if p.returncode != 0:
+            raise CommandError(
+                "%s failed: %s"
+                % (" ".join(command), stderr.decode("utf-8", "replace").strip())
+            )
+        changed.update(fn for fn in stdout.decode("utf-8").split("\0") if fn)
+    return changed
+
+
+def _message_key(msg, ctxt):
+    """Returns the key a message is stored under in a catalog"""
+    if isinstance(msg, (list, tuple)):
+        msg = msg[0]
+    return (msg, ctxt)
+
+
+def _catalog_records(catalog, exclude):
+    """Turns a catalog back into extraction records
+
+    This is the reverse of adding records to a catalog, but a catalog doesn't
+    know which location each auto comment came from, so all of a message's
+    comments end up with its first location that isn't excluded. That's only
+    what extraction would give if none of its locations are excluded.
+
+    :arg catalog: the catalog
+    :arg exclude: set of filenames to drop locations for
+
+    :returns: list of ``(sort key, (filename, lineno, msg, cmts, ctxt))``
+        tuples
+
+    """
+    records = []
+    for index, message in enumerate(catalog):
+        if not message.id:
+            # Skip the header
+            continue
+        comments = list(message.auto_comments)
+        for filename, lineno in message.locations:
+            if filename in exclude:
+                continue
+            records.append(
+                (
+                    (walk_order_key(filename), lineno or 0, index),
+                    (filename, lineno, message.id, comments, message.context),
+                )
+            )
+            comments = []
+    return records
+
+
+MERGE_ENGINES = ("gettext", "python")
+
+MERGE_MANIFEST = ".puente-merge.json"
+
+
+def merge_command(
+    create,
+    backup,
+    base_dir,
+    domain_methods,
+    languages,
+    jobs=1,
+    engine="gettext",
+    force=False,
+):
     """
     :arg create: whether or not to create directories if they don't
         exist
@@ -145,16 +468,30 @@ def merge_command(create, backup, base_dir, domain_methods, languages):
     :arg base_dir: BASE_DIR setting
     :arg domain_methods: DOMAIN_METHODS setting
     :arg languages: LANGUAGES setting
+    :arg jobs: number of locales to merge at the same time; 0 merges one
+        locale per CPU at a time. The python engine merges in worker
+        processes if this is more than 1.
+    :arg engine: "gettext" to merge with msginit, msgen and msgmerge or
+        "python" to merge with Babel
+    :arg force: whether to merge .po files even if neither they nor the .pot
+        file changed since they were last merged
 
     """
     locale_dir = os.path.join(base_dir, "locale")
 
-    # Verify existence of msginit and msgmerge
-    if not call(["which", "msginit"], stdout=PIPE) == 0:
-        raise CommandError("You do not have gettext installed.")
+    if engine not in MERGE_ENGINES:
+        raise CommandError(
+            "Unknown merge engine %r; use one of %s"
+            % (engine, ", ".join(MERGE_ENGINES))
+        )
+
+    if engine == "gettext":
+        # Verify existence of msginit and msgmerge
+        if not call(["which", "msginit"], stdout=PIPE) == 0:
+            raise CommandError("You do not have gettext installed.")
 
-    if not call(["which", "msgmerge"], stdout=PIPE) == 0:
-        raise CommandError("You do not have gettext installed.")
+        if not call(["which", "msgmerge"], stdout=PIPE) == 0:
+            raise CommandError("You do not have gettext installed.")
 
     if languages and isinstance(languages[0], (tuple, list)):
         # Django's LANGUAGES setting takes a value like:
@@ -174,67 +511,215 @@ def merge_command(create, backup, base_dir, domain_methods, languages):
             if not os.path.exists(d):
                 os.makedirs(d)
 
-    domains = domain_methods.keys()
+    # Each .pot file is read once and shared across all locales
+    domains = list(domain_methods.keys())
+    pot_data = {}
     for domain in domains:
-        print("Merging %s strings to each locale..." % domain)
         domain_pot = os.path.join(
             locale_dir, "templates", "LC_MESSAGES", "%s.pot" % domain
         )
         if not os.path.isfile(domain_pot):
             raise CommandError("Can not find %s.pot" % domain)
+        with open(domain_pot, "rb") as fp:
+            pot_data[domain] = fp.read()
 
-        for locale in os.listdir(locale_dir):
-            if (
-                not os.path.isdir(os.path.join(locale_dir, locale))
-                or locale.startswith(".")
-                or locale == "templates"
-            ):
-                continue
+    locales = _list_locales(locale_dir)
 
+    # Skip pairs whose .pot and .po files didn't change since they were last
+    # merged
+    manifest_settings = [engine]
+    if engine == "python":
+        manifest_settings.append(babel.__version__)
+    manifest = Manifest(os.path.join(locale_dir, MERGE_MANIFEST), manifest_settings)
+    pot_hashes = {}
+    to_merge = []
+    for domain in domains:
+        pot_hashes[domain] = manifest.hash_data(pot_data[domain])
+        for locale in locales:
             domain_po = os.path.join(
                 locale_dir, locale, "LC_MESSAGES", "%s.po" % domain
             )
+            if force or not manifest.is_unchanged(
+                "%s:%s" % (domain, locale), pot_hashes[domain], domain_po
+            ):
+                to_merge.append((domain, locale))
+
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    # Merging with Babel is pure Python, so several jobs only run in parallel
+    # in worker processes. Those parse the .pot files themselves.
+    in_processes = engine == "python" and jobs > 1 and len(to_merge) > 1
 
-            if not os.path.isfile(domain_po):
-                print(" Can not find (%s).  Creating..." % domain_po)
-                p1 = Popen(
-                    [
-                        "msginit",
-                        "--no-translator",
-                        "--locale=%s" % locale,
-                        "--input=%s" % domain_pot,
-                        "--output-file=%s" % domain_po,
-                        "--width=200",
-                    ]
+    # The python engine parses each .pot file once, too. en_US gets a
+    # template with English translations that is also only created once.
+    templates = {}
+    for domain in distinct(domain for domain, locale in to_merge):
+        if in_processes:
+            templates[domain] = pot_data[domain]
+        elif engine == "python":
+            templates[domain] = read_po(BytesIO(pot_data[domain]))
+            if (domain, "en_US") in to_merge:
+                templates[(domain, "en_US")] = _msgen(templates[domain])
+        else:
+            templates[domain] = pot_data[domain]
+            if (domain, "en_US") in to_merge:
+                output = []
+                templates[(domain, "en_US")] = _run(
+                    ["msgen", "-"], output, input=pot_data[domain], capture=True
+                )
+                for line in output:
+                    print(line)
+
+    # With the gettext engine, the work happens in msginit and msgmerge, so
+    # threads are enough to run them in parallel. Workers collect their
+    # output and it's printed here in the same order merging one locale after
+    # another would print it.
+    if in_processes:
+        executor = ProcessPoolExecutor(
+            max_workers=min(jobs, len(to_merge)),
+            initializer=_init_python_merge,
+            initargs=(templates,),
+        )
+    else:
+        executor = ThreadPoolExecutor(max_workers=max(1, jobs))
+    with executor:
+        futures = {}
+        for domain, locale in to_merge:
+            if in_processes:
+                futures[(domain, locale)] = executor.submit(
+                    _merge_locale_python_job, locale_dir, domain, locale, backup
                 )
-                p1.communicate()
-
-            print("Merging %s.po for %s" % (domain, locale))
-            with open(domain_pot) as domain_pot_file:
-                if locale == "en_US":
-                    # Create an English translation catalog, then merge
-                    with TemporaryFile("w+t") as enmerged:
-                        p2 = Popen(
-                            ["msgen", "-"], stdin=domain_pot_file, stdout=enmerged
-                        )
-                        p2.communicate()
-                        _msgmerge(domain_po, enmerged, backup)
-                else:
-                    _msgmerge(domain_po, domain_pot_file, backup)
-
-        print("Domain %s finished" % domain)
+                continue
+            template = templates.get((domain, locale), templates[domain])
+            merge = _merge_locale_python if engine == "python" else _merge_locale
+            futures[(domain, locale)] = executor.submit(
+                merge, locale_dir, domain, locale, template, backup
+            )
+
+        try:
+            for domain in domains:
+                print("Merging %s strings to each locale..." % domain)
+                for locale in locales:
+                    if (domain, locale) not in futures:
+                        continue
+                    for line in futures[(domain, locale)].result():
+                        print(line)
+                    domain_po = os.path.join(
+                        locale_dir, locale, "LC_MESSAGES", "%s.po" % domain
+                    )
+                    manifest.set(
+                        "%s:%s" % (domain, locale), pot_hashes[domain], domain_po
+                    )
+                print("Domain %s finished" % domain)
+        except BaseException:
+            for future in futures.values():
+                future.cancel()
+            raise
+        finally:
+            # Keep what got merged even if something failed
+            manifest.save()
 
+    total = len(domains) * len(locales)
+    print(
+        "Merged %d of %d .po files; skipped %d that didn't change."
+        % (len(to_merge), total, total - len(to_merge))
+    )
     print("All finished")
 
 
-def _msgmerge(po_path, pot_file, backup):
+def _list_locales(locale_dir):
+    """Returns the names of the locale directories in ``locale_dir``"""
+    return [
+        locale
+        for locale in os.listdir(locale_dir)
+        if (
+            os.path.isdir(os.path.join(locale_dir, locale))
+            and not locale.startswith(".")
+            and locale != "templates"
+        )
+    ]
+
+
+def _merge_locale(locale_dir, domain, locale, template, backup):
+    """Merges the .pot file of a domain into the .po file of a locale
+
+    :arg locale_dir: the locale directory
+    :arg domain: the domain to merge
+    :arg locale: the locale to merge
+    :arg template: the contents of the .pot file as bytes; for en_US, with
+        English translations like ``msgen`` creates
+    :arg backup: whether or not to create backup .po files
+
+    :returns: list of lines of output
+
+    :raises CommandError: if msginit or msgmerge fail
+
+    """
+    output = []
+    domain_pot = os.path.join(locale_dir, "templates", "LC_MESSAGES", "%s.pot" % domain)
+    domain_po = os.path.join(locale_dir, locale, "LC_MESSAGES", "%s.po" % domain)
+
+    if not os.path.isfile(domain_po):
+        output.append(" Can not find (%s).  Creating..." % domain_po)
+        _run(
+            [
+                "msginit",
+                "--no-translator",
+                "--locale=%s" % locale,
+                "--input=%s" % domain_pot,
+                "--output-file=%s" % domain_po,
+                "--width=200",
+            ],
+            output,
+        )
+
+    output.append("Merging %s.po for %s" % (domain, locale))
+    _msgmerge(domain_po, template, backup, output)
+    return output
+
+
+def _run(command, output, input=None, capture=False):
+    """Runs a command and collects what it prints
+
+    :arg command: the command to run as a list
+    :arg output: list to add the lines the command prints to
+    :arg input: optional bytes to write to the command's stdin
+    :arg capture: whether to return stdout instead of adding it to
+        ``output`` along with stderr
+
+    :returns: what the command wrote to stdout as bytes if ``capture`` is
+        True
+
+    :raises CommandError: if the command exits with a non-zero status
+
+    """
+    p = Popen(
+        command,
+        stdin=None if input is None else PIPE,
+        stdout=PIPE,
+        stderr=PIPE if capture else STDOUT,
+    )
+    stdout_data, stderr_data = p.communicate(input)
+    printed = (stderr_data if capture else stdout_data) or b""
+    lines = printed.decode("utf-8", "replace").splitlines()
+    output.extend(lines)
+    if p.returncode != 0:
+        raise CommandError(
+            "%s failed with exit status %d:\n%s"
+            % (" ".join(command), p.returncode, "\n".join(lines))
+        )
+    if capture:
+        return stdout_data
+
+
+def _msgmerge(po_path, pot_data, backup, output):
     """Merge an existing .po file with new translations.
 
     :arg po_path: path to the .po file
-    :arg pot_file: a file-like object for the related templates
+    :arg pot_data: the contents of the related templates as bytes
     :arg backup: whether or not to create backup .po files
+    :arg output: list to add the lines msgmerge prints to
     """
-    pot_file.seek(0)
     command = [
         "msgmerge",
         "--update",
@@ -243,5 +728,317 @@ def _msgmerge(po_path, pot_file, backup):
         po_path,
         "-",
     ]
-    p3 = Popen(command, stdin=pot_file)
-    p3.communicate()
+    _run(command, output, input=pot_data)
+
+
+def _msgen(template):
+    """Returns a copy of a template catalog with English translations
+
+    Like ``msgen``, this sets the translation of every message to its msgid.
+
+    :arg template: the template :py:class:`babel.messages.catalog.Catalog`
+
+    """
+    catalog = copy.deepcopy(template)
+    for message in catalog:
+        if message.id:
+            message.string = (
+                message.id if isinstance(message.id, str) else tuple(message.id)
+            )
+    return catalog
+
+
+def _merge_locale_python(locale_dir, domain, locale, template, backup):
+    """Merges a template catalog into the .po file of a locale with Babel
+
+    This does what ``msginit`` and ``msgmerge --update`` do: it creates the
+    .po file if it doesn't exist, updates messages from the template, marks
+    messages that changed a little as fuzzy and keeps messages that are no
+    longer in the template as obsolete. The .po file is only written if it
+    changed.
+
+    :arg locale_dir: the locale directory
+    :arg domain: the domain to merge
+    :arg locale: the locale to merge
+    :arg template: the :py:class:`babel.messages.catalog.Catalog` to merge;
+        it is not changed, so it can be shared between locales
+    :arg backup: whether or not to create backup .po files
+
+    :returns: list of lines of output
+
+    """
+    output = []
+    domain_po = os.path.join(locale_dir, locale, "LC_MESSAGES", "%s.po" % domain)
+
+    if os.path.isfile(domain_po):
+        with open(domain_po, "rb") as fp:
+            old_data = fp.read()
+        catalog = read_po(BytesIO(old_data))
+    else:
+        output.append(" Can not find (%s).  Creating..." % domain_po)
+        old_data = None
+        catalog = Catalog(
+            locale=locale,
+            domain=domain,
+            header_comment=template.header_comment,
+            project=template.project,
+            version=template.version,
+            copyright_holder=template.copyright_holder,
+            msgid_bugs_address=template.msgid_bugs_address,
+            fuzzy=False,
+        )
+
+    output.append("Merging %s.po for %s" % (domain, locale))
+    update_catalog(catalog, template)
+
+    buf = BytesIO()
+    write_po(buf, catalog, width=200)
+    data = buf.getvalue()
+    if data != old_data:
+        if backup and old_data is not None:
+            atomic_write(domain_po + "~", old_data)
+        atomic_write(domain_po, data)
+    return output
+
+
+# .pot file data and parsed templates of a worker process of the python
+# merge engine
+_python_merge_pot_data = {}
+_python_merge_templates = {}
+
+
+def _init_python_merge(pot_data):
+    """Initializes a worker process of the python merge engine
+
+    :arg pot_data: dict of domain -> contents of its .pot file
+
+    """
+    _python_merge_pot_data.clear()
+    _python_merge_pot_data.update(pot_data)
+    _python_merge_templates.clear()
+
+
+def _merge_locale_python_job(locale_dir, domain, locale, backup):
+    """Runs :py:func:`_merge_locale_python` in a worker process
+
+    Each worker parses a .pot file the first time it merges its domain and
+    reuses it for every other locale.
+
+    """
+    if domain not in _python_merge_templates:
+        _python_merge_templates[domain] = read_po(
+            BytesIO(_python_merge_pot_data[domain])
+        )
+    template = _python_merge_templates[domain]
+    if locale == "en_US":
+        if (domain, locale) not in _python_merge_templates:
+            _python_merge_templates[(domain, locale)] = _msgen(template)
+        template = _python_merge_templates[(domain, locale)]
+    return _merge_locale_python(locale_dir, domain, locale, template, backup)
+
+
+COMPILE_MANIFEST = ".puente-compile.json"
+
+
+def compile_command(
+    base_dir, domain_methods, jobs=1, use_fuzzy=False, force=False, store=False
+):
+    """Compiles .po files into .mo files
+
+    A .po file is only compiled if it's newer than its .mo file, if it
+    changed since it was last compiled or if the .mo file changed or is
+    missing.
+
+    :arg base_dir: BASE_DIR setting
+    :arg domain_methods: DOMAIN_METHODS setting
+    :arg jobs: number of processes to compile with; 1 compiles in this
+        process and 0 uses one process per CPU
+    :arg use_fuzzy: whether or not to include fuzzy translations
+    :arg force: whether to compile .po files even if their .mo files are up
+        to date
+    :arg store: whether to also write catalog stores next to the .mo files;
+        see :py:mod:`puente.store`
+
+    :returns: list of paths of the .mo files that were compiled
+
+    """
+    locale_dir = os.path.join(base_dir, "locale")
+    if not os.path.isdir(locale_dir):
+        raise CommandError("Can not find %s" % locale_dir)
+
+    manifest = Manifest(
+        os.path.join(locale_dir, COMPILE_MANIFEST),
+        ["babel", babel.__version__, use_fuzzy]
+        + (["store", STORE_FORMAT_VERSION] if store else []),
+    )
+    total = 0
+    tasks = []
+    for locale in sorted(_list_locales(locale_dir)):
+        for domain in domain_methods.keys():
+            po_path = os.path.join(locale_dir, locale, "LC_MESSAGES", "%s.po" % domain)
+            if not os.path.isfile(po_path):
+                continue
+            total += 1
+            mo_path = po_path[:-3] + ".mo"
+            name = "%s:%s" % (domain, locale)
+            with open(po_path, "rb") as fp:
+                po_hash = manifest.hash_data(fp.read())
+            if (
+                force
+                or _is_newer(po_path, mo_path)
+                or (store and _is_newer(po_path, mo_path[:-3] + STORE_SUFFIX))
+                or not manifest.is_unchanged(name, po_hash, mo_path)
+            ):
+                tasks.append((name, po_path, mo_path, po_hash))
+
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    func = partial(_compile_catalog, use_fuzzy=use_fuzzy, store=store)
+    paths = [(po_path, mo_path) for name, po_path, mo_path, po_hash in tasks]
+    compiled = []
+
+    def record(results):
+        for (name, po_path, mo_path, po_hash), count in zip(tasks, results):
+            print(
+                "Compiled %s (%d messages)"
+                % (os.path.relpath(mo_path, base_dir), count)
+            )
+            manifest.set(name, po_hash, mo_path)
+            compiled.append(mo_path)
+
+    try:
+        if jobs <= 1 or len(tasks) <= 1:
+            record(map(func, paths))
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                chunksize = max(1, len(paths) // (jobs * 4))
+                record(pool.map(func, paths, chunksize=chunksize))
+    finally:
+        # Keep what got compiled even if something failed
+        manifest.save()
+
+    print(
+        "Compiled %d of %d .mo files; skipped %d that didn't change."
+        % (len(compiled), total, total - len(compiled))
+    )
+    return compiled
+
+
+def _is_newer(path, other_path):
+    """Returns whether ``path`` was modified after ``other_path``
+
+    If ``other_path`` doesn't exist, ``path`` counts as newer.
+
+    """
+    try:
+        return os.path.getmtime(path) > os.path.getmtime(other_path)
+    except FileNotFoundError:
+        return True
+
+
+def _compile_catalog(paths, use_fuzzy, store=False):
+    """Compiles a .po file into a .mo file
+
+    :arg paths: ``(po_path, mo_path)`` tuple
+    :arg use_fuzzy: whether or not to include fuzzy translations
+    :arg store: whether to also write a catalog store next to the .mo file
+
+    :returns: number of translated messages in the .mo file
+
+    :raises CommandError: if the .po file can't be compiled
+
+    """
+    po_path, mo_path = paths
+    try:
+        with open(po_path, "rb") as fp:
+            catalog = read_po(fp)
+        buf = BytesIO()
+        write_mo(buf, catalog, use_fuzzy=use_fuzzy)
+        if store:
+            store_buf = BytesIO()
+            write_store(store_buf, catalog, use_fuzzy=use_fuzzy)
+    except Exception as exc:
+        raise CommandError("Can not compile %s: %s" % (po_path, exc))
+    atomic_write(mo_path, buf.getvalue())
+    if store:
+        atomic_write(mo_path[:-3] + STORE_SUFFIX, store_buf.getvalue())
+    return sum(
+        1
+        for message in list(catalog)[1:]
+        if message.string and (use_fuzzy or not message.fuzzy)
+    )
+
+
+def warmup_command(languages=None):
+    """Loads catalogs and compiles templates and reports how long it took
+
+    :arg languages: list of language codes; defaults to the ``LANGUAGES``
+        setting
+
+    :returns: the results of :py:func:`puente.warmup.warmup`
+
+    """
+    engine = find_jinja2_engine()
+    if engine is None:
+        print("No Jinja2 backend in TEMPLATES; only loading catalogs.")
+    elif engine.env.bytecode_cache is None:
+        print(
+            "The Jinja2 environment has no bytecode cache; templates are only "
+            "compiled for this process."
+        )
+
+    results = warmup(languages, engine)
+    for name, error in results["errors"]:
+        print("Can not compile %s: %s" % (name, error))
+
+    timings = results["timings"]
+    print(
+        "Loaded catalogs for %d languages in %.2fs"
+        % (len(results["languages"]), timings["catalogs"])
+    )
+    if engine is not None:
+        print(
+            "Found %d templates in %.2fs"
+            % (len(results["templates"]), timings["discovery"])
+        )
+        print(
+            "Compiled %d templates in %.2fs"
+            % (
+                len(results["templates"]) - len(results["errors"]),
+                timings["templates"],
+            )
+        )
+    return results
+
+
+def untranslated_report_command(paths, locale=None, top=50):
+    """Prints the strings that rendered untranslated most often
+
+    :arg paths: paths of the dumps to merge
+    :arg locale: only report strings for this locale
+    :arg top: number of strings to report; 0 reports all of them
+
+    :returns: list of ``((locale, context, msgid), estimated count)`` tuples
+        that were reported
+
+    """
+    if not paths:
+        raise CommandError("No dumps of untranslated strings to report on")
+
+    counts = read_dumps(paths)
+    if locale is not None:
+        counts = Counter(
+            {key: count for key, count in counts.items() if key[0] == locale}
+        )
+    ranked = counts.most_common(top or None)
+
+    print(
+        "Untranslated strings from %d dumps; counts are estimated from samples"
+        % len(paths)
+    )
+    for (language, context, msgid), count in ranked:
+        if context is not None:
+            msgid = "%s [%s]" % (msgid, context)
+        print("%10d  %-8s  %s" % (round(count), language, msgid))
+    return ranked
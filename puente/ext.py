@@ -1,21 +1,105 @@
+import re
+import threading
+import weakref
+from functools import lru_cache
+
+from django.core.signals import setting_changed
+from django.utils.autoreload import file_changed
 from django.utils.translation import (
+    get_language,
+    trans_real,
+    gettext as gettext_real,
+    override,
     pgettext as pgettext_real,
     npgettext as npgettext_real,
 )
 
+from jinja2 import nodes
 from jinja2.ext import InternationalizationExtension
+from jinja2.lexer import (
+    Token,
+    TOKEN_DATA,
+    TOKEN_LPAREN,
+    TOKEN_NAME,
+    TOKEN_RPAREN,
+    TOKEN_STRING,
+    TOKEN_VARIABLE_BEGIN,
+    TOKEN_VARIABLE_END,
+)
 from jinja2.utils import pass_context
 from markupsafe import Markup
 
+from puente.bccache import PuenteBytecodeCache
+from puente.instrumentation import instrument, record_cache_miss
+from puente.language import bind_language, get_language as get_render_language
+from puente.settings import get_template_setting
+from puente.untranslated import get_tracker, track
 from puente.utils import collapse_whitespace
 
+_PLACEHOLDER_RE = re.compile(r"%\(([^()]*)\)s|%%")
+
+
+@lru_cache(maxsize=4096)
+def _compile_format(text):
+    """Turns a format string with named placeholders into a positional one
+
+    :arg text: the format string
+
+    :returns: ``(fmt, names)`` where ``fmt % values`` with a tuple of
+        the values of ``names`` does what ``text % variables`` does, or None
+        if ``text`` uses anything but ``%(name)s`` and ``%%``
+
+    """
+    parts = []
+    names = []
+    pos = 0
+    for match in _PLACEHOLDER_RE.finditer(text):
+        if "%" in text[pos : match.start()]:
+            return None
+        parts.append(text[pos : match.start()])
+        if match.group(1) is None:
+            parts.append("%%")
+        else:
+            parts.append("%s")
+            names.append(match.group(1))
+        pos = match.end()
+    if "%" in text[pos:]:
+        return None
+    parts.append(text[pos:])
+    return "".join(parts), tuple(names)
+
+
+def interpolate(rv, variables):
+    """Returns ``rv % variables`` for a translation
+
+    Translations without placeholders are returned as they are. Ones that
+    only use ``%(name)s`` placeholders are parsed once and filled in from a
+    tuple of values. Values are escaped if ``rv`` is ``Markup`` just like
+    ``Markup.__mod__`` escapes them.
+
+    :arg rv: the translation; a ``str`` or ``Markup``
+    :arg variables: dict of values for the placeholders
+
+    """
+    if "%" not in rv:
+        return rv
+    compiled = _compile_format(rv)
+    if compiled is None:
+        return rv % variables
+
+    fmt, names = compiled
+    if isinstance(rv, Markup):
+        escape = rv.escape
+        return rv.__class__(fmt % tuple([escape(variables[name]) for name in names]))
+    return fmt % tuple([variables[name] for name in names])
+
 
 @pass_context
 def pgettext(__context, context, message, **variables):
     rv = pgettext_real(context, message)
     if __context.eval_ctx.autoescape:
         rv = Markup(rv)
-    return rv % variables
+    return interpolate(rv, variables)
 
 
 @pass_context
@@ -24,7 +108,202 @@ def npgettext(__context, context, singular, plural, number, **variables):
     rv = npgettext_real(context, singular, plural, number)
     if __context.eval_ctx.autoescape:
         rv = Markup(rv)
-    return rv % variables
+    return interpolate(rv, variables)
+
+
+# Plural functions of each translation object; see _plural_functions()
+_translation_plurals = weakref.WeakKeyDictionary()
+
+
+def _plural_functions(language):
+    """Returns the functions that can pick the plural form of a message in a
+    language
+
+    Django merges catalogs with different plural equations and falls back
+    to the catalog of ``LANGUAGE_CODE`` and then to English, so which one
+    picks the form depends on the message.
+
+    """
+    if language is None:
+        return ()
+    translation = trans_real.translation(language)
+    try:
+        return _translation_plurals[translation]
+    except KeyError:
+        pass
+    plurals = []
+    current = translation
+    while current is not None:
+        catalog = getattr(current, "_catalog", None)
+        plurals.extend(
+            getattr(catalog, "_plurals", None) or [getattr(current, "plural", None)]
+        )
+        current = getattr(current, "_fallback", None)
+    plurals = tuple(plural for plural in plurals if plural is not None)
+    _translation_plurals[translation] = plurals
+    return plurals
+
+
+class _PluralKey:
+    """Number that's equal to any number with the same plural forms
+
+    It keys the :py:class:`TranslationCache` by plural form, not number,
+    while the number that missed the cache is still there for the lookup.
+
+    """
+
+    __slots__ = ("number", "forms")
+
+    def __init__(self, number, forms):
+        self.number = number
+        self.forms = forms
+
+    def __hash__(self):
+        return hash(self.forms)
+
+    def __eq__(self, other):
+        return isinstance(other, _PluralKey) and self.forms == other.forms
+
+
+class TranslationCache:
+    """Bounded LRU cache of translations for ``pgettext`` and ``npgettext``
+
+    Translations are cached by the function that translates them, the active
+    language, the context, the message, the plural message and, for Django's
+    ``npgettext``, the plural form the number picks, otherwise the number,
+    along with whether they were marked up as safe for autoescaping. Hits
+    skip the catalog lookups and the ``Markup`` wrapping.
+
+    The cache is safe to use from several threads. It's cleared when Django
+    reloads catalogs because a ``.mo`` file changed or because a setting
+    that affects translations changed.
+
+    :arg maxsize: the number of translations to keep
+
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._lookup = lru_cache(maxsize=maxsize)(self._translate)
+
+    @staticmethod
+    def _translate(func, language, context, singular, plural, number, autoescape):
+        # The language is part of the key, but func looks up the active one
+        # which is the same
+        record_cache_miss()
+        if isinstance(number, _PluralKey):
+            number = number.number
+        if plural is None:
+            rv = func(context, singular)
+        else:
+            rv = func(context, singular, plural, number)
+        if autoescape:
+            rv = Markup(rv)
+        return rv
+
+    def pgettext(self, context, message, autoescape, func=pgettext_real):
+        """Returns the translation of a message with a context
+
+        :arg func: the ``pgettext`` function to translate with
+
+        """
+        return self._lookup(
+            func, get_language(), context, message, None, None, autoescape
+        )
+
+    def npgettext(
+        self, context, singular, plural, number, autoescape, func=npgettext_real
+    ):
+        """Returns the translation of a plural message with a context
+
+        :arg func: the ``npgettext`` function to translate with
+
+        """
+        language = get_language()
+        try:
+            if func is npgettext_real:
+                forms = tuple(
+                    plural_function(number)
+                    for plural_function in _plural_functions(language)
+                )
+                number = _PluralKey(number, forms + (number == 1,))
+            return self._lookup(
+                func, language, context, singular, plural, number, autoescape
+            )
+        except (TypeError, ValueError):
+            # number isn't an integer or not hashable, so it can't be cached
+            return self._translate(
+                func, None, context, singular, plural, number, autoescape
+            )
+
+    @property
+    def hits(self):
+        return self._lookup.cache_info().hits
+
+    @property
+    def misses(self):
+        return self._lookup.cache_info().misses
+
+    def clear(self):
+        """Drops all translations and resets the counters"""
+        self._lookup.cache_clear()
+
+
+#: The :py:class:`TranslationCache` the ``pgettext`` and ``npgettext``
+#: template globals use if ``TRANSLATION_CACHE_SIZE`` is set
+translation_cache = None
+
+
+def _clear_translation_cache(**kwargs):
+    if translation_cache is not None:
+        translation_cache.clear()
+
+
+def _translation_file_changed(sender, file_path, **kwargs):
+    # Django reloads catalogs when a .mo file changes; see
+    # django.utils.translation.reloader
+    if file_path.suffix == ".mo":
+        _clear_translation_cache()
+        _clear_translated_templates()
+
+
+def _translation_setting_changed(setting, **kwargs):
+    if setting in ("LANGUAGES", "LANGUAGE_CODE", "LOCALE_PATHS", "PUENTE"):
+        _clear_translation_cache()
+        _clear_translated_templates()
+
+
+file_changed.connect(_translation_file_changed)
+setting_changed.connect(_translation_setting_changed)
+
+
+def _make_cached_pgettext(func):
+    @pass_context
+    def pgettext(__context, context, message, **variables):
+        rv = translation_cache.pgettext(
+            context, message, __context.eval_ctx.autoescape, func
+        )
+        return interpolate(rv, variables)
+
+    pgettext.puente_cached = True
+    return pgettext
+
+
+def _make_cached_npgettext(func):
+    @pass_context
+    def npgettext(__context, context, singular, plural, number, **variables):
+        variables.setdefault("num", number)
+        rv = translation_cache.npgettext(
+            context, singular, plural, number, __context.eval_ctx.autoescape, func
+        )
+        return interpolate(rv, variables)
+
+    npgettext.puente_cached = True
+    return npgettext
+
+
+cached_pgettext = _make_cached_pgettext(pgettext_real)
+cached_npgettext = _make_cached_npgettext(npgettext_real)
 
 
 class PuenteI18nExtension(InternationalizationExtension):
@@ -35,12 +314,86 @@ class PuenteI18nExtension(InternationalizationExtension):
     trans atags so msgids don't change when we cahnge indentation in
     Jinja2 templates.
 
+    If the ``TRANSLATION_CACHE_SIZE`` setting is set, the ``pgettext`` and
+    ``npgettext`` globals cache translations in a :py:class:`TranslationCache`.
+    That's also the case after installing newstyle gettext translations.
+
+    If the ``INSTRUMENTATION`` setting is on, the gettext globals are wrapped
+    so :py:func:`puente.instrumentation.collect` can count and time them. If
+    ``UNTRANSLATED_SAMPLE_RATE`` is set, they're wrapped so a sample of the
+    strings that render untranslated is counted; see
+    :py:mod:`puente.untranslated`.
+
+    In async environments, the gettext globals translate into the language of
+    the :py:func:`puente.language.override` block the render runs in, so
+    concurrent renders on one event loop don't use each other's languages.
+
     """
 
     def __init__(self, environment):
         super(PuenteI18nExtension, self).__init__(environment)
         environment.globals["pgettext"] = pgettext
         environment.globals["npgettext"] = npgettext
+        self._install_translation_cache()
+        self._track_untranslated()
+        self._instrument_globals()
+        self._bind_language()
+
+    def _install_callables(
+        self, gettext, ngettext, newstyle=None, pgettext=None, npgettext=None
+    ):
+        super(PuenteI18nExtension, self)._install_callables(
+            gettext, ngettext, newstyle=newstyle, pgettext=pgettext, npgettext=npgettext
+        )
+        if self.environment.newstyle_gettext and pgettext and npgettext:
+            self._install_translation_cache(pgettext, npgettext)
+        self._track_untranslated()
+        self._instrument_globals()
+        self._bind_language()
+
+    def _bind_language(self):
+        # is_async isn't set yet while the environment loads its extensions,
+        # so async environments are bound once translations are installed
+        if not getattr(self.environment, "is_async", False):
+            return
+        for name in ("gettext", "ngettext", "pgettext", "npgettext"):
+            func = self.environment.globals.get(name)
+            if func is not None:
+                self.environment.globals[name] = bind_language(func)
+
+    def _track_untranslated(self):
+        tracker = get_tracker()
+        if tracker is None:
+            return
+        for name in ("gettext", "ngettext", "pgettext", "npgettext"):
+            func = self.environment.globals.get(name)
+            if func is not None:
+                self.environment.globals[name] = track(name, func, tracker)
+
+    def _instrument_globals(self):
+        if not get_template_setting("INSTRUMENTATION"):
+            return
+        for name in ("gettext", "ngettext", "pgettext", "npgettext"):
+            func = self.environment.globals.get(name)
+            if func is not None:
+                self.environment.globals[name] = instrument(
+                    name, func, cached=getattr(func, "puente_cached", False)
+                )
+
+    def _install_translation_cache(self, pgettext=None, npgettext=None):
+        global translation_cache
+
+        cache_size = get_template_setting("TRANSLATION_CACHE_SIZE")
+        if not cache_size:
+            return
+        if translation_cache is None or translation_cache.maxsize != cache_size:
+            translation_cache = TranslationCache(cache_size)
+        if pgettext in (None, pgettext_real) and npgettext in (None, npgettext_real):
+            self.environment.globals["pgettext"] = cached_pgettext
+            self.environment.globals["npgettext"] = cached_npgettext
+        else:
+            self.environment.globals["pgettext"] = _make_cached_pgettext(pgettext)
+            self.environment.globals["npgettext"] = _make_cached_npgettext(npgettext)
 
     def _parse_block(self, parser, allow_pluralize):
         parse_block = InternationalizationExtension._parse_block
@@ -48,4 +401,155 @@ class PuenteI18nExtension(InternationalizationExtension):
         return ref, collapse_whitespace(buffer)
 
 
+# Environments get_translated_environment() created; their templates have
+# translations compiled in, so they're dropped when catalogs change
+_translated_environments = weakref.WeakSet()
+_translated_environments_lock = threading.Lock()
+
+
+def _clear_translated_templates():
+    for environment in list(_translated_environments):
+        environment.puente_catalog_key = None
+        if environment.cache is not None:
+            environment.cache.clear()
+
+
+def get_translated_environment(environment, language=None):
+    """Returns an environment that translates templates at compile time
+
+    The environment is an overlay of ``environment`` that compiles static
+    trans blocks and ``{{ _("...") }}`` calls into constant output for
+    ``language``. There's one overlay per language and each has its own
+    template cache, so every template is compiled once per language.
+
+    ``environment`` must have the ``puente.ext.static_i18n`` extension.
+    Overlays only use the bytecode cache of ``environment`` if it's a
+    :py:class:`puente.bccache.PuenteBytecodeCache` since other bytecode
+    caches don't know about languages.
+
+    :arg environment: the Jinja2 environment
+    :arg language: the language to translate to; defaults to
+        :py:func:`puente.language.get_language`
+
+    :returns: the overlay environment
+
+    """
+    if getattr(environment, "puente_language", False) is False:
+        raise ValueError("environment doesn't have the static_i18n extension")
+
+    language = language or get_render_language()
+    # Only building an overlay takes the lock; renders only read the dict
+    translated = environment.puente_translated_environments.get(language)
+    if translated is not None:
+        return translated
+    with _translated_environments_lock:
+        translated = environment.puente_translated_environments.get(language)
+        if translated is None:
+            if environment.cache is None:
+                cache_size = 0
+            elif isinstance(environment.cache, dict):
+                cache_size = -1
+            else:
+                cache_size = environment.cache.capacity
+            bytecode_cache = environment.bytecode_cache
+            if not isinstance(bytecode_cache, PuenteBytecodeCache):
+                bytecode_cache = None
+            translated = environment.overlay(
+                cache_size=cache_size, bytecode_cache=bytecode_cache
+            )
+            translated.puente_language = language
+            _translated_environments.add(translated)
+            environment.puente_translated_environments[language] = translated
+    return translated
+
+
+class PuenteStaticI18nExtension(PuenteI18nExtension):
+    """Translates static strings when templates are compiled
+
+    Behaves like :py:class:`PuenteI18nExtension` except in environments
+    returned by :py:func:`get_translated_environment`. There, trans blocks
+    without variables or plurals and ``{{ _("...") }}`` and
+    ``{{ gettext("...") }}`` with a single string literal are translated
+    while the template is compiled and rendered as constant output.
+
+    ``{{ _("...") }}`` is only translated with newstyle gettext since old
+    style gettext doesn't mark translations safe.
+
+    """
+
+    def __init__(self, environment):
+        super(PuenteStaticI18nExtension, self).__init__(environment)
+        environment.extend(
+            puente_language=None,
+            puente_translated_environments={},
+            puente_catalog_key=None,
+        )
+
+    def _translate(self, message, context=None):
+        with override(self.environment.puente_language):
+            if context is not None:
+                return pgettext_real(context, message)
+            return gettext_real(message)
+
+    def filter_stream(self, stream):
+        if self.environment.puente_language is None or not getattr(
+            self.environment, "newstyle_gettext", False
+        ):
+            return stream
+        return self._translate_calls(list(stream))
+
+    def _translate_calls(self, tokens):
+        pattern = (
+            TOKEN_VARIABLE_BEGIN,
+            TOKEN_NAME,
+            TOKEN_LPAREN,
+            TOKEN_STRING,
+            TOKEN_RPAREN,
+            TOKEN_VARIABLE_END,
+        )
+        i = 0
+        while i < len(tokens):
+            window = tokens[i : i + len(pattern)]
+            if tuple(token.type for token in window) == pattern and window[1].value in (
+                "_",
+                "gettext",
+            ):
+                # newstyle gettext formats the translation even without
+                # variables, which turns "%%" into "%"
+                text = self._translate(window[3].value) % {}
+                yield Token(window[0].lineno, TOKEN_DATA, text)
+                i += len(pattern)
+            else:
+                yield tokens[i]
+                i += 1
+
+    def _make_node(
+        self,
+        singular,
+        plural,
+        context,
+        variables,
+        plural_expr,
+        vars_referenced,
+        num_called_num,
+    ):
+        if self.environment.puente_language is None or plural or variables:
+            return super(PuenteStaticI18nExtension, self)._make_node(
+                singular,
+                plural,
+                context,
+                variables,
+                plural_expr,
+                vars_referenced,
+                num_called_num,
+            )
+
+        if getattr(self.environment, "newstyle_gettext", False):
+            text = self._translate(singular, context) % {}
+        else:
+            text = self._translate(singular.replace("%%", "%"), context)
+        return nodes.Output([nodes.TemplateData(text)])
+
+
 i18n = PuenteI18nExtension
+static_i18n = PuenteStaticI18nExtension
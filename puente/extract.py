@@ -1,24 +1,489 @@
-from jinja2.ext import babel_extract
+import json
+import mmap
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
+from babel.messages.extract import extract_from_file
+from jinja2 import Environment, defaults
+from jinja2.exceptions import TemplateSyntaxError
+from jinja2.ext import _CommentFinder, extract_from_ast
+from jinja2.utils import import_string
+
+from puente.ext import PuenteI18nExtension
 from puente.utils import monkeypatch_i18n
 
+# Map of options -> Jinja2 environment for extraction; see
+# _get_jinja2_environment
+_jinja2_environments = {}
+
+
+def _getbool(options, key, default=False):
+    return options.get(key, str(default)).lower() in {"1", "on", "yes", "true"}
+
+
+def _get_jinja2_environment(options):
+    """Returns the Jinja2 environment for extracting with these options
+
+    Builds the environment the same way Jinja2's ``babel_extract`` does, but
+    only once per distinct set of options.
+
+    """
+    key = json.dumps(options, sort_keys=True, default=repr)
+    try:
+        return _jinja2_environments[key]
+    except KeyError:
+        pass
+
+    # Must monkeypatch first to fix InternationalizationExtension
+    # stomping issues! See monkeypatch_i18n docstring for details.
+    monkeypatch_i18n()
+
+    extensions = {}
+    for extension_name in options.get("extensions", "").split(","):
+        extension_name = extension_name.strip()
+        if extension_name:
+            extensions[import_string(extension_name)] = None
+    if PuenteI18nExtension not in extensions:
+        extensions[PuenteI18nExtension] = None
+
+    environment = Environment(
+        options.get("block_start_string", defaults.BLOCK_START_STRING),
+        options.get("block_end_string", defaults.BLOCK_END_STRING),
+        options.get("variable_start_string", defaults.VARIABLE_START_STRING),
+        options.get("variable_end_string", defaults.VARIABLE_END_STRING),
+        options.get("comment_start_string", defaults.COMMENT_START_STRING),
+        options.get("comment_end_string", defaults.COMMENT_END_STRING),
+        options.get("line_statement_prefix") or defaults.LINE_STATEMENT_PREFIX,
+        options.get("line_comment_prefix") or defaults.LINE_COMMENT_PREFIX,
+        _getbool(options, "trim_blocks", defaults.TRIM_BLOCKS),
+        _getbool(options, "lstrip_blocks", defaults.LSTRIP_BLOCKS),
+        defaults.NEWLINE_SEQUENCE,
+        _getbool(options, "keep_trailing_newline", defaults.KEEP_TRAILING_NEWLINE),
+        tuple(extensions),
+        cache_size=0,
+        auto_reload=False,
+    )
+    if _getbool(options, "trimmed"):
+        environment.policies["ext.i18n.trimmed"] = True
+    if _getbool(options, "newstyle_gettext"):
+        environment.newstyle_gettext = True
+
+    _jinja2_environments[key] = environment
+    return environment
 
-def extract_from_jinja2(*args, **kwargs):
+
+def extract_from_jinja2(fileobj, keywords, comment_tags, options):
     """Just like Jinja2's Babel extractor, but fixes the i18n issue
 
     The Jinja2 Babel extractor appends the i18n extension to the list of
     extensions before extracting. Since Puente has its own i18n extension, this
-    creates problems. So we monkeypatch and then call Jinja2's Babel extractor.
+    creates problems. So we monkeypatch and then extract the same way Jinja2's
+    Babel extractor does.
+
+    Unlike Jinja2's Babel extractor, this builds the Jinja2 environment once
+    for each set of options and reuses it for every template rather than
+    building a new one for every template.
 
     .. Note::
 
-       You only need to use this if you're using Babel's pybabel extract. If
-       you're using Puente's extract command, then it does this already and you
-       can use the Jinja2 Babel extractor.
+       You only need to use this if you're using Babel's pybabel extract.
+       Puente's extract command uses it for the ``jinja2`` method already.
 
     """
-    # Must monkeypatch first to fix InternationalizationExtension
-    # stomping issues! See docstring for details.
-    monkeypatch_i18n()
+    environment = _get_jinja2_environment(options)
+    silent = _getbool(options, "silent", True)
+
+    source = fileobj.read().decode(options.get("encoding", "utf-8"))
+    try:
+        node = environment.parse(source)
+        tokens = list(environment.lex(environment.preprocess(source)))
+    except TemplateSyntaxError:
+        if not silent:
+            raise
+        # skip templates with syntax errors
+        return
+
+    finder = _CommentFinder(tokens, comment_tags)
+    for lineno, func, message in extract_from_ast(node, keywords):
+        yield lineno, func, message, finder.find_comments(lineno)
+
+
+def _relpath(path, start):
+    return os.path.relpath(path, start).replace(os.sep, "/")
+
+
+# See babel.util.pathmatch
+_PATTERN_SYMBOLS = {
+    "?": "[^/]",
+    "?/": "[^/]/",
+    "*": "[^/]+",
+    "*/": "[^/]+/",
+    "**/": "(?:.+/)*?",
+    "**": "(?:.+/)*?[^/]+",
+}
+
+
+def _strip_anchor(pattern):
+    if pattern.startswith("^"):
+        return pattern[1:]
+    if pattern.startswith("./"):
+        return pattern[2:]
+    return pattern
+
+
+def compile_pattern(pattern):
+    """Compiles an extended glob pattern
+
+    This matches the same paths Babel's ``pathmatch`` does for the pattern,
+    but only has to build the regular expression once.
+
+    :arg pattern: the glob pattern
+
+    :returns: a function that takes a ``/`` separated path and returns a
+        match object or None
+
+    """
+    buf = []
+    for idx, part in enumerate(re.split("([?*]+/?)", _strip_anchor(pattern))):
+        if idx % 2:
+            buf.append(_PATTERN_SYMBOLS[part])
+        elif part:
+            buf.append(re.escape(part))
+    return re.compile("^%s$" % "".join(buf)).match
+
+
+class FileMatcher:
+    """Decides which files and directories to extract strings from
+
+    This compiles the method maps, the options map and the directories to
+    exclude once up front.
+
+    Besides skipping directories the way Babel's ``extract_from_dir`` does,
+    this prunes directories that an ``ignore`` pattern ending in ``/**``
+    covers entirely, like ``('node_modules/**', 'ignore')``, as long as no
+    pattern earlier in the method map could match a file in there.
+
+    :arg domain_methods: dict of domain -> list of ``(pattern, method)``
+        tuples
+    :arg options_map: dict of pattern -> options dict
+    :arg exclude_dirs: list of patterns for directories to never descend into
+
+    """
+
+    def __init__(self, domain_methods, options_map, exclude_dirs=None):
+        self.domains = list(domain_methods.keys())
+        self.method_maps = {}
+        self.ignore_dirs = {}
+        self.prune_dirs = {}
+        for domain, methods in domain_methods.items():
+            self.method_maps[domain] = [
+                (compile_pattern(pattern), method) for pattern, method in methods
+            ]
+            self.ignore_dirs[domain] = [
+                compile_pattern(pattern)
+                for pattern, method in methods
+                if method == "ignore"
+            ]
+
+            # List of (match function for directories the pattern covers,
+            # literal prefixes of the patterns before it that could match
+            # files)
+            self.prune_dirs[domain] = []
+            prefixes = []
+            for pattern, method in methods:
+                if method != "ignore":
+                    prefixes.append(re.split(r"[?*]", _strip_anchor(pattern))[0])
+                elif pattern == "**":
+                    self.prune_dirs[domain].append((None, list(prefixes)))
+                elif pattern.endswith("/**"):
+                    self.prune_dirs[domain].append(
+                        (compile_pattern(pattern[:-3]), list(prefixes))
+                    )
+
+        self.options_map = [
+            (compile_pattern(pattern), options)
+            for pattern, options in options_map.items()
+        ]
+        self.exclude_dirs = [compile_pattern(pattern) for pattern in exclude_dirs or []]
+
+    def _prunes(self, domain, dir_rel):
+        prefix = dir_rel + "/"
+        for covers, earlier_prefixes in self.prune_dirs[domain]:
+            if covers is not None and not covers(dir_rel):
+                continue
+            # Patterns match from the start of the path, so a pattern can
+            # only match files in here if its literal prefix lines up with
+            # the directory
+            if not any(
+                prefix.startswith(other) or other.startswith(prefix)
+                for other in earlier_prefixes
+            ):
+                return True
+        return False
+
+    def dir_domains(self, dir_rel, domains):
+        """Returns which of ``domains`` descend into a directory
+
+        :arg dir_rel: ``/`` separated path of the directory relative to the
+            base directory
+        :arg domains: the domains that descended into the parent directory
+
+        """
+        if os.path.basename(dir_rel).startswith((".", "_")):
+            return []
+        if any(exclude(dir_rel) for exclude in self.exclude_dirs):
+            return []
+        return [
+            domain
+            for domain in domains
+            if not any(ignore(dir_rel) for ignore in self.ignore_dirs[domain])
+            and not self._prunes(domain, dir_rel)
+        ]
+
+    def match_file(self, filename, domains):
+        """Returns ``(options, methods)`` for a file or None if no domain wants it
+
+        :arg filename: ``/`` separated path of the file relative to the base
+            directory
+        :arg domains: the domains that descended into the file's directory
+
+        """
+        methods = {}
+        for domain in domains:
+            for match, method in self.method_maps[domain]:
+                if match(filename):
+                    if method != "ignore":
+                        methods[domain] = method
+                    break
+        if not methods:
+            return None
+
+        options = {}
+        for match, odict in self.options_map:
+            if match(filename):
+                options = odict
+                break
+        return options, methods
+
+
+def walk_files(base_dir, domain_methods, options_map, exclude_dirs=None):
+    """Walks ``base_dir`` once and yields the files to extract strings from
+
+    This walks the tree in the same order as Babel's ``extract_from_dir``
+    does and applies the same first-match-wins semantics for each domain's
+    method map. See :py:class:`FileMatcher` for which directories get
+    skipped. A directory is only skipped if every domain would skip it.
+
+    :arg base_dir: the directory to walk
+    :arg domain_methods: dict of domain -> list of ``(pattern, method)``
+        tuples
+    :arg options_map: dict of pattern -> options dict
+    :arg exclude_dirs: list of patterns for directories to never descend into
+
+    :returns: generator of ``(filename, filepath, options, methods)`` tuples
+        where ``filename`` is relative to ``base_dir`` and ``methods`` is a
+        dict of domain -> method for every domain that wants this file;
+        files that no domain wants are skipped
+
+    """
+    base_dir = os.path.abspath(base_dir)
+    matcher = FileMatcher(domain_methods, options_map, exclude_dirs)
+
+    # Map of directory -> domains that haven't skipped it
+    active = {base_dir: matcher.domains}
+
+    for root, dirnames, filenames in os.walk(base_dir):
+        domains = active.pop(root)
+
+        keep = []
+        for subdir in dirnames:
+            dirpath = os.path.join(root, subdir)
+            subdir_domains = matcher.dir_domains(_relpath(dirpath, base_dir), domains)
+            if subdir_domains:
+                active[dirpath] = subdir_domains
+                keep.append(subdir)
+        dirnames[:] = sorted(keep)
+
+        for fn in sorted(filenames):
+            filepath = os.path.join(root, fn)
+            filename = _relpath(filepath, base_dir)
+            match = matcher.match_file(filename, domains)
+            if match is not None:
+                yield (filename, filepath) + match
+
+
+def walk_order_key(filename):
+    """Returns a sort key that sorts filenames in :py:func:`walk_files` order
+
+    In each directory, files come first sorted by name and then each
+    subdirectory sorted by name.
+
+    :arg filename: ``/`` separated path relative to the walked directory
+
+    """
+    parts = filename.split("/")
+    return [(1, part) for part in parts[:-1]] + [(0, parts[-1])]
+
+
+def match_files(base_dir, filenames, domain_methods, options_map, exclude_dirs=None):
+    """Like :py:func:`walk_files`, but only for the given files
+
+    Files that don't exist or that :py:func:`walk_files` would skip are
+    skipped.
+
+    :arg base_dir: the directory ``filenames`` are relative to
+    :arg filenames: iterable of ``/`` separated paths relative to
+        ``base_dir``
+    :arg domain_methods: dict of domain -> list of ``(pattern, method)``
+        tuples
+    :arg options_map: dict of pattern -> options dict
+    :arg exclude_dirs: list of patterns for directories to never descend into
+
+    :returns: generator of ``(filename, filepath, options, methods)`` tuples
+        in :py:func:`walk_files` order
+
+    """
+    base_dir = os.path.abspath(base_dir)
+    matcher = FileMatcher(domain_methods, options_map, exclude_dirs)
+
+    for filename in sorted(set(filenames), key=walk_order_key):
+        filepath = os.path.join(base_dir, *filename.split("/"))
+        if not os.path.isfile(filepath):
+            continue
+
+        domains = matcher.domains
+        parts = filename.split("/")
+        for i in range(1, len(parts)):
+            domains = matcher.dir_domains("/".join(parts[:i]), domains)
+
+        match = matcher.match_file(filename, domains)
+        if match is not None:
+            yield (filename, filepath) + match
+
+
+# Extraction methods the pre-filter knows how to rule files out for
+PREFILTER_METHODS = {
+    "python",
+    "jinja2",
+    "jinja2.ext:babel_extract",
+    "puente.extract:extract_from_jinja2",
+}
+
+
+def build_prefilter(keywords):
+    """Builds the pattern for ruling out files that have no strings
+
+    The pattern matches a call to any of the gettext keywords or the word
+    ``trans`` as in the Jinja2 trans tag. Files without a match can't have
+    any strings for the ``python`` and ``jinja2`` extraction methods.
+
+    :arg keywords: KEYWORDS setting
+
+    :returns: compiled bytes regular expression
+
+    """
+    keywords_re = b"|".join(
+        re.escape(name.encode("utf-8")) for name in sorted(keywords)
+    )
+    return re.compile(rb"\b(?:" + keywords_re + rb")\s*\(|\btrans\b")
+
+
+def might_have_strings(filepath, prefilter):
+    """Returns whether a file matches the pre-filter pattern
+
+    :arg filepath: the path of the file to check
+    :arg prefilter: pattern from :py:func:`build_prefilter`
+
+    """
+    with open(filepath, "rb") as fp:
+        try:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped and don't have strings anyhow
+            return False
+        with data:
+            return prefilter.search(data) is not None
+
+
+# Extraction methods that get swapped out for faster equivalents
+METHOD_ALIASES = {
+    "jinja2": "puente.extract:extract_from_jinja2",
+    "jinja2.ext:babel_extract": "puente.extract:extract_from_jinja2",
+}
+
+
+def extract_file(filepath, method, options, keywords, comment_tags, prefilter=None):
+    """Extracts messages from a single file
+
+    :arg prefilter: optional pattern from :py:func:`build_prefilter` to
+        rule out files that have no strings without parsing them
+
+    :returns: list of ``(lineno, msg, comments, context)`` tuples or None
+        if the pre-filter ruled the file out
+
+    """
+    if (
+        prefilter is not None
+        and method in PREFILTER_METHODS
+        and not might_have_strings(filepath, prefilter)
+    ):
+        return None
+
+    method = METHOD_ALIASES.get(method, method)
+    return list(
+        extract_from_file(
+            method,
+            filepath,
+            keywords=keywords,
+            comment_tags=comment_tags,
+            options=options,
+        )
+    )
+
+
+def _extract_task(task, keywords, comment_tags, prefilter):
+    filepath, method, options = task
+    start = time.perf_counter()
+    messages = extract_file(
+        filepath, method, options, keywords, comment_tags, prefilter
+    )
+    return messages, time.perf_counter() - start
+
+
+def extract_files(tasks, keywords, comment_tags, jobs=1, prefilter=None):
+    """Extracts messages from a list of files, possibly in parallel
+
+    :arg tasks: list of ``(filepath, method, options)`` tuples
+    :arg keywords: KEYWORDS setting
+    :arg comment_tags: COMMENT_TAGS setting
+    :arg jobs: number of worker processes to use; 1 extracts in this
+        process and 0 uses one process per CPU
+    :arg prefilter: optional pattern from :py:func:`build_prefilter`
+
+    :returns: iterator of ``(result, seconds)`` tuples in the same order as
+        ``tasks`` where ``result`` is what :py:func:`extract_file` returned and
+        ``seconds`` is how long that took
+
+    """
+    func = partial(
+        _extract_task,
+        keywords=keywords,
+        comment_tags=comment_tags,
+        prefilter=prefilter,
+    )
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    if jobs <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield func(task)
+        return
 
-    return babel_extract(*args, **kwargs)
+    # Workers need the monkeypatch, too, in case they weren't forked from a
+    # process that already has it applied.
+    with ProcessPoolExecutor(max_workers=jobs, initializer=monkeypatch_i18n) as pool:
+        chunksize = max(1, len(tasks) // (jobs * 4))
+        yield from pool.map(func, tasks, chunksize=chunksize)
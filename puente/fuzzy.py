@@ -0,0 +1,181 @@
+import difflib
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+
+from babel.messages import catalog as babel_catalog
+
+# Newer versions of Babel find fuzzy matches with their own copy of
+# difflib.get_close_matches that turns off SequenceMatcher's autojunk
+# heuristic, older ones with difflib's. The heuristic changes the ratios of
+# strings of 200 characters or more, so do whatever the installed Babel does.
+BABEL_AUTOJUNK = babel_catalog.get_close_matches is difflib.get_close_matches
+
+
+def _trigrams(text):
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class FuzzyIndex:
+    """Finds close matches for a string among many strings
+
+    This returns what ``get_close_matches(word, strings, 1, cutoff)`` of
+    Babel's ``Catalog.update`` would, but doesn't compare ``word`` with every
+    string. Strings are indexed
+    by the trigrams they contain and only a shortlist of the strings that
+    share the most trigrams with ``word`` are compared.
+
+    Strings shorter than ``SHORT`` characters have few trigrams, so they're
+    compared with every string whose length allows a close enough match
+    instead.
+
+    .. Note::
+
+       A string that shares none or only a few trigrams with a long ``word``
+       is never compared with it even if it would have been a close enough
+       match. This is very unlikely for natural language; msgmerge makes the
+       same trade-off.
+
+    :arg strings: the strings to find matches in
+    :arg cutoff: the minimum ``SequenceMatcher.ratio()`` of a match
+    :arg autojunk: whether ``SequenceMatcher`` uses its autojunk heuristic;
+        defaults to what the installed version of Babel does
+
+    """
+
+    SHORT = 10
+    SHORTLIST_SIZE = 100
+
+    def __init__(self, strings, cutoff=0.6, autojunk=BABEL_AUTOJUNK):
+        self.strings = list(strings)
+        self.cutoff = cutoff
+        self.autojunk = autojunk
+        self.postings = defaultdict(list)
+        self.by_length = defaultdict(list)
+        self.trigram_counts = []
+        for i, text in enumerate(self.strings):
+            self.by_length[len(text)].append(i)
+            trigrams = _trigrams(text)
+            self.trigram_counts.append(len(trigrams))
+            for trigram in trigrams:
+                self.postings[trigram].append(i)
+
+    def _length_range(self, length):
+        # SequenceMatcher.ratio() can't be more than
+        # 2 * min(la, lb) / (la + lb), so anything outside this range can't
+        # be a match
+        factor = self.cutoff / (2 - self.cutoff) if self.cutoff else 0
+        low = int(length * factor)
+        high = int(length / factor) + 1 if factor else max(self.by_length, default=0)
+        return range(low, high + 1)
+
+    def candidates(self, word):
+        """Returns indexes of strings to compare ``word`` with"""
+        if len(word) < self.SHORT:
+            return [
+                i
+                for length in self._length_range(len(word))
+                for i in self.by_length.get(length, [])
+            ]
+
+        trigrams = _trigrams(word)
+        counts = Counter()
+        for trigram in trigrams:
+            counts.update(self.postings.get(trigram, []))
+        # Rank by the Dice coefficient of the trigram sets so long strings
+        # that share many trigrams by chance don't crowd out the shortlist
+        scores = Counter(
+            {
+                i: count / (len(trigrams) + self.trigram_counts[i])
+                for i, count in counts.items()
+            }
+        )
+        return [i for i, score in scores.most_common(self.SHORTLIST_SIZE)]
+
+    def best_match(self, word):
+        """Returns the closest match for ``word`` or None
+
+        Like ``get_close_matches``, this returns the string with the highest
+        ratio and if there's a tie, the one that sorts last.
+
+        """
+        best = None
+        matcher = SequenceMatcher(autojunk=self.autojunk)
+        matcher.set_seq2(word)
+        for i in self.candidates(word):
+            text = self.strings[i]
+            matcher.set_seq1(text)
+            # The quick ratios are upper bounds of the ratio, so skip the
+            # expensive part if they show this can't beat the best match
+            threshold = best[0] if best else self.cutoff
+            if (
+                matcher.real_quick_ratio() >= threshold
+                and matcher.quick_ratio() >= threshold
+            ):
+                ratio = matcher.ratio()
+                if ratio >= self.cutoff and (best is None or (ratio, text) > best):
+                    best = (ratio, text)
+        return best[1] if best else None
+
+
+def _msgid(message):
+    return message.id if isinstance(message.id, str) else message.id[0]
+
+
+def _key(message):
+    if message.context is not None:
+        return (_msgid(message), message.context)
+    return _msgid(message)
+
+
+def update_catalog(catalog, template):
+    """Updates a catalog from a template catalog
+
+    This does what ``catalog.update(template)`` does, but uses a
+    :py:class:`FuzzyIndex` to find fuzzy matches for new messages, so it
+    takes about linear instead of quadratic time in the size of the catalog.
+
+    Fuzzy matches are added to the catalog as fuzzy messages with the new
+    msgid and the old translation before updating it without fuzzy matching.
+    The old messages they matched are not kept as obsolete.
+
+    :arg catalog: the :py:class:`babel.messages.catalog.Catalog` to update
+    :arg template: the template catalog; it is not changed
+
+    """
+    old_messages = {}
+    # Like Catalog.update, match on the lowercased msgid only and let later
+    # messages win
+    fuzzy_candidates = {}
+    for message in catalog:
+        if not message.id:
+            continue
+        old_messages[_key(message)] = message
+        if message.string:
+            fuzzy_candidates[_msgid(message).lower().strip()] = _key(message)
+
+    index = FuzzyIndex(fuzzy_candidates)
+    matched = set()
+    for message in template:
+        if not message.id or _key(message) in old_messages:
+            continue
+        match = index.best_match(_msgid(message).lower().strip())
+        if match is None:
+            continue
+        old_key = fuzzy_candidates[match]
+        old_message = old_messages[old_key]
+        matched.add(old_key)
+        catalog.add(
+            _msgid(message),
+            old_message.string,
+            user_comments=old_message.user_comments,
+            context=message.context,
+        )
+        # Message() adds or removes the python-format flag depending on the
+        # msgid, but the flags of the old message are what should be kept
+        catalog.get(_msgid(message), message.context).flags = set(old_message.flags) | {
+            "fuzzy"
+        }
+
+    catalog.update(template, no_fuzzy_matching=True)
+    for old_key in matched:
+        catalog.obsolete.pop(old_key, None)
@@ -0,0 +1,182 @@
+import functools
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar("puente_translation_stats", default=None)
+
+
+class TranslationStats:
+    """Counts translation calls and the time they take
+
+    :ivar calls: dict of function name to number of calls
+    :ivar seconds: dict of function name to seconds spent in it
+    :ivar cache_lookups: number of calls that went through the translation
+        cache
+    :ivar cache_misses: number of those that weren't in the cache
+
+    """
+
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self.cache_lookups = 0
+        self.cache_misses = 0
+
+    @property
+    def cache_hits(self):
+        return self.cache_lookups - self.cache_misses
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    @property
+    def total_seconds(self):
+        return sum(self.seconds.values())
+
+    def record(self, name, seconds, cached=False):
+        self.calls[name] += 1
+        self.seconds[name] += seconds
+        if cached:
+            self.cache_lookups += 1
+
+    def as_dict(self):
+        return {
+            "calls": dict(self.calls),
+            "seconds": dict(self.seconds),
+            "total_calls": self.total_calls,
+            "total_seconds": self.total_seconds,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+        }
+
+
+def current_stats():
+    """Returns the :py:class:`TranslationStats` being collected or None"""
+    return _current.get()
+
+
+@contextmanager
+def collect():
+    """Collects stats of the translation calls made in the block
+
+    Collection is scoped to the thread or asyncio task, so concurrent
+    requests don't count each other's calls::
+
+        with collect() as stats:
+            template.render(context)
+        print(stats.total_calls, stats.total_seconds)
+
+    """
+    stats = TranslationStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def record_cache_miss():
+    stats = _current.get()
+    if stats is not None:
+        stats.cache_misses += 1
+
+
+def instrument(name, func, cached=False):
+    """Wraps a template global so calls are counted and timed
+
+    The wrapper keeps Jinja2's ``pass_context`` marker of ``func``. Calls
+    made while nothing is being collected only cost a context variable
+    lookup.
+
+    :arg name: the name to count calls under
+    :arg func: the function to wrap
+    :arg cached: whether ``func`` looks translations up in the
+        :py:class:`puente.ext.TranslationCache`
+
+    """
+    if getattr(func, "puente_instrumented", False):
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stats = _current.get()
+        if stats is None:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats.record(name, time.perf_counter() - start, cached)
+
+    wrapper.puente_instrumented = True
+    return wrapper
+
+
+class LoggingSink:
+    """Logs the stats of every request
+
+    :arg logger: name of the logger to log to
+
+    """
+
+    def __init__(self, logger="puente.instrumentation"):
+        self.logger = logging.getLogger(logger)
+
+    def emit(self, stats, label):
+        self.logger.info(
+            "%s: %d translation calls in %.2fms; %d cache hits, %d misses",
+            label,
+            stats.total_calls,
+            stats.total_seconds * 1000,
+            stats.cache_hits,
+            stats.cache_misses,
+        )
+
+
+class MetricsRegistry:
+    """Adds up the stats of all requests in this process
+
+    Use :py:data:`registry` or pass your own registry around.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def emit(self, stats, label):
+        with self._lock:
+            self.requests += 1
+            self.cache_lookups += stats.cache_lookups
+            self.cache_misses += stats.cache_misses
+            for name, calls in stats.calls.items():
+                self.calls[name] += calls
+                self.seconds[name] += stats.seconds[name]
+
+    def snapshot(self):
+        """Returns a dict of the totals so far"""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "calls": dict(self.calls),
+                "seconds": dict(self.seconds),
+                "cache_hits": self.cache_lookups - self.cache_misses,
+                "cache_misses": self.cache_misses,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.calls = defaultdict(int)
+            self.seconds = defaultdict(float)
+            self.cache_lookups = 0
+            self.cache_misses = 0
+
+
+#: The :py:class:`MetricsRegistry` for ``INSTRUMENTATION_SINKS``
+registry = MetricsRegistry()
@@ -0,0 +1,79 @@
+"""Resolves the language templates are translated into
+
+Django keeps the active language in an asgiref ``Local``. Depending on the
+version of asgiref, that's scoped to the asyncio task, so tasks started while
+rendering don't see it, or to a context variable. :py:func:`override` keeps
+the language in a context variable of its own, which asyncio copies into
+every task started in the block, so concurrent renders on one event loop
+each translate into their own language.
+
+"""
+
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.utils import translation
+
+_language = ContextVar("puente_language", default=None)
+
+
+def get_language():
+    """Returns the language of the innermost :py:func:`override` block or
+    Django's active language
+
+    """
+    language = _language.get()
+    if language is None:
+        return translation.get_language()
+    return language
+
+
+@contextmanager
+def override(language):
+    """Translates templates into ``language`` in the block
+
+    Activates ``language`` like Django's ``translation.override`` and keeps
+    it in a context variable that the gettext globals of async environments
+    translate into::
+
+        async def render(template, language, context):
+            with override(language):
+                return await template.render_async(context)
+
+    :arg language: the language code
+
+    """
+    with translation.override(language):
+        # Keep the code the way Django returns it, so bind_language() can
+        # tell cheaply whether it's active
+        token = _language.set(translation.get_language())
+        try:
+            yield
+        finally:
+            _language.reset(token)
+
+
+def bind_language(func):
+    """Wraps a template global so it translates into :py:func:`get_language`
+
+    Outside :py:func:`override` blocks and when the language is active
+    already, this costs a context variable lookup and a comparison.
+    Otherwise the language is activated for the call.
+
+    :arg func: the function to wrap
+
+    """
+    if getattr(func, "puente_bound", False):
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        language = _language.get()
+        if language is None or language == translation.get_language():
+            return func(*args, **kwargs)
+        with translation.override(language):
+            return func(*args, **kwargs)
+
+    wrapper.puente_bound = True
+    return wrapper
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+
+from puente.commands import compile_command
+from puente.settings import get_setting
+
+
+class Command(BaseCommand):
+    """Compiles all locales' PO files into MO files.
+
+    The command looks for PO files for every domain in DOMAIN_METHODS in
+    locale/<locale>/LC_MESSAGES and writes the MO files next to them.
+
+    PO files are only compiled if they're newer than their MO file or
+    changed since they were last compiled, so running it again after
+    changing a few PO files only compiles those.
+
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--jobs",
+            "-j",
+            type=int,
+            default=1,
+            dest="jobs",
+            help=(
+                "Number of processes to compile with. Use 0 for one process "
+                "per CPU. (Default: 1)"
+            ),
+        ),
+        parser.add_argument(
+            "-f",
+            "--use-fuzzy",
+            action="store_true",
+            dest="use_fuzzy",
+            default=False,
+            help="Include fuzzy translations",
+        ),
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            dest="force",
+            default=False,
+            help="Compile all PO files, even the ones whose MO files are up to date.",
+        ),
+        parser.add_argument(
+            "--store",
+            action="store_true",
+            dest="store",
+            default=False,
+            help=(
+                "Also write catalog stores that workers of a prefork server "
+                "can share."
+            ),
+        ),
+
+    def handle(self, *args, **options):
+        compile_command(
+            base_dir=get_setting("BASE_DIR"),
+            domain_methods=get_setting("DOMAIN_METHODS"),
+            jobs=options.get("jobs"),
+            use_fuzzy=options.get("use_fuzzy"),
+            force=options.get("force"),
+            store=options.get("store"),
+        )
+
+
+Command.help = Command.__doc__
@@ -1,4 +1,5 @@
 import os
+import sys
 
 from django.core.management.base import BaseCommand
 
@@ -22,20 +23,111 @@ class Command(BaseCommand):
                 "(Default: %%default)"
             ),
         ),
+        parser.add_argument(
+            "--jobs",
+            "-j",
+            type=int,
+            default=1,
+            dest="jobs",
+            help=(
+                "Number of processes to extract strings with. Use 0 for one "
+                "process per CPU. (Default: 1)"
+            ),
+        ),
+        parser.add_argument(
+            "--cache",
+            action="store_true",
+            dest="cache",
+            default=False,
+            help=(
+                "Cache extracted strings in locale/.puente-cache/ and only "
+                "parse files that changed since the last run."
+            ),
+        ),
+        parser.add_argument(
+            "--prefilter",
+            action="store_true",
+            dest="prefilter",
+            default=False,
+            help=(
+                "Skip parsing Python and Jinja2 files that have no gettext "
+                "keywords or trans tags in them."
+            ),
+        ),
+        parser.add_argument(
+            "--since",
+            metavar="REF",
+            default=None,
+            dest="since",
+            help=(
+                "Only extract strings from files that changed since this git "
+                "ref and update the existing .pot files with them."
+            ),
+        ),
+        parser.add_argument(
+            "--detailed-exitcode",
+            action="store_true",
+            dest="detailed_exitcode",
+            default=False,
+            help=(
+                "Exit with status 2 if any .pot file changed. Exit status 0 "
+                "means nothing changed and 1 means there was an error."
+            ),
+        ),
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            dest="profile",
+            default=False,
+            help=(
+                "Print how long extracting took per file, per extraction "
+                "method and per domain."
+            ),
+        ),
+        parser.add_argument(
+            "--profile-json",
+            metavar="PATH",
+            default=None,
+            dest="profile_json",
+            help="Write the extraction profile to PATH as JSON.",
+        ),
+        parser.add_argument(
+            "--profile-top",
+            metavar="N",
+            type=int,
+            default=10,
+            dest="profile_top",
+            help="Number of slowest files to list in the profile. (Default: 10)",
+        ),
 
     requires_system_checks = False
 
     def handle(self, *args, **options):
-        return extract_command(
+        cache_dir = None
+        if options.get("cache"):
+            cache_dir = os.path.join(get_setting("BASE_DIR"), "locale", ".puente-cache")
+
+        changed_domains = extract_command(
             # Command line arguments
             outputdir=options.get("outputdir"),
+            jobs=options.get("jobs"),
+            cache_dir=cache_dir,
+            prefilter=options.get("prefilter"),
+            since=options.get("since"),
+            profile=options.get("profile"),
+            profile_json=options.get("profile_json"),
+            profile_top=options.get("profile_top"),
             # From settings.py
             domain_methods=get_setting("DOMAIN_METHODS"),
             text_domain=get_setting("TEXT_DOMAIN"),
             keywords=get_setting("KEYWORDS"),
             comment_tags=get_setting("COMMENT_TAGS"),
             base_dir=get_setting("BASE_DIR"),
+            exclude_dirs=get_setting("EXCLUDE_DIRS"),
             project=get_setting("PROJECT"),
             version=get_setting("VERSION"),
             msgid_bugs_address=get_setting("MSGID_BUGS_ADDRESS"),
         )
+
+        if options.get("detailed_exitcode") and changed_domains:
+            sys.exit(2)
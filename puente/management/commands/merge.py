@@ -1,7 +1,7 @@
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
-from puente.commands import merge_command
+from puente.commands import MERGE_ENGINES, merge_command
 from puente.settings import get_setting
 
 
@@ -35,6 +35,38 @@ class Command(BaseCommand):
             default=False,
             help="Create backup files of .po files",
         ),
+        parser.add_argument(
+            "--jobs",
+            "-j",
+            type=int,
+            default=1,
+            dest="jobs",
+            help=(
+                "Number of locales to merge at the same time. Use 0 for one "
+                "per CPU. The python engine merges in that many processes. "
+                "(Default: 1)"
+            ),
+        ),
+        parser.add_argument(
+            "--engine",
+            choices=MERGE_ENGINES,
+            default="gettext",
+            dest="engine",
+            help=(
+                "Merge with the gettext tools or in process with Babel. "
+                "(Default: gettext)"
+            ),
+        ),
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            dest="force",
+            default=False,
+            help=(
+                "Merge all .po files, even the ones that didn't change since "
+                "they were last merged."
+            ),
+        ),
 
     def handle(self, *args, **options):
         return merge_command(
@@ -43,6 +75,9 @@ class Command(BaseCommand):
             base_dir=get_setting("BASE_DIR"),
             domain_methods=get_setting("DOMAIN_METHODS"),
             languages=getattr(settings, "LANGUAGES", []),
+            jobs=options.get("jobs"),
+            engine=options.get("engine"),
+            force=options.get("force"),
         )
 
 
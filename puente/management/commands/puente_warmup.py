@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from puente.commands import warmup_command
+
+
+class Command(BaseCommand):
+    """Loads catalogs and compiles Jinja2 templates ahead of time.
+
+    The command loads the catalogs for every language in LANGUAGES and
+    compiles every template of the first Jinja2 backend in TEMPLATES. If the
+    backend has a bytecode cache, the compiled templates end up in it, so
+    running this after a deploy saves processes that share the bytecode
+    cache from compiling them on their first requests.
+
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--language",
+            "-l",
+            action="append",
+            dest="languages",
+            help=(
+                "Language to load catalogs for; can be given several times. "
+                "(Default: every language in LANGUAGES)"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        warmup_command(languages=options.get("languages"))
+
+
+Command.help = Command.__doc__
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from puente.commands import untranslated_report_command
+from puente.settings import get_setting
+from puente.untranslated import find_dumps
+
+
+class Command(BaseCommand):
+    """Reports the strings that rendered untranslated most often.
+
+    The command merges the dumps of untranslated strings in UNTRANSLATED_DIR,
+    or the ones passed as arguments, and prints the strings ranked by how
+    often they rendered untranslated, estimated from the samples.
+
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths",
+            nargs="*",
+            metavar="PATH",
+            help="Dumps to merge. (Default: all dumps in UNTRANSLATED_DIR)",
+        )
+        parser.add_argument(
+            "--locale",
+            "-l",
+            dest="locale",
+            default=None,
+            help="Only report strings for this locale",
+        )
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=50,
+            dest="top",
+            help="Number of strings to report; 0 for all of them. (Default: 50)",
+        )
+
+    def handle(self, *args, **options):
+        paths = options.get("paths")
+        if not paths and get_setting("UNTRANSLATED_DIR"):
+            paths = find_dumps(get_setting("UNTRANSLATED_DIR"))
+        untranslated_report_command(
+            paths=paths, locale=options.get("locale"), top=options.get("top")
+        )
+
+
+Command.help = Command.__doc__
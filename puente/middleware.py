@@ -0,0 +1,39 @@
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.module_loading import import_string
+
+from puente.instrumentation import collect
+from puente.settings import get_setting
+
+
+def load_sinks(paths):
+    """Returns sinks for dotted paths of sinks or sink classes"""
+    sinks = []
+    for path in paths:
+        sink = import_string(path)
+        if isinstance(sink, type):
+            sink = sink()
+        sinks.append(sink)
+    return sinks
+
+
+class TranslationStatsMiddleware:
+    """Collects translation stats of every request and emits them to sinks
+
+    Sinks are the ``INSTRUMENTATION_SINKS`` setting. Django drops the
+    middleware if the ``INSTRUMENTATION`` setting is off.
+
+    """
+
+    def __init__(self, get_response):
+        if not get_setting("INSTRUMENTATION"):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.sinks = load_sinks(get_setting("INSTRUMENTATION_SINKS"))
+
+    def __call__(self, request):
+        with collect() as stats:
+            response = self.get_response(request)
+        label = "%s %s" % (request.method, request.path)
+        for sink in self.sinks:
+            sink.emit(stats, label)
+        return response
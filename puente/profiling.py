@@ -0,0 +1,162 @@
+import json
+from collections import OrderedDict
+
+import puente
+
+
+class ExtractionProfile:
+    """Collects timings for an extraction run
+
+    Every extraction of a file is recorded with how long it took, how big the
+    file is and how many messages came out of it. Those are totalled by
+    extraction method and by domain.
+
+    .. Note::
+
+       A file that's in several domains is only parsed once, but counts
+       towards the totals of every domain it's in.
+
+    """
+
+    def __init__(self):
+        self.files = []
+        self.phases = OrderedDict()
+
+    def add_phase(self, name, seconds):
+        """Records how long a phase of the run took"""
+        self.phases[name] = seconds
+
+    def add_file(self, filename, method, domains, seconds, size, messages, cached):
+        """Records the extraction of one file
+
+        :arg filename: the file relative to the base directory
+        :arg method: the extraction method
+        :arg domains: list of domains the messages went to
+        :arg seconds: how long extracting took
+        :arg size: size of the file in bytes
+        :arg messages: number of messages extracted
+        :arg cached: whether the messages came from the extraction cache
+
+        """
+        self.files.append(
+            {
+                "filename": filename,
+                "method": method,
+                "domains": list(domains),
+                "seconds": seconds,
+                "bytes": size,
+                "messages": messages,
+                "cached": cached,
+            }
+        )
+
+    def _totals(self, key):
+        totals = {}
+        for record in self.files:
+            names = record[key] if isinstance(record[key], list) else [record[key]]
+            for name in names:
+                total = totals.setdefault(
+                    name, {"files": 0, "seconds": 0.0, "bytes": 0, "messages": 0}
+                )
+                total["files"] += 1
+                total["seconds"] += record["seconds"]
+                total["bytes"] += record["bytes"]
+                total["messages"] += record["messages"]
+        return dict(sorted(totals.items()))
+
+    def by_method(self):
+        """Returns dict of method -> totals"""
+        return self._totals("method")
+
+    def by_domain(self):
+        """Returns dict of domain -> totals"""
+        return self._totals("domains")
+
+    def slowest(self, count):
+        """Returns the records for the ``count`` slowest files"""
+        return sorted(self.files, key=lambda record: record["seconds"], reverse=True)[
+            :count
+        ]
+
+    def as_dict(self, count):
+        """Returns the profile as a dict that can be serialized to JSON
+
+        :arg count: number of slowest files to list
+
+        """
+        return {
+            "puente_version": puente.__version__,
+            "phases": dict(self.phases),
+            "totals": {
+                "files": len(self.files),
+                "seconds": sum(record["seconds"] for record in self.files),
+                "bytes": sum(record["bytes"] for record in self.files),
+                "messages": sum(record["messages"] for record in self.files),
+                "cached": sum(1 for record in self.files if record["cached"]),
+            },
+            "by_method": self.by_method(),
+            "by_domain": self.by_domain(),
+            "slowest": self.slowest(count),
+            "files": self.files,
+        }
+
+    def write_json(self, path, count):
+        """Writes the profile to a file as JSON
+
+        :arg path: the path of the file to write
+        :arg count: number of slowest files to list
+
+        """
+        with open(path, "w") as fp:
+            json.dump(self.as_dict(count), fp, indent=2, sort_keys=True)
+
+    def format_report(self, count):
+        """Returns the profile as a human-readable report
+
+        :arg count: number of slowest files to list
+
+        """
+        data = self.as_dict(count)
+        row = "  %-40s %7s %10s %12s %9s"
+        lines = ["Extraction profile:"]
+        lines.append(
+            "  "
+            + ", ".join(
+                "%s: %.3fs" % (name, seconds) for name, seconds in self.phases.items()
+            )
+        )
+
+        for title, totals in [
+            ("By method", data["by_method"]),
+            ("By domain", data["by_domain"]),
+        ]:
+            lines.append("")
+            lines.append(title + ":")
+            lines.append(row % ("", "files", "seconds", "bytes", "messages"))
+            for name, total in totals.items():
+                lines.append(
+                    row
+                    % (
+                        name,
+                        total["files"],
+                        "%.3f" % total["seconds"],
+                        total["bytes"],
+                        total["messages"],
+                    )
+                )
+
+        lines.append("")
+        lines.append("Slowest %d files:" % count)
+        lines.append(row % ("", "", "seconds", "bytes", "messages"))
+        for record in data["slowest"]:
+            lines.append(
+                row
+                % (
+                    record["filename"],
+                    "",
+                    "%.3f" % record["seconds"],
+                    record["bytes"],
+                    record["messages"],
+                )
+            )
+        return "\n".join(lines)
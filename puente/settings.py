@@ -18,6 +18,10 @@ DOMAIN_METHODS = None
 # The basedir of this project to extract strings from
 BASE_DIR = None
 
+# List of glob patterns for directories relative to BASE_DIR that extraction
+# should never descend into like "node_modules" or "**/static"
+EXCLUDE_DIRS = []
+
 # If you set this, we'll use it. Otherwise we assume you're using django-jinja
 # and we'll pick up the settings from the first template handler specified.
 JINJA2_CONFIG = None
@@ -31,8 +35,50 @@ VERSION = "1.0"
 # Email address or url for reporting msgid-related bugs to.
 MSGID_BUGS_ADDRESS = ""
 
+# Number of translations the pgettext and npgettext template globals cache;
+# 0 disables the cache
+TRANSLATION_CACHE_SIZE = 0
+
+# Whether to count and time the gettext calls of Jinja2 templates
+INSTRUMENTATION = False
+
+# Dotted paths of sinks or sink classes that TranslationStatsMiddleware passes
+# the stats of every request to
+INSTRUMENTATION_SINKS = ["puente.instrumentation.LoggingSink"]
+
+# Fraction of gettext calls in Jinja2 templates to check for whether they
+# rendered untranslated; 0 disables the check
+UNTRANSLATED_SAMPLE_RATE = 0
+
+# Languages whose strings aren't checked for whether they rendered
+# untranslated, usually the language msgids are written in; LANGUAGE_CODE is
+# never checked
+UNTRANSLATED_SKIP_LANGUAGES = ["en-us"]
+
+# Directory to write counts of untranslated strings to; if this is None, they
+# are logged to the "puente.untranslated" logger instead
+UNTRANSLATED_DIR = None
+
+# Seconds between writing counts of untranslated strings
+UNTRANSLATED_FLUSH_INTERVAL = 60
+
 
 def get_setting(key):
     from django.conf import settings
 
-    return settings.PUENTE.get(key, globals()[key])
+    return getattr(settings, "PUENTE", {}).get(key, globals()[key])
+
+
+def get_template_setting(key):
+    """Returns a setting the Jinja2 extensions read when they're created
+
+    Environments with Puente's extensions are also built where Django isn't
+    set up, like in ``pybabel extract``. There, this returns the defaults, so
+    caching, instrumentation and tracking of untranslated strings are off.
+
+    """
+    from django.conf import settings
+
+    if not settings.configured:
+        return globals()[key]
+    return get_setting(key)
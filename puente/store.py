@@ -0,0 +1,471 @@
+"""Read-only catalog store that's shared between processes
+
+A catalog store holds the translations of one ``.po`` file in a format that's
+looked up straight from a memory map, so processes that map the same file,
+like the workers of a prefork web server, share one copy of it instead of
+each building dicts of every catalog.
+
+The file is laid out like this; all integers are little endian unsigned 32
+bit integers and offsets are from the start of the file:
+
+* header: ``MAGIC``, format version, number of entries, number of slots in
+  the hash table, offset and length of the plural expression, offsets of the
+  hash table, the entries and the strings
+* hash table: one slot per entry index plus one, 0 for empty slots, indexed
+  by the CRC32 of the key with linear probing
+* entries: CRC32, offset and length of the key and offset and length of the
+  translation for every message
+* strings: UTF-8 keys and translations
+
+Keys are msgids, prefixed with the context and ``"\\x04"`` for messages with
+a context, like in ``.mo`` files. Translations of plural messages are their
+plural forms joined with ``"\\x00"``.
+
+"""
+
+import gettext
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections.abc import Mapping
+
+from django.conf import settings
+from django.utils.translation import get_language, to_language, to_locale, trans_real
+
+MAGIC = b"PUENTECS"
+FORMAT_VERSION = 1
+
+#: Suffix of catalog store files; they're written next to the .mo files
+STORE_SUFFIX = ".store"
+
+_HEADER = struct.Struct("<8s8I")
+_SLOT = struct.Struct("<I")
+_ENTRY = struct.Struct("<5I")
+
+
+def _key(message, context=None):
+    if context is not None:
+        return "%s\x04%s" % (context, message)
+    return message
+
+
+def write_store(fileobj, catalog, use_fuzzy=False):
+    """Writes a catalog store for a catalog
+
+    :arg fileobj: binary file-like object to write to
+    :arg catalog: the :py:class:`babel.messages.catalog.Catalog`
+    :arg use_fuzzy: whether or not to include fuzzy translations
+
+    :returns: number of messages in the store
+
+    """
+    messages = {}
+    for message in list(catalog)[1:]:
+        if not message.string or (message.fuzzy and not use_fuzzy):
+            continue
+        if message.pluralizable:
+            if not all(message.string):
+                continue
+            key = _key(message.id[0], message.context)
+            messages[key] = "\x00".join(message.string)
+        else:
+            messages[_key(message.id, message.context)] = message.string
+
+    blob = bytearray()
+
+    def add_string(text):
+        offset = len(blob)
+        data = text.encode("utf-8")
+        blob.extend(data)
+        return offset, len(data)
+
+    entries = []
+    for key, value in sorted(messages.items()):
+        key_data = key.encode("utf-8")
+        entries.append((zlib.crc32(key_data),) + add_string(key) + add_string(value))
+    plural_offset, plural_length = add_string(catalog.plural_expr)
+
+    # Keep the table at most half full so probes stay short
+    table_size = 1
+    while table_size < 2 * len(entries):
+        table_size *= 2
+    table = [0] * table_size
+    for index, entry in enumerate(entries):
+        slot = entry[0] % table_size
+        while table[slot]:
+            slot = (slot + 1) % table_size
+        table[slot] = index + 1
+
+    table_offset = _HEADER.size
+    entries_offset = table_offset + table_size * _SLOT.size
+    blob_offset = entries_offset + len(entries) * _ENTRY.size
+
+    fileobj.write(
+        _HEADER.pack(
+            MAGIC,
+            FORMAT_VERSION,
+            len(entries),
+            table_size,
+            blob_offset + plural_offset,
+            plural_length,
+            table_offset,
+            entries_offset,
+            blob_offset,
+        )
+    )
+    fileobj.write(struct.pack("<%dI" % table_size, *table))
+    for crc, key_offset, key_length, value_offset, value_length in entries:
+        fileobj.write(
+            _ENTRY.pack(
+                crc,
+                blob_offset + key_offset,
+                key_length,
+                blob_offset + value_offset,
+                value_length,
+            )
+        )
+    fileobj.write(blob)
+    return len(entries)
+
+
+class CatalogStore:
+    """Looks up translations in a catalog store file
+
+    The file is memory mapped read-only and nothing is copied out of it
+    except the translations that are looked up.
+
+    :arg path: path of the store file
+
+    :raises ValueError: if the file isn't a catalog store of this format
+        version
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fp:
+            self._map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (
+                magic,
+                version,
+                self._count,
+                self._table_size,
+                plural_offset,
+                plural_length,
+                self._table_offset,
+                self._entries_offset,
+                blob_offset,
+            ) = _HEADER.unpack_from(self._map)
+        except struct.error:
+            magic = version = None
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._map.close()
+            raise ValueError("%s is not a catalog store" % path)
+
+        plural_expr = self._map[plural_offset : plural_offset + plural_length]
+        self.plural = gettext.c2py(plural_expr.decode("utf-8"))
+
+    def __len__(self):
+        return self._count
+
+    def get(self, key):
+        """Returns the translation for a key or None"""
+        data = key.encode("utf-8")
+        crc = zlib.crc32(data)
+        table_size = self._table_size
+        slot = crc % table_size
+        while True:
+            (index,) = _SLOT.unpack_from(
+                self._map, self._table_offset + slot * _SLOT.size
+            )
+            if not index:
+                return None
+            (
+                entry_crc,
+                key_offset,
+                key_length,
+                value_offset,
+                value_length,
+            ) = _ENTRY.unpack_from(
+                self._map, self._entries_offset + (index - 1) * _ENTRY.size
+            )
+            if (
+                entry_crc == crc
+                and key_length == len(data)
+                and self._map[key_offset : key_offset + key_length] == data
+            ):
+                return self._map[value_offset : value_offset + value_length].decode(
+                    "utf-8"
+                )
+            slot = (slot + 1) % table_size
+
+    def items(self):
+        """Yields the key and translation of every message"""
+        for index in range(self._count):
+            (
+                crc,
+                key_offset,
+                key_length,
+                value_offset,
+                value_length,
+            ) = _ENTRY.unpack_from(
+                self._map, self._entries_offset + index * _ENTRY.size
+            )
+            yield (
+                self._map[key_offset : key_offset + key_length].decode("utf-8"),
+                self._map[value_offset : value_offset + value_length].decode("utf-8"),
+            )
+
+    def gettext(self, message):
+        rv = self.get(message)
+        return message if rv is None else rv
+
+    def pgettext(self, context, message):
+        rv = self.get(_key(message, context))
+        return message if rv is None else rv
+
+    def ngettext(self, singular, plural, number):
+        return self.npgettext(None, singular, plural, number)
+
+    def npgettext(self, context, singular, plural, number):
+        rv = self.get(_key(singular, context))
+        if rv is None:
+            return singular if number == 1 else plural
+        forms = rv.split("\x00")
+        index = self.plural(number)
+        return forms[index] if index < len(forms) else forms[-1]
+
+    def close(self):
+        self._map.close()
+
+
+class StoreCatalog(Mapping):
+    """Read-only mapping over a catalog store that's laid out like the
+    catalogs of Django's translation objects
+
+    Keys are msgids, prefixed with the context and ``"\\x04"`` for messages
+    with a context, and ``(msgid, index)`` for the plural forms of plural
+    messages.
+
+    :arg store: the :py:class:`CatalogStore`
+
+    """
+
+    def __init__(self, store):
+        self.store = store
+        # Read by puente.ext to pick plural forms, like Django's catalogs
+        self._plurals = [store.plural]
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            msgid, index = key
+            rv = self.store.get(msgid)
+            if rv is not None:
+                forms = rv.split("\x00")
+                if 0 <= index < len(forms):
+                    return forms[index]
+        else:
+            rv = self.store.get(key)
+            if rv is not None and "\x00" not in rv:
+                return rv
+        raise KeyError(key)
+
+    def __iter__(self):
+        for key, value in self.store.items():
+            if "\x00" in value:
+                for index in range(value.count("\x00") + 1):
+                    yield (key, index)
+            else:
+                yield key
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def plural(self, msgid, num):
+        """Returns the plural form of a message for a number
+
+        :raises KeyError: if the message isn't in the store
+
+        """
+        return self[(msgid, self.store.plural(num))]
+
+
+class _AppTranslation(trans_real.DjangoTranslation):
+    """Django's translation object without the catalogs of one of the
+    ``LOCALE_PATHS``
+
+    """
+
+    def __init__(self, language, exclude_dir):
+        self._exclude_dir = os.path.abspath(exclude_dir)
+        super().__init__(language)
+
+    def _add_local_translations(self):
+        for localedir in reversed(settings.LOCALE_PATHS):
+            if os.path.abspath(localedir) != self._exclude_dir:
+                self.merge(self._new_gnu_trans(localedir))
+
+
+class StoreDjangoTranslation(trans_real.DjangoTranslation):
+    """Django translation object that looks messages up in a catalog store
+
+    Messages that aren't in the store are looked up in the catalogs of
+    Django, the installed apps and the other ``LOCALE_PATHS``, which are
+    loaded like Django loads them, and then in the catalogs of
+    ``LANGUAGE_CODE``.
+
+    :arg language: the language code
+    :arg store: the :py:class:`CatalogStore`
+    :arg locale_dir: the ``locale/`` directory the store is in
+
+    """
+
+    def __init__(self, language, store, locale_dir):
+        gettext.GNUTranslations.__init__(self)
+        self._language = language
+        self._catalog = StoreCatalog(store)
+        self.plural = store.plural
+        self.add_fallback(_AppTranslation(language, locale_dir))
+
+    def __repr__(self):
+        return "<StoreDjangoTranslation lang:%s>" % self._language
+
+    def language(self):
+        return self._language
+
+    def to_language(self):
+        return to_language(self._language)
+
+
+class StoreTranslations:
+    """Translates with the catalog stores of the active language
+
+    Pass this to Jinja2's ``install_gettext_translations`` instead of
+    ``django.utils.translation``. Stores are opened the first time a
+    language is used and kept open. Open them in the parent process of a
+    prefork server, for example with :py:meth:`open`, and the workers share
+    the mapped pages from the start.
+
+    Messages that aren't in the store of the active language, or of its
+    generic language, are returned untranslated.
+
+    :py:meth:`install_django` has Django translate with the stores too.
+
+    :arg locale_dir: the ``locale/`` directory with
+        ``<locale>/LC_MESSAGES/<domain>.store`` files
+    :arg domain: the domain to translate with
+
+    """
+
+    def __init__(self, locale_dir, domain="django"):
+        self.locale_dir = locale_dir
+        self.domain = domain
+        self._stores = {}
+        self._lock = threading.Lock()
+        self._django_languages = None
+
+    def _path(self, locale):
+        return os.path.join(
+            self.locale_dir, locale, "LC_MESSAGES", self.domain + STORE_SUFFIX
+        )
+
+    def open(self, language):
+        """Returns the store for a language or None if there isn't one
+
+        :arg language: a language code like ``"pt-br"``
+
+        """
+        try:
+            return self._stores[language]
+        except KeyError:
+            pass
+
+        with self._lock:
+            if language not in self._stores:
+                locale = to_locale(language)
+                store = None
+                for candidate in (locale, locale.split("_")[0]):
+                    if os.path.isfile(self._path(candidate)):
+                        store = CatalogStore(self._path(candidate))
+                        break
+                self._stores[language] = store
+            return self._stores[language]
+
+    def reload(self):
+        """Forgets all stores so they're opened again when they're used
+
+        Store files are replaced atomically, so stores that are open keep
+        serving the old translations until this is called. The old maps are
+        closed once nothing uses them anymore.
+
+        """
+        with self._lock:
+            self._stores = {}
+        if self._django_languages is not None:
+            self.install_django(self._django_languages)
+
+    def install_django(self, languages=None):
+        """Has Django translate with the catalog stores
+
+        Puts a :py:class:`StoreDjangoTranslation` in Django's cache of
+        translation objects for every language that has a store, so
+        ``django.utils.translation`` looks messages up in the store instead
+        of loading the catalogs of this ``locale/`` directory into dicts.
+        Call it once Django is set up. Django forgets these objects when it
+        resets its translations, which it does when ``LANGUAGES``,
+        ``LANGUAGE_CODE`` or ``LOCALE_PATHS`` change in tests and when the
+        development server sees a ``.mo`` file change.
+
+        :arg languages: list of language codes; defaults to the
+            ``LANGUAGES`` setting
+
+        :returns: list of the languages that translate with a store
+
+        """
+        if languages is None:
+            languages = [code for code, name in settings.LANGUAGES]
+        self._django_languages = list(languages)
+        # Other languages fall back to LANGUAGE_CODE, so install it first
+        languages = sorted(
+            languages, key=lambda language: language != settings.LANGUAGE_CODE
+        )
+        installed = []
+        for language in languages:
+            store = self.open(language)
+            if store is None:
+                continue
+            trans_real._translations[language] = StoreDjangoTranslation(
+                language, store, self.locale_dir
+            )
+            installed.append(language)
+        # Looked up again the next time a message is translated without an
+        # active language
+        trans_real._default = None
+        return installed
+
+    def _store(self):
+        language = get_language()
+        return self.open(language) if language else None
+
+    def gettext(self, message):
+        store = self._store()
+        return message if store is None else store.gettext(message)
+
+    def ngettext(self, singular, plural, number):
+        store = self._store()
+        if store is None:
+            return singular if number == 1 else plural
+        return store.ngettext(singular, plural, number)
+
+    def pgettext(self, context, message):
+        store = self._store()
+        return message if store is None else store.pgettext(context, message)
+
+    def npgettext(self, context, singular, plural, number):
+        store = self._store()
+        if store is None:
+            return singular if number == 1 else plural
+        return store.npgettext(context, singular, plural, number)
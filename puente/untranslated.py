@@ -0,0 +1,264 @@
+"""Samples which strings render untranslated
+
+When ``UNTRANSLATED_SAMPLE_RATE`` is set, the gettext globals of Jinja2
+templates check a sample of their calls for whether the translation fell back
+to the source string and count those by locale, context and msgid. Counts are
+flushed periodically to a sink, which writes them to JSON lines files in
+``UNTRANSLATED_DIR`` or logs them. The ``untranslated_report`` command merges
+the files into a ranked report.
+
+Strings count as untranslated if the catalog of the language doesn't have
+them. Strings rendered in ``LANGUAGE_CODE`` or in one of the
+``UNTRANSLATED_SKIP_LANGUAGES``, which the msgids are usually written in,
+aren't checked.
+
+"""
+
+import atexit
+import functools
+import glob
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.translation import get_language, to_language, trans_real
+from django.utils.translation.trans_real import CONTEXT_SEPARATOR
+
+from puente.settings import get_template_setting
+
+
+class FileSink:
+    """Appends dumps as JSON lines to a file per process in a directory
+
+    :arg directory: the directory to write to; it's created if it doesn't
+        exist
+
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def emit(self, dump):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(
+            self.directory,
+            "untranslated-%s-%d.jsonl" % (socket.gethostname(), os.getpid()),
+        )
+        with open(path, "a", encoding="utf-8") as fp:
+            fp.write(json.dumps(dump, ensure_ascii=False) + "\n")
+
+
+class LoggingSink:
+    """Logs dumps as JSON to a logger
+
+    :arg logger: name of the logger to log to
+
+    """
+
+    def __init__(self, logger="puente.untranslated"):
+        self.logger = logging.getLogger(logger)
+
+    def emit(self, dump):
+        self.logger.info("%s", json.dumps(dump, ensure_ascii=False))
+
+
+class UntranslatedTracker:
+    """Counts untranslated strings and flushes the counts to a sink
+
+    Only recording takes a lock and only calls that are sampled record, so
+    the lock is rarely contended. Once ``max_entries`` distinct strings are
+    counted, new ones are dropped until the next flush.
+
+    :arg sink: object with an ``emit(dump)`` method
+    :arg sample_rate: fraction of calls that are checked
+    :arg max_entries: maximum number of distinct strings to count
+    :arg flush_interval: seconds between flushes
+    :arg skip_languages: language codes whose strings aren't checked
+
+    """
+
+    def __init__(
+        self,
+        sink,
+        sample_rate,
+        max_entries=10000,
+        flush_interval=60,
+        skip_languages=(),
+    ):
+        self.sink = sink
+        self.sample_rate = sample_rate
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self.skip_languages = frozenset(skip_languages)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.counts = {}
+        self.dropped = 0
+        self.last_flush = time.monotonic()
+
+    def record(self, locale, context, msgid):
+        key = (locale, context, msgid)
+        with self._lock:
+            counts = self.counts
+            if key in counts:
+                counts[key] += 1
+            elif len(counts) < self.max_entries:
+                counts[key] = 1
+            else:
+                self.dropped += 1
+            due = time.monotonic() - self.last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Passes the counts so far to the sink and starts over"""
+        with self._lock:
+            counts, dropped = self.counts, self.dropped
+            self._reset()
+        if not counts and not dropped:
+            return
+        self.sink.emit(
+            {
+                "time": time.time(),
+                "sample_rate": self.sample_rate,
+                "dropped": dropped,
+                "entries": [
+                    [locale, context, msgid, count]
+                    for (locale, context, msgid), count in counts.items()
+                ],
+            }
+        )
+
+    def after_fork(self):
+        # The lock may have been held by another thread when the process
+        # forked and the counts belong to the parent
+        self._lock = threading.Lock()
+        self._reset()
+
+
+#: The :py:class:`UntranslatedTracker` the template globals record to
+tracker = None
+
+
+def _setting_changed(setting, **kwargs):
+    global tracker
+
+    if setting in ("PUENTE", "LANGUAGE_CODE") and tracker is not None:
+        tracker.flush()
+        tracker = None
+
+
+setting_changed.connect(_setting_changed)
+
+
+def get_tracker():
+    """Returns the tracker for the ``UNTRANSLATED_*`` settings or None"""
+    global tracker
+
+    sample_rate = get_template_setting("UNTRANSLATED_SAMPLE_RATE")
+    if not sample_rate:
+        return None
+    if tracker is None:
+        directory = get_template_setting("UNTRANSLATED_DIR")
+        sink = FileSink(directory) if directory else LoggingSink()
+        tracker = UntranslatedTracker(
+            sink,
+            sample_rate,
+            flush_interval=get_template_setting("UNTRANSLATED_FLUSH_INTERVAL"),
+            skip_languages=[
+                to_language(language)
+                for language in [settings.LANGUAGE_CODE]
+                + list(get_template_setting("UNTRANSLATED_SKIP_LANGUAGES"))
+            ],
+        )
+        atexit.register(tracker.flush)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=tracker.after_fork)
+    return tracker
+
+
+def _catalog_key(name, args):
+    """Returns (context, msgid, key of the msgid in a Django catalog)"""
+    if name == "gettext":
+        return None, args[0], args[0]
+    if name == "ngettext":
+        return None, args[0], (args[0], 0)
+    key = "%s%s%s" % (args[0], CONTEXT_SEPARATOR, args[1])
+    if name == "pgettext":
+        return args[0], args[1], key
+    return args[0], args[1], (key, 0)
+
+
+def track(name, func, tracker):
+    """Wraps a template global so a sample of calls is checked
+
+    Calls that aren't sampled only cost a random number. Sampled calls check
+    whether the catalog of the active language has the string, unless the
+    tracker skips that language.
+
+    :arg name: ``gettext``, ``ngettext``, ``pgettext`` or ``npgettext``
+    :arg func: the template global to wrap
+    :arg tracker: the :py:class:`UntranslatedTracker` to record to
+
+    """
+    if getattr(func, "puente_tracked", False):
+        return func
+    offset = 1 if hasattr(func, "jinja_pass_arg") else 0
+    sample_rate = tracker.sample_rate
+    rand = random.random
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        rv = func(*args, **kwargs)
+        if rand() < sample_rate:
+            language = get_language()
+            if language is None or language in tracker.skip_languages:
+                return rv
+            try:
+                context, msgid, key = _catalog_key(name, args[offset:])
+            except IndexError:
+                # Called with keyword arguments
+                return rv
+            if key not in trans_real.translation(language)._catalog:
+                tracker.record(language, context, msgid)
+        return rv
+
+    wrapper.puente_tracked = True
+    return wrapper
+
+
+def read_dumps(paths):
+    """Merges dumps into estimated counts of untranslated strings
+
+    Each count is divided by the sample rate it was sampled with, so dumps
+    with different sample rates can be merged.
+
+    :arg paths: paths of JSON lines files written by :py:class:`FileSink`
+
+    :returns: ``Counter`` of ``(locale, context, msgid)`` to estimated count
+
+    """
+    counts = Counter()
+    for path in paths:
+        with open(path, encoding="utf-8") as fp:
+            for line in fp:
+                if not line.strip():
+                    continue
+                dump = json.loads(line)
+                for locale, context, msgid, count in dump["entries"]:
+                    counts[(locale, context, msgid)] += count / dump["sample_rate"]
+    return counts
+
+
+def find_dumps(directory):
+    """Returns paths of the dumps :py:class:`FileSink` wrote to a directory"""
+    return sorted(glob.glob(os.path.join(directory, "untranslated-*.jsonl")))
@@ -1,3 +1,7 @@
+import os
+import stat
+import tempfile
+
 from babel.messages.extract import DEFAULT_KEYWORDS as BABEL_KEYWORDS
 
 
@@ -122,3 +126,33 @@ def collapse_whitespace(message):
     return " ".join(
         map(lambda s: s.strip(), filter(None, message.strip().splitlines()))
     )
+
+
+def atomic_write(path, data):
+    """Writes bytes to a file by way of a temp file and a rename
+
+    Readers see either the old contents or the new contents, never a partially
+    written file.
+
+    :arg path: path of the file to write
+    :arg data: bytes to write
+
+    """
+    dirname = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        dir=dirname, prefix=".%s." % os.path.basename(path), suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(data)
+        # mkstemp creates files that only the owner can read, so keep the
+        # mode of the file we're replacing
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = 0o644
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,121 @@
+import time
+
+from django.conf import settings
+from django.utils import translation
+from jinja2 import Environment, TemplateError
+
+from puente.ext import get_translated_environment
+
+
+def find_jinja2_engine():
+    """Returns the first Jinja2 backend in ``TEMPLATES`` or None
+
+    This is the backend ``generate_options_map`` reads the extensions of
+    when ``JINJA2_CONFIG`` isn't set. Both django-jinja's backend and
+    Django's own Jinja2 backend are supported.
+
+    """
+    from django.template import engines
+
+    for engine in engines.all():
+        if isinstance(getattr(engine, "env", None), Environment):
+            return engine
+    return None
+
+
+def list_templates(engine):
+    """Returns sorted names of the templates a Jinja2 backend renders"""
+    env = engine.env
+    if env.loader is None:
+        return []
+    names = env.list_templates()
+    match_template = getattr(engine, "match_template", None)
+    if match_template is not None:
+        names = [name for name in names if match_template(name)]
+    return sorted(names)
+
+
+def warmup(languages=None, engine=None):
+    """Loads catalogs and compiles templates before they're needed
+
+    Loads Django's catalogs for every language, unless it translates with
+    catalog stores installed by
+    :py:meth:`puente.store.StoreTranslations.install_django`, and compiles
+    every template of the Jinja2 backend. Compiling a template puts it in the environment's
+    template cache and, if the environment has one, its bytecode cache, so
+    other processes that use the same bytecode cache load it from there. If
+    the environment has the ``puente.ext.static_i18n`` extension, templates
+    are compiled for every language.
+
+    :arg languages: list of language codes; defaults to the ``LANGUAGES``
+        setting
+    :arg engine: the Jinja2 backend; defaults to :py:func:`find_jinja2_engine`
+
+    :returns: dict with ``languages``, ``templates`` and ``errors``, a list
+        of ``(name, error)`` for templates that failed to compile, and
+        ``timings``, a dict of phase to seconds
+
+    """
+    if languages is None:
+        languages = [code for code, name in settings.LANGUAGES]
+    if engine is None:
+        engine = find_jinja2_engine()
+
+    timings = {}
+    start = time.perf_counter()
+    for language in languages:
+        # Activating a language loads and caches its catalogs
+        with translation.override(language):
+            pass
+    timings["catalogs"] = time.perf_counter() - start
+
+    names = []
+    errors = []
+    if engine is not None:
+        start = time.perf_counter()
+        names = list_templates(engine)
+        timings["discovery"] = time.perf_counter() - start
+
+        environments = [engine.env]
+        if getattr(engine.env, "puente_language", False) is not False:
+            environments.extend(
+                get_translated_environment(engine.env, language)
+                for language in languages
+            )
+
+        start = time.perf_counter()
+        for env in environments:
+            for name in names:
+                try:
+                    env.get_template(name)
+                except TemplateError as exc:
+                    if env is engine.env:
+                        errors.append((name, exc))
+        timings["templates"] = time.perf_counter() - start
+
+    return {
+        "languages": list(languages),
+        "templates": names,
+        "errors": errors,
+        "timings": timings,
+    }
+
+
+def post_fork(server=None, worker=None):
+    """Warms up a worker process; use it as gunicorn's ``post_fork`` hook
+
+    In a gunicorn config file::
+
+        from puente.warmup import post_fork
+
+    With ``--preload``, the templates and catalogs of the parent process are
+    there already and this only loads what's missing. Without it, this sets
+    up Django first.
+
+    """
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+    warmup()
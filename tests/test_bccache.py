@@ -0,0 +1,122 @@
+import os
+
+from django.utils import translation
+
+from jinja2 import DictLoader, Environment
+
+import puente
+from puente.bccache import PuenteBytecodeCache
+from puente.ext import get_translated_environment
+
+TEMPLATES = {
+    "a.html": "{% trans %}Hello{% endtrans %}",
+    "b.html": "{% trans %}Bye{% endtrans %} {{ 1 + 1 }}",
+    "c.html": "{% for i in range(3) %}{{ i }}{% endfor %}",
+}
+
+
+def build_environment(cache, extensions=("puente.ext.i18n",)):
+    env = Environment(
+        loader=DictLoader(TEMPLATES),
+        extensions=list(extensions),
+        bytecode_cache=cache,
+    )
+    env.install_gettext_translations(translation, newstyle=True)
+    return env
+
+
+def has_bytecode(cache, env, name):
+    source = TEMPLATES[name]
+    return cache.get_bucket(env, name, None, source).code is not None
+
+
+class TestPuenteBytecodeCache:
+    def test_shared_between_environments(self, tmpdir):
+        cache = PuenteBytecodeCache(str(tmpdir))
+        env = build_environment(cache)
+        assert not has_bytecode(cache, env, "a.html")
+        assert env.get_template("a.html").render() == "Hello"
+
+        other = build_environment(PuenteBytecodeCache(str(tmpdir)))
+        assert has_bytecode(cache, other, "a.html")
+        assert other.get_template("a.html").render() == "Hello"
+
+    def test_keyed_by_extensions(self, tmpdir):
+        cache = PuenteBytecodeCache(str(tmpdir))
+        build_environment(cache).get_template("a.html")
+        env = build_environment(cache, ["puente.ext.i18n", "jinja2.ext.do"])
+        assert not has_bytecode(cache, env, "a.html")
+
+    def test_keyed_by_version(self, tmpdir, monkeypatch):
+        cache = PuenteBytecodeCache(str(tmpdir))
+        env = build_environment(cache)
+        env.get_template("a.html")
+        monkeypatch.setattr(puente, "__version__", "99.0")
+        assert not has_bytecode(cache, env, "a.html")
+
+    def test_keyed_by_language(self, tmpdir):
+        cache = PuenteBytecodeCache(str(tmpdir))
+        env = build_environment(cache, ["puente.ext.static_i18n"])
+        de = get_translated_environment(env, "de")
+        fr = get_translated_environment(env, "fr")
+        assert de.bytecode_cache is cache
+        de.get_template("a.html")
+        assert has_bytecode(cache, de, "a.html")
+        assert not has_bytecode(cache, fr, "a.html")
+        assert not has_bytecode(cache, env, "a.html")
+
+    def test_keyed_by_catalog(self, tmpdir):
+        cache = PuenteBytecodeCache(str(tmpdir))
+        env = build_environment(cache, ["puente.ext.static_i18n"])
+        de = get_translated_environment(env, "de")
+        de.get_template("a.html")
+        de.puente_catalog_key = "changed"
+        assert not has_bytecode(cache, de, "a.html")
+
+    def test_evicts_least_recently_used(self, tmpdir):
+        cache = PuenteBytecodeCache(str(tmpdir))
+        env = build_environment(cache)
+        for i, name in enumerate(sorted(TEMPLATES)):
+            before = set(tmpdir.listdir())
+            env.get_template(name)
+            (entry,) = set(tmpdir.listdir()) - before
+            entry.setmtime(1000 * (i + 1))
+        sizes = sorted(entry.size() for entry in tmpdir.listdir())
+        assert len(sizes) == 3
+
+        # Using a.html makes b.html the least recently used one
+        assert has_bytecode(cache, env, "a.html")
+        cache.max_size = sum(sizes) - 1
+        cache.evict()
+        assert has_bytecode(cache, env, "a.html")
+        assert not has_bytecode(cache, env, "b.html")
+        assert has_bytecode(cache, env, "c.html")
+
+    def test_evicts_past_high_water_mark(self, tmpdir):
+        cache = PuenteBytecodeCache(str(tmpdir))
+        scans = []
+        entries = cache._entries
+        cache._entries = lambda: scans.append(1) or entries()
+
+        env = build_environment(cache)
+        for name in sorted(TEMPLATES):
+            env.get_template(name)
+        # Writing entries doesn't scan the directory
+        assert scans == []
+        assert cache.size == sum(entry.size() for entry in tmpdir.listdir())
+
+        cache.max_size = cache.size
+        env = build_environment(cache, ["puente.ext.i18n", "jinja2.ext.do"])
+        for name in sorted(TEMPLATES):
+            env.get_template(name)
+        assert scans
+        assert cache.size == sum(entry.size() for entry in tmpdir.listdir())
+        assert cache.size <= cache.max_size
+
+    def test_clear(self, tmpdir):
+        cache = PuenteBytecodeCache(str(tmpdir.join("cache")))
+        env = build_environment(cache)
+        env.get_template("a.html")
+        tmpdir.join("cache", "unrelated.txt").write("")
+        cache.clear()
+        assert os.listdir(str(tmpdir.join("cache"))) == ["unrelated.txt"]
@@ -0,0 +1,63 @@
+import os
+
+from babel.messages.pofile import read_po
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.run import Benchmarks, compare
+
+
+def read_tree(base_dir):
+    tree = {}
+    for root, dirs, files in os.walk(base_dir):
+        for filename in files:
+            path = os.path.join(root, filename)
+            with open(path, "rb") as fp:
+                tree[os.path.relpath(path, base_dir)] = fp.read()
+    return tree
+
+
+class TestCorpus:
+    def test_same_seed_same_corpus(self, tmpdir):
+        first = generate_corpus(str(tmpdir.join("first")), 30, seed=5)
+        second = generate_corpus(str(tmpdir.join("second")), 30, seed=5)
+        assert first == second
+        assert read_tree(str(tmpdir.join("first"))) == read_tree(
+            str(tmpdir.join("second"))
+        )
+
+    def test_different_seed_different_corpus(self, tmpdir):
+        generate_corpus(str(tmpdir.join("first")), 30, seed=5)
+        generate_corpus(str(tmpdir.join("second")), 30, seed=6)
+        assert read_tree(str(tmpdir.join("first"))) != read_tree(
+            str(tmpdir.join("second"))
+        )
+
+    def test_extract(self, tmpdir, settings):
+        settings.PUENTE = {
+            "JINJA2_CONFIG": {
+                "**.html": {"extensions": "puente.ext.i18n", "silent": "False"}
+            }
+        }
+        generate_corpus(str(tmpdir), 30, seed=5)
+        benchmarks = Benchmarks(str(tmpdir), jobs=1, languages=["de"])
+        benchmarks.bench_extract()()
+
+        with open(benchmarks.pot_path("django"), "rb") as fp:
+            catalog = read_po(fp)
+        assert any(message.context for message in catalog)
+        assert any(message.pluralizable for message in catalog)
+        assert any(message.auto_comments for message in catalog)
+        assert any(
+            location[0].endswith(".py")
+            for message in catalog
+            for location in message.locations
+        )
+
+
+class TestCompare:
+    def test_regressions(self, capsys):
+        corpus = {"files": 10, "seed": 1}
+        baseline = {"corpus": corpus, "results": {"a": {"min": 1.0}, "b": {"min": 1.0}}}
+        data = {"corpus": corpus, "results": {"a": {"min": 1.05}, "b": {"min": 1.5}}}
+        assert compare(data, baseline, threshold=0.1) == ["b"]
+        assert "SLOWER" in capsys.readouterr().out
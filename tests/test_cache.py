@@ -0,0 +1,103 @@
+import json
+import os
+
+from puente import extract
+from puente.cache import ExtractionCache
+from puente.commands import extract_command
+from puente import settings as puente_settings
+
+
+def nix_header(pot_file):
+    """Nix the POT file header since it changes and we don't care"""
+    return pot_file[pot_file.find("\n\n") + 2 :]
+
+
+def run_extract(tmpdir):
+    extract_command(
+        outputdir=str(tmpdir.join("out")),
+        domain_methods={
+            "django": [
+                ("src/*.py", "python"),
+                ("src/*.html", "jinja2"),
+            ]
+        },
+        text_domain=puente_settings.TEXT_DOMAIN,
+        keywords=puente_settings.KEYWORDS,
+        comment_tags=puente_settings.COMMENT_TAGS,
+        base_dir=str(tmpdir),
+        project=puente_settings.PROJECT,
+        version=puente_settings.VERSION,
+        msgid_bugs_address=puente_settings.MSGID_BUGS_ADDRESS,
+        cache_dir=str(tmpdir.join("cache")),
+    )
+    return nix_header(tmpdir.join("out", "django.pot").read())
+
+
+class TestExtractionCache:
+    def test_roundtrip(self, tmpdir):
+        cache = ExtractionCache(str(tmpdir), {"_": None}, ["L10n:"])
+        key = cache.make_key(b"_('a')", "python", {})
+        assert cache.get("foo.py", "python", key) is None
+
+        messages = [
+            (1, "a", [], None),
+            (2, ("one", "many"), ["L10n: comment"], "context"),
+        ]
+        cache.set("foo.py", "python", key, messages)
+        cache.save()
+
+        cache = ExtractionCache(str(tmpdir), {"_": None}, ["L10n:"])
+        assert cache.get("foo.py", "python", key) == messages
+        assert cache.get("foo.py", "python", key + "x") is None
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_settings_change_invalidates(self, tmpdir):
+        cache = ExtractionCache(str(tmpdir), {"_": None}, [])
+        key = cache.make_key(b"_('a')", "python", {})
+        cache.set("foo.py", "python", key, [(1, "a", [], None)])
+        cache.save()
+
+        cache = ExtractionCache(str(tmpdir), {"_": None, "_lazy": None}, [])
+        assert cache.get("foo.py", "python", key) is None
+
+    def test_key_covers_options(self, tmpdir):
+        cache = ExtractionCache(str(tmpdir), {"_": None}, [])
+        assert cache.make_key(b"x", "jinja2", {"silent": "False"}) != cache.make_key(
+            b"x", "jinja2", {"silent": "True"}
+        )
+        assert cache.make_key(b"x", "jinja2", {}) != cache.make_key(b"x", "python", {})
+
+
+class TestExtractCommandCache:
+    def test_only_changed_files_are_parsed(self, tmpdir, monkeypatch):
+        tmpdir.join("src", "a.py").write("_('a string')\n", ensure=True)
+        tmpdir.join("src", "b.html").write("{{ _('b string') }}\n")
+        first = run_extract(tmpdir)
+
+        parsed = []
+        real_extract_from_file = extract.extract_from_file
+
+        def counting_extract_from_file(method, filepath, *args, **kwargs):
+            parsed.append(os.path.relpath(filepath, str(tmpdir)))
+            return real_extract_from_file(method, filepath, *args, **kwargs)
+
+        monkeypatch.setattr(extract, "extract_from_file", counting_extract_from_file)
+
+        # Nothing changed, so nothing gets parsed and the output is the same
+        assert run_extract(tmpdir) == first
+        assert parsed == []
+
+        tmpdir.join("src", "b.html").write("{{ _('new b string') }}\n")
+        assert "new b string" in run_extract(tmpdir)
+        assert parsed == ["src/b.html"]
+
+    def test_deleted_files_are_evicted(self, tmpdir):
+        tmpdir.join("src", "a.py").write("_('a string')\n", ensure=True)
+        tmpdir.join("src", "b.py").write("_('b string')\n")
+        run_extract(tmpdir)
+
+        tmpdir.join("src", "b.py").remove()
+        assert "b string" not in run_extract(tmpdir)
+
+        data = json.loads(tmpdir.join("cache", ExtractionCache.FILENAME).read())
+        assert sorted(data["entries"]) == ["python:src/a.py"]
@@ -0,0 +1,128 @@
+import gettext
+import os
+from textwrap import dedent
+
+import pytest
+
+from django.core import management
+from django.core.management import CommandError
+from django.test import TestCase
+
+from puente.commands import compile_command
+from puente.store import CatalogStore
+
+
+class TestManageCompile(TestCase):
+    def test_help(self):
+        try:
+            management.call_command("compile", "--help")
+        except SystemExit:
+            # Calling --help causes it to call sys.exit(0) which
+            # will otherwise exit.
+            pass
+
+
+PO = dedent("""\
+    msgid ""
+    msgstr ""
+    "Language: %(locale)s\\n"
+    "MIME-Version: 1.0\\n"
+    "Content-Type: text/plain; charset=UTF-8\\n"
+    "Content-Transfer-Encoding: 8bit\\n"
+    "Plural-Forms: nplurals=2; plural=(n != 1);\\n"
+
+    msgid "Save"
+    msgstr "%(save)s"
+
+    #, fuzzy
+    msgid "Cancel"
+    msgstr "Fuzzy"
+
+    msgid "one item"
+    msgid_plural "%%(count)s items"
+    msgstr[0] "ein Ding"
+    msgstr[1] "%%(count)s Dinge"
+    """)
+
+
+class TestCompileCommand:
+    def write_po(self, tmpdir, locale, save, domain="django"):
+        po = tmpdir.join("locale", locale, "LC_MESSAGES", "%s.po" % domain)
+        po.write(PO % {"locale": locale, "save": save}, ensure=True)
+        return po
+
+    def compile(self, tmpdir, **kwargs):
+        return compile_command(
+            base_dir=str(tmpdir), domain_methods={"django": [], "other": []}, **kwargs
+        )
+
+    def translations(self, tmpdir, locale):
+        mo = tmpdir.join("locale", locale, "LC_MESSAGES", "django.mo")
+        with mo.open("rb") as fp:
+            return gettext.GNUTranslations(fp)
+
+    def test_compile(self, tmpdir, capsys):
+        self.write_po(tmpdir, "de", "Speichern")
+        self.write_po(tmpdir, "fr", "Enregistrer")
+        tmpdir.join("locale", "templates", "LC_MESSAGES").ensure(dir=True)
+
+        compiled = self.compile(tmpdir, jobs=2)
+
+        assert sorted(os.path.relpath(path, str(tmpdir)) for path in compiled) == [
+            os.path.join("locale", "de", "LC_MESSAGES", "django.mo"),
+            os.path.join("locale", "fr", "LC_MESSAGES", "django.mo"),
+        ]
+        assert "Compiled 2 of 2 .mo files" in capsys.readouterr().out
+        de = self.translations(tmpdir, "de")
+        assert de.gettext("Save") == "Speichern"
+        assert de.gettext("Cancel") == "Cancel"
+        assert de.ngettext("one item", "%(count)s items", 3) == "%(count)s Dinge"
+        assert self.translations(tmpdir, "fr").gettext("Save") == "Enregistrer"
+
+    def test_use_fuzzy(self, tmpdir):
+        self.write_po(tmpdir, "de", "Speichern")
+        self.compile(tmpdir, use_fuzzy=True)
+        assert self.translations(tmpdir, "de").gettext("Cancel") == "Fuzzy"
+
+    def test_only_stale(self, tmpdir):
+        self.write_po(tmpdir, "de", "Speichern")
+        fr = self.write_po(tmpdir, "fr", "Enregistrer")
+        assert len(self.compile(tmpdir)) == 2
+
+        # Nothing changed
+        assert self.compile(tmpdir) == []
+
+        # A changed .po file is compiled even if it's not newer
+        mtime = fr.mtime()
+        self.write_po(tmpdir, "fr", "Sauvegarder")
+        fr.setmtime(mtime - 60)
+        assert self.compile(tmpdir) == [fr.strpath[:-3] + ".mo"]
+        assert self.translations(tmpdir, "fr").gettext("Save") == "Sauvegarder"
+
+        # A missing .mo file is compiled
+        tmpdir.join("locale", "de", "LC_MESSAGES", "django.mo").remove()
+        assert len(self.compile(tmpdir)) == 1
+
+        assert len(self.compile(tmpdir, force=True)) == 2
+
+    def test_missing_locale_dir(self, tmpdir):
+        with pytest.raises(CommandError):
+            self.compile(tmpdir)
+
+    def test_store(self, tmpdir):
+        self.write_po(tmpdir, "de", "Speichern")
+        assert len(self.compile(tmpdir)) == 1
+
+        # Asking for stores compiles again to write them
+        assert len(self.compile(tmpdir, store=True)) == 1
+        store = CatalogStore(
+            tmpdir.join("locale", "de", "LC_MESSAGES", "django.store").strpath
+        )
+        assert store.gettext("Save") == "Speichern"
+        assert store.gettext("Cancel") == "Cancel"
+        assert store.ngettext("one item", "%(count)s items", 3) == "%(count)s Dinge"
+        assert self.compile(tmpdir, store=True) == []
+
+        # A missing store is written again
+        tmpdir.join("locale", "de", "LC_MESSAGES", "django.store").remove()
+        assert len(self.compile(tmpdir, store=True)) == 1
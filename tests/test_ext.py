@@ -1,6 +1,18 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from babel.messages.catalog import Catalog
+from babel.messages.mofile import write_mo
+
 from django.utils import translation
+from django.utils.autoreload import file_changed
 
 from jinja2 import DictLoader, Environment
+from markupsafe import Markup
+
+from puente import ext
 
 
 def build_environment(template):
@@ -235,3 +247,238 @@ class TestPuenteI18nExtension:
             "{% endautoescape %}"
         )
         assert render(tmpl).strip() == "this is a tag <b><i>bar</i></b>"
+
+
+class TestTranslationCache:
+    @pytest.fixture(autouse=True)
+    def cache_settings(self, settings):
+        settings.PUENTE = dict(settings.PUENTE, TRANSLATION_CACHE_SIZE=10)
+        yield
+        if ext.translation_cache is not None:
+            ext.translation_cache.clear()
+
+    def test_disabled_by_default(self, settings):
+        settings.PUENTE = {}
+        env = Environment(extensions=["puente.ext.i18n"])
+        assert env.globals["pgettext"] is ext.pgettext
+        assert env.globals["npgettext"] is ext.npgettext
+
+    def test_installed_with_translations(self):
+        env = build_environment("")
+        assert env.globals["pgettext"] is ext.cached_pgettext
+        assert env.globals["npgettext"] is ext.cached_npgettext
+
+    def test_hits_and_misses(self):
+        env = build_environment("")
+        ext.translation_cache.clear()
+        tmpl = env.from_string('{{ pgettext("context", "<b>%(foo)s</b>", foo=foo) }}')
+        assert tmpl.render(foo="<i>bar</i>") == "<b>&lt;i&gt;bar&lt;/i&gt;</b>"
+        assert tmpl.render(foo="baz") == "<b>baz</b>"
+        assert ext.translation_cache.misses == 1
+        assert ext.translation_cache.hits == 1
+
+    def test_npgettext(self):
+        env = build_environment("")
+        ext.translation_cache.clear()
+        tmpl = env.from_string(
+            '{{ npgettext("context", "sing %(num)s", "plur %(num)s", n) }}'
+        )
+        assert tmpl.render(n=1) == "sing 1"
+        assert tmpl.render(n=2) == "plur 2"
+        assert tmpl.render(n=2) == "plur 2"
+        assert ext.translation_cache.misses == 2
+        assert ext.translation_cache.hits == 1
+
+    def test_keyed_by_plural_form(self, tmpdir, settings):
+        catalog = Catalog(locale="pl")
+        catalog.add(
+            ("%(num)s file", "%(num)s files"),
+            ("%(num)s plik", "%(num)s pliki", "%(num)s plików"),
+            context="count",
+        )
+        mo_dir = tmpdir.mkdir("pl").mkdir("LC_MESSAGES")
+        with open(str(mo_dir.join("django.mo")), "wb") as fp:
+            write_mo(fp, catalog)
+        settings.LOCALE_PATHS = [str(tmpdir)]
+
+        env = build_environment("")
+        ext.translation_cache.clear()
+        tmpl = env.from_string(
+            '{{ npgettext("count", "%(num)s file", "%(num)s files", n) }}'
+        )
+        with translation.override("pl"):
+            results = [tmpl.render(n=n) for n in [1, 2, 5, 3, 22, 25, 100, 1]]
+        assert results == [
+            "1 plik",
+            "2 pliki",
+            "5 plików",
+            "3 pliki",
+            "22 pliki",
+            "25 plików",
+            "100 plików",
+            "1 plik",
+        ]
+        # One entry per plural form, not per number
+        assert ext.translation_cache.misses == 3
+        assert ext.translation_cache.hits == 5
+
+        assert tmpl.render(n=1.5) == "1.5 files"
+
+    def test_keyed_by_autoescape_and_language(self):
+        env = build_environment("")
+        ext.translation_cache.clear()
+        tmpl = env.from_string('{{ pgettext("context", "<b>%(foo)s</b>", foo=foo) }}')
+        unescaped = env.from_string(
+            "{% autoescape False %}"
+            '{{ pgettext("context", "<b>%(foo)s</b>", foo=foo) }}'
+            "{% endautoescape %}"
+        )
+        assert tmpl.render(foo="<i>") == "<b>&lt;i&gt;</b>"
+        assert unescaped.render(foo="<i>") == "<b><i></b>"
+        with translation.override("fr"):
+            tmpl.render(foo="<i>")
+        assert ext.translation_cache.misses == 3
+        assert ext.translation_cache.hits == 0
+
+    def test_cleared_when_catalogs_change(self):
+        env = build_environment("")
+        env.from_string('{{ pgettext("context", "message") }}').render()
+        assert ext.translation_cache.misses == 1
+
+        file_changed.send(sender=None, file_path=Path("locale/fr/django.po"))
+        assert ext.translation_cache.misses == 1
+        file_changed.send(sender=None, file_path=Path("locale/fr/django.mo"))
+        assert ext.translation_cache.misses == 0
+
+    def test_threads(self):
+        env = build_environment("")
+        tmpl = env.from_string('{{ npgettext("context", "sing", "plur", n) }}')
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(lambda n: tmpl.render(n=n % 3), range(200)))
+        assert results == [("sing" if n % 3 == 1 else "plur") for n in range(200)]
+
+
+class TestStaticTranslation:
+    @pytest.fixture(autouse=True)
+    def catalog(self, tmpdir, settings):
+        catalog = Catalog(locale="fr")
+        catalog.add("Hello", "Bonjour")
+        catalog.add("<b>Bye</b>", "<b>Au revoir</b>")
+        catalog.add("100%% sure", "Sûr à 100%%")
+        catalog.add("Open", "Ouvrir", context="verb")
+        catalog.add("Hello %(name)s", "Bonjour %(name)s")
+        mo_dir = tmpdir.mkdir("fr").mkdir("LC_MESSAGES")
+        with open(str(mo_dir.join("django.mo")), "wb") as fp:
+            write_mo(fp, catalog)
+        settings.LOCALE_PATHS = [str(tmpdir)]
+
+    def build_environment(self, template):
+        env = Environment(
+            autoescape=True,
+            loader=DictLoader({"tmpl.html": template}),
+            extensions=["puente.ext.static_i18n"],
+        )
+        env.install_gettext_translations(translation, newstyle=True)
+        return env
+
+    def test_trans(self):
+        env = self.build_environment(
+            "{% trans %}Hello{% endtrans %} {% trans %}<b>Bye</b>{% endtrans %}"
+        )
+        fr = ext.get_translated_environment(env, "fr")
+        source = env.loader.get_source(env, "tmpl.html")[0]
+        assert "gettext" not in fr.compile(source, raw=True)
+        assert fr.get_template("tmpl.html").render() == "Bonjour <b>Au revoir</b>"
+
+    def test_gettext_calls(self):
+        env = self.build_environment(
+            '{{ _("Hello") }} {{ gettext("100%% sure") }} {{ _("Hello %(name)s", name=name) }}'
+        )
+        with translation.override("fr"):
+            tmpl = ext.get_translated_environment(env).get_template("tmpl.html")
+            assert tmpl.render(name="<i>") == "Bonjour Sûr à 100% Bonjour &lt;i&gt;"
+
+    def test_context(self):
+        env = self.build_environment('{% trans "verb" %}Open{% endtrans %}')
+        tmpl = ext.get_translated_environment(env, "fr").get_template("tmpl.html")
+        assert tmpl.render() == "Ouvrir"
+
+    def test_one_template_per_language(self):
+        env = self.build_environment("{% trans %}Hello{% endtrans %}")
+        with translation.override("fr"):
+            fr = ext.get_translated_environment(env)
+            assert fr is ext.get_translated_environment(env, "fr")
+            assert fr.get_template("tmpl.html").render() == "Bonjour"
+        en = ext.get_translated_environment(env, "en-us")
+        assert en.get_template("tmpl.html").render() == "Hello"
+        assert fr.get_template("tmpl.html").render() == "Bonjour"
+
+    def test_cached_environment_without_lock(self, monkeypatch):
+        env = self.build_environment("{% trans %}Hello{% endtrans %}")
+        fr = ext.get_translated_environment(env, "fr")
+
+        acquired = []
+
+        class Lock:
+            def __enter__(self):
+                acquired.append(1)
+
+            def __exit__(self, *exc_info):
+                pass
+
+        monkeypatch.setattr(ext, "_translated_environments_lock", Lock())
+        assert ext.get_translated_environment(env, "fr") is fr
+        assert acquired == []
+        ext.get_translated_environment(env, "de")
+        assert acquired == [1]
+
+    def test_base_environment_translates_at_render_time(self):
+        env = self.build_environment('{% trans %}Hello{% endtrans %} {{ _("Hello") }}')
+        tmpl = env.get_template("tmpl.html")
+        assert tmpl.render() == "Hello Hello"
+        with translation.override("fr"):
+            assert tmpl.render() == "Bonjour Bonjour"
+
+    def test_cleared_when_catalogs_change(self):
+        env = self.build_environment("{% trans %}Hello{% endtrans %}")
+        fr = ext.get_translated_environment(env, "fr")
+        tmpl = fr.get_template("tmpl.html")
+        assert fr.get_template("tmpl.html") is tmpl
+        file_changed.send(sender=None, file_path=Path("locale/fr/django.mo"))
+        assert fr.get_template("tmpl.html") is not tmpl
+
+    def test_requires_extension(self):
+        with pytest.raises(ValueError):
+            ext.get_translated_environment(build_environment(""), "fr")
+
+
+class TestInterpolate:
+    @pytest.mark.parametrize(
+        "text",
+        [
+            "no placeholders",
+            "<b>%(foo)s</b> and %(bar)s",
+            "%(foo)s %(foo)s",
+            "100%% %(foo)s%%",
+            "%(num)d things",
+            "%s",
+            "a % b",
+        ],
+    )
+    @pytest.mark.parametrize("cls", [str, Markup])
+    def test_same_as_mod(self, text, cls):
+        variables = {"foo": "<i>", "bar": Markup("<b>"), "num": 5}
+        try:
+            expected = cls(text) % variables
+        except (TypeError, ValueError) as exc:
+            with pytest.raises(type(exc)):
+                ext.interpolate(cls(text), variables)
+        else:
+            rv = ext.interpolate(cls(text), variables)
+            assert rv == expected
+            assert type(rv) is type(expected)
+
+    def test_missing_variable(self):
+        with pytest.raises(KeyError):
+            ext.interpolate(Markup("%(foo)s"), {})
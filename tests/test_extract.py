@@ -1,11 +1,22 @@
 import os
+import re
+import subprocess
+import sys
+from io import BytesIO
 from textwrap import dedent
 
+import pytest
+
+from babel.util import pathmatch
 from django.core import management
+from django.core.management import CommandError
 from django.test import TestCase
+from jinja2.ext import babel_extract
 
-from puente.commands import extract_command
+from puente import extract
+from puente.commands import VOLATILE_HEADERS_RE, extract_command
 from puente import settings as puente_settings
+from puente.utils import monkeypatch_i18n
 
 
 class TestManageExtract(TestCase):
@@ -376,3 +387,501 @@ class TestExtractCommand:
 
             """
         )
+
+    def test_jobs_output_matches_serial(self, tmpdir):
+        # Same msgid in several files in several directories so message
+        # order and location order both matter
+        for path in ["a.py", "b/c.py", "b/d.html", "e/f/g.html", "z.html"]:
+            src = tmpdir.join("src", path)
+            src.dirpath().ensure(dir=True)
+            if path.endswith(".py"):
+                src.write("_('shared string')\n_('%s string')\n" % path)
+            else:
+                src.write(
+                    "{{ _('" + path + " string') }}\n"
+                    "{% trans %}shared string{% endtrans %}\n"
+                )
+
+        outputs = []
+        for jobs in (1, 2):
+            outputdir = tmpdir.join("out%d" % jobs)
+            extract_command(
+                outputdir=str(outputdir),
+                domain_methods={
+                    "django": [
+                        ("**.py", "python"),
+                        ("**.html", "jinja2"),
+                    ]
+                },
+                text_domain=puente_settings.TEXT_DOMAIN,
+                keywords=puente_settings.KEYWORDS,
+                comment_tags=puente_settings.COMMENT_TAGS,
+                base_dir=str(tmpdir.join("src")),
+                project=puente_settings.PROJECT,
+                version=puente_settings.VERSION,
+                msgid_bugs_address=puente_settings.MSGID_BUGS_ADDRESS,
+                jobs=jobs,
+            )
+            outputs.append(nix_header(outputdir.join("django.pot").read()))
+
+        assert outputs[0] == outputs[1]
+        assert "#: a.py:1 b/c.py:1 b/d.html:2 e/f/g.html:2 z.html:2\n" in outputs[0]
+
+    def test_multiple_domains(self, tmpdir, monkeypatch):
+        tmpdir.join("foo.py").write("_('python string')\n")
+        tmpdir.join("foo.js").write("gettext('js string');\n")
+        tmpdir.join("vendor").ensure(dir=True)
+        tmpdir.join("vendor", "lib.js").write("gettext('vendor string');\n")
+
+        # Count how many times each file gets parsed
+        parsed = []
+        real_extract_from_file = extract.extract_from_file
+
+        def counting_extract_from_file(method, filepath, *args, **kwargs):
+            parsed.append((os.path.basename(filepath), method))
+            return real_extract_from_file(method, filepath, *args, **kwargs)
+
+        monkeypatch.setattr(extract, "extract_from_file", counting_extract_from_file)
+
+        extract_command(
+            outputdir=str(tmpdir),
+            domain_methods={
+                "django": [
+                    ("*.py", "python"),
+                ],
+                "djangojs": [
+                    ("vendor", "ignore"),
+                    ("**.js", "javascript"),
+                ],
+                "everything": [
+                    ("**.js", "javascript"),
+                    ("*.py", "python"),
+                ],
+            },
+            text_domain=puente_settings.TEXT_DOMAIN,
+            keywords=puente_settings.KEYWORDS,
+            comment_tags=puente_settings.COMMENT_TAGS,
+            base_dir=str(tmpdir),
+            project=puente_settings.PROJECT,
+            version=puente_settings.VERSION,
+            msgid_bugs_address=puente_settings.MSGID_BUGS_ADDRESS,
+        )
+
+        # Each file is parsed once even though several domains want it
+        assert sorted(parsed) == [
+            ("foo.js", "javascript"),
+            ("foo.py", "python"),
+            ("lib.js", "javascript"),
+        ]
+
+        assert nix_header(tmpdir.join("django.pot").read()) == dedent(
+            """\
+            #: foo.py:1
+            msgid "python string"
+            msgstr ""
+
+            """
+        )
+        assert nix_header(tmpdir.join("djangojs.pot").read()) == dedent(
+            """\
+            #: foo.js:1
+            msgid "js string"
+            msgstr ""
+
+            """
+        )
+        assert nix_header(tmpdir.join("everything.pot").read()) == dedent(
+            """\
+            #: foo.js:1
+            msgid "js string"
+            msgstr ""
+
+            #: foo.py:1
+            msgid "python string"
+            msgstr ""
+
+            #: vendor/lib.js:1
+            msgid "vendor string"
+            msgstr ""
+
+            """
+        )
+
+
+class TestExtractFromJinja2:
+    template = dedent(
+        """\
+        {# L10n: a comment #}
+        {{ _('html string') }}
+        {{ ngettext('one thing', 'many things', num) }}
+        {% trans count=num %}
+            There is {{ count }} thing.
+        {% pluralize %}
+            There are {{ count }} things.
+        {% endtrans %}
+        """
+    ).encode("utf-8")
+    options = {"extensions": "jinja2.ext.do,puente.ext.i18n", "silent": "False"}
+
+    def test_same_as_babel_extract(self):
+        keywords = list(puente_settings.KEYWORDS.keys())
+        comment_tags = puente_settings.COMMENT_TAGS
+
+        monkeypatch_i18n()
+        expected = list(
+            babel_extract(BytesIO(self.template), keywords, comment_tags, self.options)
+        )
+        assert expected
+        assert (
+            list(
+                extract.extract_from_jinja2(
+                    BytesIO(self.template), keywords, comment_tags, self.options
+                )
+            )
+            == expected
+        )
+
+    def test_environment_is_reused(self):
+        env = extract._get_jinja2_environment(dict(self.options))
+        assert extract._get_jinja2_environment(dict(self.options)) is env
+        assert extract._get_jinja2_environment({"silent": "False"}) is not env
+
+    def test_settings_not_configured(self, tmpdir):
+        # pybabel extract builds environments without Django being set up
+        script = dedent(
+            """\
+            from io import BytesIO
+
+            from django.conf import settings
+            from jinja2 import Environment
+
+            from puente.ext import PuenteI18nExtension
+            from puente.extract import extract_from_jinja2
+
+            assert not settings.configured
+            Environment(extensions=[PuenteI18nExtension])
+            template = BytesIO(b"{# L10n: a comment #}{{ _('html string') }}")
+            options = {"extensions": "puente.ext.i18n", "silent": "False"}
+            print(list(extract_from_jinja2(template, ["_"], ["L10n:"], options)))
+            """
+        )
+        env = dict(os.environ, PYTHONPATH=os.getcwd())
+        env.pop("DJANGO_SETTINGS_MODULE", None)
+        output = subprocess.check_output(
+            [sys.executable, "-c", script], cwd=str(tmpdir), env=env
+        )
+        assert output.decode("utf-8").strip() == (
+            "[(1, '_', 'html string', ['a comment'])]"
+        )
+
+
+class TestPrefilter:
+    def test_pattern(self):
+        prefilter = extract.build_prefilter(puente_settings.KEYWORDS)
+        assert prefilter.search(b"x = _('foo')")
+        assert prefilter.search(b"x = _ (\n'foo')")
+        assert prefilter.search(b"x = pgettext_lazy('ctx', 'foo')")
+        assert prefilter.search(b"{% trans %}foo{% endtrans %}")
+        assert prefilter.search(b"{%- trans count=1 -%}foo{% endtrans %}")
+        assert not prefilter.search(b"def __init__(self):\n    pass\n")
+        assert not prefilter.search(b"foo_('bar')")
+        assert not prefilter.search(b"<p>transport</p>")
+
+    def test_might_have_strings(self, tmpdir):
+        prefilter = extract.build_prefilter(puente_settings.KEYWORDS)
+        tmpdir.join("empty.py").write("")
+        tmpdir.join("nostrings.py").write("x = 1\n")
+        tmpdir.join("strings.py").write("x = _('foo')\n")
+        assert not extract.might_have_strings(str(tmpdir.join("empty.py")), prefilter)
+        assert not extract.might_have_strings(
+            str(tmpdir.join("nostrings.py")), prefilter
+        )
+        assert extract.might_have_strings(str(tmpdir.join("strings.py")), prefilter)
+
+    def test_extract_command(self, tmpdir, capsys):
+        tmpdir.join("src", "a.py").write("_('python string')\n", ensure=True)
+        tmpdir.join("src", "b.py").write("import os\n")
+        tmpdir.join("src", "c.html").write("{% trans %}trans string{% endtrans %}\n")
+        tmpdir.join("src", "d.html").write("<p>{{ title }}</p>\n")
+        tmpdir.join("src", "e.js").write("var x = 1;\n")
+
+        outputs = []
+        for prefilter in (False, True):
+            outputdir = tmpdir.join("out%s" % prefilter)
+            extract_command(
+                outputdir=str(outputdir),
+                domain_methods={
+                    "django": [
+                        ("src/*.py", "python"),
+                        ("src/*.html", "jinja2"),
+                        ("src/*.js", "javascript"),
+                    ]
+                },
+                text_domain=puente_settings.TEXT_DOMAIN,
+                keywords=puente_settings.KEYWORDS,
+                comment_tags=puente_settings.COMMENT_TAGS,
+                base_dir=str(tmpdir),
+                project=puente_settings.PROJECT,
+                version=puente_settings.VERSION,
+                msgid_bugs_address=puente_settings.MSGID_BUGS_ADDRESS,
+                prefilter=prefilter,
+            )
+            outputs.append(nix_header(outputdir.join("django.pot").read()))
+
+        assert outputs[0] == outputs[1]
+        # b.py and d.html get skipped; the javascript method isn't filtered
+        assert "Pre-filter skipped 2 of 5 files." in capsys.readouterr().out
+
+
+class TestExtractSince:
+    domain_methods = {
+        "django": [
+            ("**.py", "python"),
+            ("**.html", "jinja2"),
+        ],
+        "other": [
+            ("b/**.py", "python"),
+        ],
+    }
+
+    def git(self, repo, *args):
+        subprocess.check_call(
+            ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+            + list(args),
+            cwd=str(repo),
+            stdout=subprocess.DEVNULL,
+        )
+
+    def extract(self, repo, outputdir, since=None):
+        extract_command(
+            outputdir=str(outputdir),
+            domain_methods=self.domain_methods,
+            text_domain=puente_settings.TEXT_DOMAIN,
+            keywords=puente_settings.KEYWORDS,
+            comment_tags=puente_settings.COMMENT_TAGS,
+            base_dir=str(repo),
+            project=puente_settings.PROJECT,
+            version=puente_settings.VERSION,
+            msgid_bugs_address=puente_settings.MSGID_BUGS_ADDRESS,
+            since=since,
+        )
+        return {
+            domain: nix_header(outputdir.join("%s.pot" % domain).read())
+            for domain in self.domain_methods
+        }
+
+    def test_since(self, tmpdir):
+        repo = tmpdir.join("repo")
+        repo.join("a.py").write(
+            "# L10n: shared comment\n_('shared')\n_('a string')\n", ensure=True
+        )
+        repo.join("b", "c.py").write("_('shared')\n_('c string')\n", ensure=True)
+        repo.join("b", "d.py").write("_('d string')\n")
+        repo.join("e.html").write("{{ _('shared') }}\n{{ _('e string') }}\n")
+        self.git(repo, "init", "-q")
+        self.git(repo, "add", ".")
+        self.git(repo, "commit", "-q", "-m", "initial")
+
+        outputdir = tmpdir.join("out")
+        self.extract(repo, outputdir)
+
+        # Modify, delete, add, and add an untracked file
+        repo.join("b", "c.py").write("_('new c string')\n_('shared')\n")
+        repo.join("b", "d.py").remove()
+        repo.join("b", "f.py").write("_('f string')\n")
+        self.git(repo, "add", "b/f.py")
+        repo.join("b", "g", "h.py").write("_('shared')\n", ensure=True)
+
+        # An incremental extract should come up with the same thing as a full
+        # extract
+        incremental = self.extract(repo, outputdir, since="HEAD")
+        full = self.extract(repo, tmpdir.join("full"))
+        assert incremental == full
+        assert "d string" not in incremental["django"]
+        assert "#: a.py:2 b/c.py:2 b/g/h.py:1 e.html:1\n" in incremental["django"]
+        assert "f string" in incremental["other"]
+
+    def assert_same_as_full_extraction(self, repo, tmpdir):
+        self.extract(repo, tmpdir.join("out"), since="HEAD")
+        self.extract(repo, tmpdir.join("full"))
+        for domain in self.domain_methods:
+            pot_files = [
+                tmpdir.join(outputdir, "%s.pot" % domain).read_binary()
+                for outputdir in ["out", "full"]
+            ]
+            incremental, full = [VOLATILE_HEADERS_RE.sub(b"", pot) for pot in pot_files]
+            assert incremental == full
+
+    def test_comment_removed(self, tmpdir):
+        repo = tmpdir.join("repo")
+        repo.join("a.py").write("# L10n: old comment\n_('shared')\n", ensure=True)
+        repo.join("b", "c.py").write("_('shared')\n", ensure=True)
+        self.git(repo, "init", "-q")
+        self.git(repo, "add", ".")
+        self.git(repo, "commit", "-q", "-m", "initial")
+        self.extract(repo, tmpdir.join("out"))
+
+        repo.join("a.py").write("_('shared')\n")
+        self.assert_same_as_full_extraction(repo, tmpdir)
+        assert "old comment" not in tmpdir.join("out", "django.pot").read()
+
+    def test_comments_of_unchanged_files(self, tmpdir):
+        repo = tmpdir.join("repo")
+        repo.join("a.py").write("# L10n: comment a\n_('shared')\n", ensure=True)
+        repo.join("b", "c.py").write("_('c string')\n", ensure=True)
+        repo.join("b", "d.py").write("# L10n: comment d\n_('shared')\n")
+        self.git(repo, "init", "-q")
+        self.git(repo, "add", ".")
+        self.git(repo, "commit", "-q", "-m", "initial")
+        self.extract(repo, tmpdir.join("out"))
+
+        # The comment of the changed file goes between the comments of the
+        # unchanged ones
+        repo.join("b", "c.py").write("# L10n: comment c\n_('shared')\n")
+        self.assert_same_as_full_extraction(repo, tmpdir)
+        assert (
+            "#. L10n: comment a\n#. L10n: comment c\n#. L10n: comment d\n"
+            in tmpdir.join("out", "django.pot").read()
+        )
+
+    def test_missing_pot_file(self, tmpdir):
+        repo = tmpdir.join("repo")
+        repo.join("a.py").write("_('a string')\n", ensure=True)
+        self.git(repo, "init", "-q")
+        with pytest.raises(CommandError):
+            self.extract(repo, tmpdir.join("out"), since="HEAD")
+
+    def test_bad_ref(self, tmpdir):
+        repo = tmpdir.join("repo")
+        repo.join("a.py").write("_('a string')\n", ensure=True)
+        self.git(repo, "init", "-q")
+        self.git(repo, "add", ".")
+        self.git(repo, "commit", "-q", "-m", "initial")
+        self.extract(repo, tmpdir.join("out"))
+        with pytest.raises(CommandError):
+            self.extract(repo, tmpdir.join("out"), since="nonexistent")
+
+
+class TestExtractUnchanged:
+    def extract(self, tmpdir):
+        return extract_command(
+            outputdir=str(tmpdir.join("out")),
+            domain_methods={
+                "django": [("src/*.py", "python")],
+                "djangojs": [("src/*.js", "javascript")],
+            },
+            text_domain=puente_settings.TEXT_DOMAIN,
+            keywords=puente_settings.KEYWORDS,
+            comment_tags=puente_settings.COMMENT_TAGS,
+            base_dir=str(tmpdir),
+            project=puente_settings.PROJECT,
+            version=puente_settings.VERSION,
+            msgid_bugs_address=puente_settings.MSGID_BUGS_ADDRESS,
+        )
+
+    def test_unchanged_pot_files_are_left_alone(self, tmpdir):
+        tmpdir.join("src", "a.py").write("_('a string')\n", ensure=True)
+        tmpdir.join("src", "b.js").write("gettext('b string');\n")
+        assert self.extract(tmpdir) == ["django", "djangojs"]
+
+        django_pot = tmpdir.join("out", "django.pot")
+        djangojs_pot = tmpdir.join("out", "djangojs.pot")
+        # Pretend the POT-Creation-Date is old
+        for pot in (django_pot, djangojs_pot):
+            pot.write(
+                re.sub(
+                    r'"POT-Creation-Date: [^\n]*',
+                    r'"POT-Creation-Date: 2015-10-28 16:18+0000\\n"',
+                    pot.read(),
+                )
+            )
+            pot.setmtime(1000000000)
+
+        assert self.extract(tmpdir) == []
+        assert django_pot.mtime() == 1000000000
+        assert djangojs_pot.mtime() == 1000000000
+
+        tmpdir.join("src", "a.py").write("_('new a string')\n")
+        assert self.extract(tmpdir) == ["django"]
+        assert "new a string" in django_pot.read()
+        assert "2015-10-28" not in django_pot.read()
+        assert djangojs_pot.mtime() == 1000000000
+
+
+class TestFileMatcher:
+    def test_compile_pattern(self):
+        cases = [
+            ("**.py", ["foo.py", "a/b/foo.py"], ["foo.html", "a/foo.pyc"]),
+            ("*.py", ["foo.py"], ["a/foo.py"]),
+            ("./foo/**.py", ["foo/a/b.py"], ["bar/a/b.py"]),
+            ("^foo/*.py", ["foo/a.py"], ["bar/foo/a.py"]),
+            ("**/templates/*.html", ["templates/a.html", "x/templates/a.html"], []),
+            ("node_modules/**", ["node_modules/a", "node_modules/a/b"], ["a/b"]),
+            ("f?o.py", ["foo.py"], ["fooo.py"]),
+        ]
+        for pattern, matches, nonmatches in cases:
+            match = extract.compile_pattern(pattern)
+            for path in matches + nonmatches:
+                assert bool(match(path)) == pathmatch(pattern, path), (pattern, path)
+
+    def test_prunes_ignored_directories(self):
+        matcher = extract.FileMatcher(
+            {
+                "django": [
+                    ("node_modules/**", "ignore"),
+                    ("**/static/**", "ignore"),
+                    ("**.py", "python"),
+                ],
+            },
+            {},
+        )
+        assert matcher.dir_domains("node_modules", ["django"]) == []
+        assert matcher.dir_domains("app/static", ["django"]) == []
+        assert matcher.dir_domains("app", ["django"]) == ["django"]
+
+    def test_doesnt_prune_when_earlier_pattern_matches(self):
+        matcher = extract.FileMatcher(
+            {
+                "django": [
+                    ("static/special/*.js", "javascript"),
+                    ("static/**", "ignore"),
+                    ("apps/**.py", "python"),
+                    ("node_modules/**", "ignore"),
+                    ("**.py", "python"),
+                    ("vendor/**", "ignore"),
+                ],
+            },
+            {},
+        )
+        assert matcher.dir_domains("static", ["django"]) == ["django"]
+        assert matcher.dir_domains("node_modules", ["django"]) == []
+        assert matcher.dir_domains("vendor", ["django"]) == ["django"]
+
+    def test_only_prunes_when_all_domains_do(self, tmpdir):
+        for path in ["static/a.js", "static/b.py", "node_modules/c.js", "d.py"]:
+            tmpdir.join(path).write("", ensure=True)
+        domain_methods = {
+            "django": [("static/**", "ignore"), ("**.py", "python")],
+            "djangojs": [("node_modules/**", "ignore"), ("**.js", "javascript")],
+        }
+        files = [
+            (filename, methods)
+            for filename, _, _, methods in extract.walk_files(
+                str(tmpdir), domain_methods, {}
+            )
+        ]
+        assert files == [
+            ("d.py", {"django": "python"}),
+            ("static/a.js", {"djangojs": "javascript"}),
+        ]
+
+    def test_exclude_dirs(self, tmpdir):
+        for path in ["a.py", "build/b.py", "app/build/c.py", "app/d.py"]:
+            tmpdir.join(path).write("", ensure=True)
+        files = [
+            filename
+            for filename, _, _, _ in extract.walk_files(
+                str(tmpdir), {"django": [("**.py", "python")]}, {}, ["**/build"]
+            )
+        ]
+        assert files == ["a.py", "app/d.py"]
@@ -0,0 +1,139 @@
+import random
+from difflib import get_close_matches
+from io import BytesIO
+
+from babel.messages.catalog import Catalog
+from babel.messages.pofile import write_po
+
+from puente.fuzzy import FuzzyIndex, update_catalog
+
+WORDS = (
+    "account add already cancel change choose close confirm continue create "
+    "delete download edit email enter error file find folder help image "
+    "invalid language learn link manage message name notification open page "
+    "password please privacy profile remove report save search select send "
+    "settings share show sign subscribe support update upload user welcome"
+).split()
+
+
+def sentences(rng, count):
+    return [
+        " ".join(rng.sample(WORDS, rng.randint(1, 8))).capitalize()
+        for i in range(count)
+    ]
+
+
+def paragraphs(rng, count):
+    # Long strings with many repeated words
+    return [
+        " ".join(rng.choices(WORDS[:12], k=rng.randint(40, 60))).capitalize()
+        for i in range(count)
+    ]
+
+
+def render(catalog):
+    buf = BytesIO()
+    write_po(buf, catalog, width=200)
+    return buf.getvalue().decode("utf-8")
+
+
+class TestFuzzyIndex:
+    def test_best_match(self):
+        rng = random.Random(1)
+        strings = sentences(rng, 500)
+        index = FuzzyIndex(strings)
+        for word in sentences(rng, 100) + [
+            s.replace("e", "a", 1) for s in strings[:50]
+        ]:
+            assert (
+                index.best_match(word)
+                == (get_close_matches(word, strings, 1, 0.6) or [None])[0]
+            )
+
+    def test_autojunk(self):
+        # With this seed, the autojunk heuristic changes some of the matches
+        rng = random.Random(3)
+        strings = paragraphs(rng, 40)
+        assert all(len(text) >= 200 for text in strings)
+        index = FuzzyIndex(strings, autojunk=True)
+        for word in paragraphs(rng, 40):
+            assert (
+                index.best_match(word)
+                == (get_close_matches(word, strings, 1, 0.6) or [None])[0]
+            )
+
+    def test_short_strings(self):
+        # These share no trigrams, but are close enough matches
+        index = FuzzyIndex(["abxcdx", "xyz"])
+        assert index.best_match("abcd") == "abxcdx"
+        assert index.best_match("qqq") is None
+
+
+class TestUpdateCatalog:
+    def build(self, seed):
+        rng = random.Random(seed)
+        strings = list(dict.fromkeys(sentences(rng, 400)))
+        catalog = Catalog(locale="de")
+        for msgid in strings:
+            if rng.random() < 0.1:
+                catalog.add((msgid, msgid + "s"), ("X", "Y"), context="button")
+            else:
+                catalog.add(msgid, "Ü " + msgid if rng.random() < 0.8 else "")
+
+        template = Catalog()
+        for msgid in strings[60:]:
+            template.add(msgid)
+        for msgid in strings[:60]:
+            template.add(msgid.replace("e", "a", 1) + " now")
+        return catalog, template
+
+    def test_same_as_babel(self):
+        expected, template = self.build(2)
+        expected.update(template)
+        catalog, template = self.build(2)
+        update_catalog(catalog, template)
+        assert render(catalog) == render(expected)
+
+    def test_fuzzy_and_obsolete(self):
+        catalog = Catalog(locale="de")
+        catalog.add("Delete %(name)s", "%(name)s löschen", user_comments=["checked"])
+        catalog.add("Gone", "Weg")
+        template = Catalog()
+        template.add("Delete %(name)s now")
+
+        update_catalog(catalog, template)
+
+        message = catalog["Delete %(name)s now"]
+        assert message.string == "%(name)s löschen"
+        assert message.fuzzy
+        assert message.user_comments == ["checked"]
+        assert "python-format" in message.flags
+        # The fuzzy matched message isn't obsolete, the other one is
+        assert list(catalog.obsolete) == ["Gone"]
+
+    def test_long_strings(self):
+        # Babel's fuzzy matching ignores popular characters of strings of 200
+        # characters or more or not depending on its version
+        def build():
+            rng = random.Random(3)
+            catalog = Catalog(locale="de")
+            for i, msgid in enumerate(paragraphs(rng, 40)):
+                catalog.add(msgid, "Absatz %d" % i)
+            template = Catalog()
+            for msgid in paragraphs(rng, 40):
+                template.add(msgid)
+            return catalog, template
+
+        expected, template = build()
+        expected.update(template)
+        catalog, template = build()
+        update_catalog(catalog, template)
+        assert {
+            message.id: (message.string, message.fuzzy)
+            for message in catalog
+            if message.id
+        } == {
+            message.id: (message.string, message.fuzzy)
+            for message in expected
+            if message.id
+        }
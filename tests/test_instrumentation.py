@@ -0,0 +1,159 @@
+import logging
+import threading
+
+import pytest
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.utils import translation
+
+from jinja2 import Environment
+
+from puente import ext
+from puente.instrumentation import (
+    LoggingSink,
+    MetricsRegistry,
+    collect,
+    current_stats,
+    registry,
+)
+from puente.middleware import TranslationStatsMiddleware
+
+TEMPLATE = (
+    '{{ _("Hello") }} {{ ngettext("file", "files", 2) }} '
+    '{{ pgettext("verb", "Open") }} {{ pgettext("verb", "Open") }} '
+    '{{ npgettext("cart", "item", "items", 1) }}'
+)
+
+
+def build_environment():
+    env = Environment(autoescape=True, extensions=["puente.ext.i18n"])
+    env.install_gettext_translations(translation, newstyle=True)
+    return env
+
+
+@pytest.fixture
+def instrumented(settings):
+    settings.PUENTE = dict(settings.PUENTE, INSTRUMENTATION=True)
+
+
+class TestInstrumentation:
+    def test_off_by_default(self, settings):
+        settings.PUENTE = {}
+        env = Environment(extensions=["puente.ext.i18n"])
+        assert env.globals["pgettext"] is ext.pgettext
+        assert env.globals["npgettext"] is ext.npgettext
+
+    def test_counts_calls(self, instrumented):
+        tmpl = build_environment().from_string(TEMPLATE)
+        with collect() as stats:
+            assert current_stats() is stats
+            assert tmpl.render() == "Hello files Open Open item"
+        assert current_stats() is None
+        assert stats.calls == {
+            "gettext": 1,
+            "ngettext": 1,
+            "pgettext": 2,
+            "npgettext": 1,
+        }
+        assert stats.total_calls == 5
+        assert stats.total_seconds > 0
+        assert stats.cache_hits == stats.cache_misses == 0
+
+    def test_not_collecting(self, instrumented):
+        tmpl = build_environment().from_string(TEMPLATE)
+        assert tmpl.render() == "Hello files Open Open item"
+
+    def test_autoescape(self, instrumented):
+        tmpl = build_environment().from_string(
+            '{{ pgettext("ctx", "<b>%(foo)s</b>", foo="<i>") }}'
+        )
+        with collect():
+            assert tmpl.render() == "<b>&lt;i&gt;</b>"
+
+    def test_cache_hits_and_misses(self, settings):
+        settings.PUENTE = dict(
+            settings.PUENTE, INSTRUMENTATION=True, TRANSLATION_CACHE_SIZE=10
+        )
+        tmpl = build_environment().from_string(TEMPLATE)
+        ext.translation_cache.clear()
+        with collect() as stats:
+            tmpl.render()
+        assert stats.cache_misses == 2
+        assert stats.cache_hits == 1
+        with collect() as stats:
+            tmpl.render()
+        assert stats.cache_misses == 0
+        assert stats.cache_hits == 3
+        ext.translation_cache.clear()
+
+    def test_threads_collect_separately(self, instrumented):
+        tmpl = build_environment().from_string(TEMPLATE)
+        results = {}
+
+        def render(count):
+            with collect() as stats:
+                for i in range(count):
+                    tmpl.render()
+            results[count] = stats.total_calls
+
+        threads = [threading.Thread(target=render, args=(n,)) for n in (1, 5, 20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == {1: 5, 5: 25, 20: 100}
+
+
+class TestSinks:
+    def test_logging_sink(self, instrumented, caplog):
+        tmpl = build_environment().from_string(TEMPLATE)
+        with collect() as stats:
+            tmpl.render()
+        with caplog.at_level(logging.INFO, logger="puente.instrumentation"):
+            LoggingSink().emit(stats, "GET /")
+        assert "GET /: 5 translation calls" in caplog.text
+
+    def test_metrics_registry(self, instrumented):
+        tmpl = build_environment().from_string(TEMPLATE)
+        metrics = MetricsRegistry()
+        for i in range(3):
+            with collect() as stats:
+                tmpl.render()
+            metrics.emit(stats, "GET /")
+        snapshot = metrics.snapshot()
+        assert snapshot["requests"] == 3
+        assert snapshot["calls"]["pgettext"] == 6
+        metrics.reset()
+        assert metrics.snapshot()["requests"] == 0
+
+
+class TestTranslationStatsMiddleware:
+    def test_emits_stats(self, settings):
+        settings.PUENTE = dict(
+            settings.PUENTE,
+            INSTRUMENTATION=True,
+            INSTRUMENTATION_SINKS=["puente.instrumentation.registry"],
+        )
+        tmpl = build_environment().from_string(TEMPLATE)
+        registry.reset()
+
+        def view(request):
+            return HttpResponse(tmpl.render())
+
+        middleware = TranslationStatsMiddleware(view)
+        response = middleware(RequestFactory().get("/"))
+        assert response.content == b"Hello files Open Open item"
+        assert registry.snapshot()["calls"]["pgettext"] == 2
+        registry.reset()
+
+    def test_sink_classes(self, settings):
+        settings.PUENTE = dict(settings.PUENTE, INSTRUMENTATION=True)
+        middleware = TranslationStatsMiddleware(lambda request: HttpResponse())
+        assert [type(sink) for sink in middleware.sinks] == [LoggingSink]
+
+    def test_not_used_when_off(self, settings):
+        settings.PUENTE = {}
+        with pytest.raises(MiddlewareNotUsed):
+            TranslationStatsMiddleware(lambda request: HttpResponse())
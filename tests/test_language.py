@@ -0,0 +1,166 @@
+import asyncio
+
+import pytest
+
+from babel.messages.catalog import Catalog
+from babel.messages.mofile import write_mo
+from django.utils import translation
+from jinja2 import DictLoader, Environment
+
+from puente import ext
+from puente.language import bind_language, get_language, override
+
+TRANSLATIONS = {
+    "fr": ("Bonjour", "Ouvrir", "article", "articles", "Au revoir"),
+    "de": ("Hallo", "Öffnen", "Artikel", "Artikel (mehrere)", "Tschüss"),
+    "es": ("Hola", "Abrir", "artículo", "artículos", "Adiós"),
+    "it": ("Ciao", "Aprire", "articolo", "articoli", "Arrivederci"),
+    "nl": ("Hallo!", "Openen", "artikel", "artikelen", "Dag"),
+}
+
+TEMPLATE = (
+    "{% for i in items() %}"
+    '{{ pgettext("greeting", "Hello") }} {% trans %}Open{% endtrans %} '
+    '{{ npgettext("cart", "item", "items", i + 1) }} {{ _("Bye") }}|'
+    "{% endfor %}"
+)
+
+
+def expected(language, count=4):
+    hello, open_, item, items, bye = TRANSLATIONS.get(
+        language, ("Hello", "Open", "item", "items", "Bye")
+    )
+    return "".join(
+        "%s %s %s %s|" % (hello, open_, item if i == 0 else items, bye)
+        for i in range(count)
+    )
+
+
+async def items(count=4):
+    for i in range(count):
+        # Let the other renders run between iterations
+        await asyncio.sleep(0)
+        yield i
+
+
+@pytest.fixture(autouse=True)
+def catalogs(tmpdir, settings):
+    for language, (hello, open_, item, items_, bye) in TRANSLATIONS.items():
+        catalog = Catalog(locale=language)
+        catalog.add("Hello", hello, context="greeting")
+        catalog.add("Open", open_)
+        catalog.add(("item", "items"), (item, items_), context="cart")
+        catalog.add("Bye", bye)
+        mo_dir = tmpdir.mkdir(language).mkdir("LC_MESSAGES")
+        with open(str(mo_dir.join("django.mo")), "wb") as fp:
+            write_mo(fp, catalog)
+    settings.LOCALE_PATHS = [str(tmpdir)]
+
+
+def build_environment(extension="puente.ext.i18n"):
+    env = Environment(
+        autoescape=True,
+        enable_async=True,
+        loader=DictLoader({"tmpl.html": TEMPLATE}),
+        extensions=[extension],
+    )
+    env.install_gettext_translations(translation, newstyle=True)
+    return env
+
+
+class TestOverride:
+    def test_get_language(self):
+        with translation.override("de"):
+            assert get_language() == "de"
+            with override("fr"):
+                assert get_language() == "fr"
+                assert translation.get_language() == "fr"
+            assert get_language() == "de"
+
+    def test_bind_language(self):
+        gettext = bind_language(translation.gettext)
+        assert bind_language(gettext) is gettext
+        with override("fr"):
+            translation.activate("de")
+            assert gettext("Bye") == "Au revoir"
+            assert translation.get_language() == "de"
+        assert gettext("Bye") == "Bye"
+
+    def test_sync_environment_not_bound(self):
+        env = Environment(extensions=["puente.ext.i18n"])
+        env.install_gettext_translations(translation, newstyle=True)
+        for name in ["gettext", "ngettext", "pgettext", "npgettext"]:
+            assert not hasattr(env.globals[name], "puente_bound")
+
+
+class TestAsyncRendering:
+    @pytest.fixture(params=[0, 100], ids=["uncached", "cached"])
+    def cache_size(self, request, settings):
+        settings.PUENTE = dict(settings.PUENTE, TRANSLATION_CACHE_SIZE=request.param)
+        yield
+        settings.PUENTE = dict(settings.PUENTE, TRANSLATION_CACHE_SIZE=0)
+
+    def test_globals_bound(self):
+        env = build_environment()
+        for name in ["gettext", "ngettext", "pgettext", "npgettext"]:
+            assert env.globals[name].puente_bound
+
+    def test_render(self):
+        tmpl = build_environment().get_template("tmpl.html")
+
+        async def render():
+            with override("fr"):
+                return await tmpl.render_async(items=items)
+
+        assert asyncio.run(render()) == expected("fr")
+
+    def test_concurrent_renders(self, cache_size):
+        tmpl = build_environment().get_template("tmpl.html")
+        languages = list(TRANSLATIONS) + ["en-us"]
+
+        async def render(language):
+            with override(language):
+                return await tmpl.render_async(items=items)
+
+        async def render_all():
+            return await asyncio.gather(
+                *(render(language) for language in languages * 10)
+            )
+
+        results = asyncio.run(render_all())
+        assert results == [expected(language) for language in languages * 10]
+
+    def test_tasks_started_in_block(self):
+        tmpl = build_environment().get_template("tmpl.html")
+
+        async def render_all():
+            with override("de"):
+                german = asyncio.gather(
+                    *(tmpl.render_async(items=items) for i in range(5))
+                )
+            with override("es"):
+                spanish = asyncio.gather(
+                    *(tmpl.render_async(items=items) for i in range(5))
+                )
+            return await german, await spanish
+
+        german, spanish = asyncio.run(render_all())
+        assert german == [expected("de")] * 5
+        assert spanish == [expected("es")] * 5
+
+    def test_static_i18n(self):
+        env = build_environment("puente.ext.static_i18n")
+
+        async def render(language):
+            with override(language):
+                tmpl = ext.get_translated_environment(env).get_template("tmpl.html")
+                return await tmpl.render_async(items=items)
+
+        async def render_all():
+            return await asyncio.gather(
+                *(render(language) for language in TRANSLATIONS)
+            )
+
+        assert asyncio.run(render_all()) == [
+            expected(language) for language in TRANSLATIONS
+        ]
@@ -1,4 +1,6 @@
 import os
+import stat
+import sys
 from textwrap import dedent
 
 import pytest
@@ -7,6 +9,7 @@ from django.core import management
 from django.core.management import CommandError
 from django.test import TestCase
 
+from puente import commands
 from puente.commands import merge_command
 
 
@@ -99,3 +102,288 @@ class TestMergecommand:
                 },
                 languages=["de", "en-US", "fr"],
             )
+
+
+FAKE_GETTEXT = {
+    "msginit": """\
+        args = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if "=" in arg)
+        with open(args["input"]) as fp:
+            data = fp.read()
+        with open(args["output-file"], "w") as fp:
+            fp.write(data)
+        print("Created %s." % args["output-file"])
+    """,
+    "msgen": """\
+        sys.stdout.write("# msgen\\n" + sys.stdin.read())
+    """,
+    "msgmerge": """\
+        po_path = sys.argv[-2]
+        locale = po_path.split(os.sep)[-3]
+        if locale == os.environ.get("FAIL_LOCALE"):
+            print("fatal error merging %s" % locale)
+            sys.exit(1)
+        # Make locales merged first finish last
+        time.sleep({"de": 0.2, "en_US": 0.1}.get(locale, 0))
+        data = sys.stdin.read()
+        with open(po_path, "w") as fp:
+            fp.write(data)
+        print("merged %s" % locale, file=sys.stderr)
+    """,
+}
+
+
+@pytest.fixture
+def fake_gettext(tmpdir, monkeypatch):
+    """Puts scripts that stand in for the gettext tools on the PATH"""
+    bin_dir = tmpdir.mkdir("bin")
+    for name, source in FAKE_GETTEXT.items():
+        script = bin_dir.join(name)
+        script.write(
+            "#!%s\nimport os, sys, time\n%s" % (sys.executable, dedent(source))
+        )
+        script.chmod(script.stat().mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+    return bin_dir
+
+
+class TestMergeJobs:
+    def build_pot(self, tmpdir):
+        build_filesystem(
+            str(tmpdir.join("locale")),
+            {
+                "templates/LC_MESSAGES/django.pot": 'msgid "a"\nmsgstr ""\n',
+                "templates/LC_MESSAGES/other.pot": 'msgid "b"\nmsgstr ""\n',
+            },
+        )
+
+    def merge(self, tmpdir, jobs):
+        merge_command(
+            create=True,
+            backup=False,
+            base_dir=str(tmpdir),
+            domain_methods={"django": [], "other": []},
+            languages=["de", "en-US", "fr"],
+            jobs=jobs,
+        )
+
+    def test_output_order(self, tmpdir, fake_gettext, capsys):
+        self.build_pot(tmpdir)
+        self.merge(tmpdir, jobs=1)
+        serial = capsys.readouterr().out
+        for locale in ["de", "en_US", "fr"]:
+            for domain in ["django", "other"]:
+                tmpdir.join("locale", locale, "LC_MESSAGES", "%s.po" % domain).remove()
+
+        self.merge(tmpdir, jobs=6)
+        parallel = capsys.readouterr().out
+
+        assert parallel == serial
+        lines = serial.splitlines()
+        assert lines[0] == "Merging django strings to each locale..."
+        assert lines[-3:] == [
+            "Domain other finished",
+            "Merged 6 of 6 .po files; skipped 0 that didn't change.",
+            "All finished",
+        ]
+        merging = [line for line in lines if line.startswith("Merging ")]
+        assert len(merging) == 8
+        assert "merged en_US" in lines
+        for locale in ["de", "fr"]:
+            po = tmpdir.join("locale", locale, "LC_MESSAGES", "other.po")
+            assert po.read() == 'msgid "b"\nmsgstr ""\n'
+        po = tmpdir.join("locale", "en_US", "LC_MESSAGES", "other.po")
+        assert po.read() == '# msgen\nmsgid "b"\nmsgstr ""\n'
+
+    def test_skip_unchanged(self, tmpdir, fake_gettext, capsys):
+        self.build_pot(tmpdir)
+        self.merge(tmpdir, jobs=1)
+        assert "skipped 0 that didn't change" in capsys.readouterr().out
+
+        # Nothing changed, so nothing gets merged
+        self.merge(tmpdir, jobs=1)
+        output = capsys.readouterr().out
+        assert "Merged 0 of 6 .po files; skipped 6 that didn't change." in output
+        assert "merged" not in output
+
+        # Changing the .pot file merges that domain for all locales and
+        # changing a .po file merges just that one
+        build_filesystem(
+            str(tmpdir.join("locale")),
+            {
+                "templates/LC_MESSAGES/django.pot": 'msgid "c"\nmsgstr ""\n',
+                "fr/LC_MESSAGES/other.po": 'msgid "b"\nmsgstr "B"\n',
+            },
+        )
+        self.merge(tmpdir, jobs=1)
+        output = capsys.readouterr().out
+        assert "Merged 4 of 6 .po files; skipped 2 that didn't change." in output
+        assert "Merging other.po for fr" in output
+        assert "Merging other.po for de" not in output
+
+        merge_command(
+            create=True,
+            backup=False,
+            base_dir=str(tmpdir),
+            domain_methods={"django": [], "other": []},
+            languages=["de", "en-US", "fr"],
+            force=True,
+        )
+        assert "Merged 6 of 6 .po files" in capsys.readouterr().out
+
+    def test_failure(self, tmpdir, fake_gettext, monkeypatch):
+        self.build_pot(tmpdir)
+        monkeypatch.setenv("FAIL_LOCALE", "fr")
+        with pytest.raises(CommandError) as exc_info:
+            self.merge(tmpdir, jobs=4)
+        assert "fatal error merging fr" in str(exc_info.value)
+
+
+class TestMergePythonEngine:
+    POT = dedent(
+        """\
+        msgid ""
+        msgstr ""
+        "Project-Id-Version: PROJECT VERSION\\n"
+        "POT-Creation-Date: 2015-10-28 16:18+0000\\n"
+        "MIME-Version: 1.0\\n"
+        "Content-Type: text/plain; charset=UTF-8\\n"
+        "Content-Transfer-Encoding: 8bit\\n"
+
+        #: foo.html:2
+        msgid "html strings"
+        msgstr ""
+
+        #: foo.py:1
+        msgctxt "button"
+        msgid "Save"
+        msgstr ""
+
+        #: foo.py:2
+        msgid "one item"
+        msgid_plural "many items"
+        msgstr[0] ""
+        msgstr[1] ""
+        """
+    )
+
+    def merge(self, tmpdir, languages, backup=False, jobs=1):
+        merge_command(
+            create=True,
+            backup=backup,
+            base_dir=str(tmpdir),
+            domain_methods={"django": []},
+            languages=languages,
+            jobs=jobs,
+            engine="python",
+        )
+
+    def read_po(self, tmpdir, locale):
+        return tmpdir.join("locale", locale, "LC_MESSAGES", "django.po").read()
+
+    def test_create(self, tmpdir, monkeypatch):
+        # The python engine doesn't need gettext
+        monkeypatch.setenv("PATH", str(tmpdir.mkdir("bin")))
+        build_filesystem(
+            str(tmpdir.join("locale")), {"templates/LC_MESSAGES/django.pot": self.POT}
+        )
+        self.merge(tmpdir, ["de", "en-US", "ja"])
+
+        de = self.read_po(tmpdir, "de")
+        assert '"Language: de\\n"' in de
+        assert 'msgctxt "button"\nmsgid "Save"\nmsgstr ""\n' in de
+        assert 'msgstr[1] ""' in de
+
+        # Japanese has one plural form
+        ja = self.read_po(tmpdir, "ja")
+        assert 'msgstr[0] ""' in ja
+        assert "msgstr[1]" not in ja
+
+        # English gets the msgid as translation like msgen does
+        en_us = self.read_po(tmpdir, "en_US")
+        assert 'msgid "html strings"\nmsgstr "html strings"\n' in en_us
+        assert 'msgstr[0] "one item"\nmsgstr[1] "many items"\n' in en_us
+
+    def test_update(self, tmpdir):
+        build_filesystem(
+            str(tmpdir.join("locale")),
+            {
+                "templates/LC_MESSAGES/django.pot": self.POT,
+                "de/LC_MESSAGES/django.po": dedent(
+                    """\
+                    msgid ""
+                    msgstr ""
+                    "Language: de\\n"
+                    "MIME-Version: 1.0\\n"
+                    "Content-Type: text/plain; charset=UTF-8\\n"
+                    "Content-Transfer-Encoding: 8bit\\n"
+                    "Plural-Forms: nplurals=2; plural=(n != 1);\\n"
+
+                    #: foo.html:2
+                    msgid "html string"
+                    msgstr "HTML-Zeichenkette"
+
+                    #: foo.py:1
+                    msgctxt "button"
+                    msgid "Save"
+                    msgstr "Speichern"
+
+                    #: foo.py:9
+                    msgid "removed string"
+                    msgstr "Entfernt"
+                    """
+                ),
+            },
+        )
+        self.merge(tmpdir, ["de"], backup=True)
+
+        de = self.read_po(tmpdir, "de")
+        # Changed strings are marked fuzzy and keep their translation
+        assert (
+            '#: foo.html:2\n#, fuzzy\nmsgid "html strings"\nmsgstr "HTML-Zeichenkette"\n'
+            in de
+        )
+        assert 'msgctxt "button"\nmsgid "Save"\nmsgstr "Speichern"\n' in de
+        # Strings that are gone are kept as obsolete
+        assert '#~ msgid "removed string"\n#~ msgstr "Entfernt"\n' in de
+        assert tmpdir.join("locale", "de", "LC_MESSAGES", "django.po~").exists()
+
+        # Merging again doesn't change anything
+        tmpdir.join("locale", "de", "LC_MESSAGES", "django.po~").remove()
+        self.merge(tmpdir, ["de"], backup=True)
+        assert self.read_po(tmpdir, "de") == de
+        assert not tmpdir.join("locale", "de", "LC_MESSAGES", "django.po~").exists()
+
+    def test_jobs(self, tmpdir, monkeypatch):
+        pools = []
+
+        class ProcessPoolExecutor(commands.ProcessPoolExecutor):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                pools.append(self)
+
+        monkeypatch.setattr(commands, "ProcessPoolExecutor", ProcessPoolExecutor)
+        languages = ["de", "en-US", "fr", "ja"]
+        for name, jobs in [("serial", 1), ("parallel", 3)]:
+            build_filesystem(
+                str(tmpdir.join(name, "locale")),
+                {"templates/LC_MESSAGES/django.pot": self.POT},
+            )
+            self.merge(tmpdir.join(name), languages, jobs=jobs)
+
+        # Babel is pure Python, so several jobs merge in separate processes
+        assert len(pools) == 1
+        for locale in ["de", "en_US", "fr", "ja"]:
+            assert self.read_po(tmpdir.join("parallel"), locale) == self.read_po(
+                tmpdir.join("serial"), locale
+            )
+
+    def test_unknown_engine(self, tmpdir):
+        with pytest.raises(CommandError):
+            merge_command(
+                create=True,
+                backup=False,
+                base_dir=str(tmpdir),
+                domain_methods={"django": []},
+                languages=["de"],
+                engine="unknown",
+            )
@@ -0,0 +1,86 @@
+import json
+
+from puente.commands import extract_command
+from puente.profiling import ExtractionProfile
+from puente import settings as puente_settings
+
+
+class TestExtractionProfile:
+    def build_profile(self):
+        profile = ExtractionProfile()
+        profile.add_phase("extract", 1.5)
+        profile.add_file("a.py", "python", ["django"], 0.5, 100, 2, False)
+        profile.add_file("b.html", "jinja2", ["django", "other"], 0.75, 200, 3, False)
+        profile.add_file("c.py", "python", ["other"], 0.25, 50, 0, True)
+        return profile
+
+    def test_by_method(self):
+        assert self.build_profile().by_method() == {
+            "jinja2": {"files": 1, "seconds": 0.75, "bytes": 200, "messages": 3},
+            "python": {"files": 2, "seconds": 0.75, "bytes": 150, "messages": 2},
+        }
+
+    def test_by_domain(self):
+        assert self.build_profile().by_domain() == {
+            "django": {"files": 2, "seconds": 1.25, "bytes": 300, "messages": 5},
+            "other": {"files": 2, "seconds": 1.0, "bytes": 250, "messages": 3},
+        }
+
+    def test_slowest(self):
+        slowest = self.build_profile().slowest(2)
+        assert [record["filename"] for record in slowest] == ["b.html", "a.py"]
+
+    def test_as_dict(self):
+        data = self.build_profile().as_dict(1)
+        assert data["phases"] == {"extract": 1.5}
+        assert data["totals"] == {
+            "files": 3,
+            "seconds": 1.5,
+            "bytes": 350,
+            "messages": 5,
+            "cached": 1,
+        }
+        assert [record["filename"] for record in data["slowest"]] == ["b.html"]
+        assert len(data["files"]) == 3
+
+    def test_format_report(self):
+        report = self.build_profile().format_report(1)
+        assert "By method:" in report
+        assert "By domain:" in report
+        assert "Slowest 1 files:" in report
+        assert "b.html" in report
+
+
+class TestExtractCommandProfile:
+    def test_profile(self, tmpdir, capsys):
+        tmpdir.join("src", "a.py").write("_('a')\n_('b')\n", ensure=True)
+        tmpdir.join("src", "b.html").write("{{ _('c') }}\n")
+        profile_json = tmpdir.join("profile.json")
+
+        extract_command(
+            outputdir=str(tmpdir.join("out")),
+            domain_methods={
+                "django": [("src/*.py", "python"), ("src/*.html", "jinja2")],
+                "other": [("src/*.html", "jinja2")],
+            },
+            text_domain=puente_settings.TEXT_DOMAIN,
+            keywords=puente_settings.KEYWORDS,
+            comment_tags=puente_settings.COMMENT_TAGS,
+            base_dir=str(tmpdir),
+            project=puente_settings.PROJECT,
+            version=puente_settings.VERSION,
+            msgid_bugs_address=puente_settings.MSGID_BUGS_ADDRESS,
+            profile=True,
+            profile_json=str(profile_json),
+            profile_top=1,
+        )
+
+        assert "Extraction profile:" in capsys.readouterr().out
+
+        data = json.loads(profile_json.read())
+        assert sorted(data["phases"]) == ["extract", "find files", "total", "write"]
+        assert data["by_method"]["python"]["messages"] == 2
+        assert data["by_domain"]["django"]["files"] == 2
+        assert data["by_domain"]["other"]["messages"] == 1
+        assert data["totals"]["bytes"] == len("_('a')\n_('b')\n{{ _('c') }}\n")
+        assert len(data["slowest"]) == 1
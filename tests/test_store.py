@@ -0,0 +1,181 @@
+import gettext
+from io import BytesIO
+
+import pytest
+
+from babel.messages.catalog import Catalog
+from babel.messages.mofile import write_mo
+
+from django.utils import translation
+from django.utils.translation import trans_real
+
+from jinja2 import Environment
+
+from puente import ext
+from puente.store import (
+    CatalogStore,
+    StoreCatalog,
+    StoreDjangoTranslation,
+    StoreTranslations,
+    write_store,
+)
+from puente.utils import atomic_write
+from puente.warmup import warmup
+
+
+def build_catalog(locale="ru"):
+    catalog = Catalog(locale=locale)
+    catalog.add("Save", "Сохранить")
+    catalog.add("Open", "Открыть", context="verb")
+    catalog.add("Open", "Открытый", context="adjective")
+    catalog.add(
+        ("%(num)s file", "%(num)s files"),
+        ("%(num)s файл", "%(num)s файла", "%(num)s файлов"),
+    )
+    catalog.add(
+        ("one item", "%(num)s items"),
+        ("один предмет", "%(num)s предмета", "%(num)s предметов"),
+        context="cart",
+    )
+    catalog.add("Cancel", "Отменить", flags=["fuzzy"])
+    catalog.add("Untranslated")
+    for i in range(100):
+        catalog.add("Message %d" % i, "Сообщение %d" % i)
+    return catalog
+
+
+def write(path, catalog, **kwargs):
+    with open(str(path), "wb") as fp:
+        write_store(fp, catalog, **kwargs)
+    return CatalogStore(str(path))
+
+
+class TestCatalogStore:
+    def test_same_as_mo(self, tmpdir):
+        catalog = build_catalog()
+        store = write(tmpdir.join("django.store"), catalog)
+        buf = BytesIO()
+        write_mo(buf, catalog)
+        buf.seek(0)
+        mo = gettext.GNUTranslations(buf)
+
+        for message in ["Save", "Cancel", "Untranslated", "Missing", "Message 42"]:
+            assert store.gettext(message) == mo.gettext(message)
+        for context in ["verb", "adjective", "noun"]:
+            assert store.pgettext(context, "Open") == mo.pgettext(context, "Open")
+        for n in [0, 1, 2, 5, 11, 21, 22, 25, 101]:
+            assert store.ngettext("%(num)s file", "%(num)s files", n) == mo.ngettext(
+                "%(num)s file", "%(num)s files", n
+            )
+            assert store.npgettext(
+                "cart", "one item", "%(num)s items", n
+            ) == mo.npgettext("cart", "one item", "%(num)s items", n)
+            assert store.ngettext("thing", "things", n) == mo.ngettext(
+                "thing", "things", n
+            )
+        assert len(store) == 105
+
+    def test_catalog(self, tmpdir):
+        catalog = StoreCatalog(write(tmpdir.join("django.store"), build_catalog()))
+        assert catalog["Save"] == "Сохранить"
+        assert catalog["verb\x04Open"] == "Открыть"
+        assert catalog[("%(num)s file", 2)] == "%(num)s файлов"
+        assert catalog.plural("%(num)s file", 21) == "%(num)s файл"
+        assert "Untranslated" not in catalog
+        assert "%(num)s file" not in catalog
+        with pytest.raises(KeyError):
+            catalog.plural("thing", 2)
+        assert len(catalog) == 109
+        assert dict(catalog.items())["cart\x04one item", 1] == "%(num)s предмета"
+
+    def test_use_fuzzy(self, tmpdir):
+        store = write(tmpdir.join("django.store"), build_catalog(), use_fuzzy=True)
+        assert store.gettext("Cancel") == "Отменить"
+
+    def test_empty(self, tmpdir):
+        store = write(tmpdir.join("django.store"), Catalog(locale="de"))
+        assert len(store) == 0
+        assert store.gettext("Save") == "Save"
+        assert store.ngettext("file", "files", 2) == "files"
+
+    def test_not_a_store(self, tmpdir):
+        path = tmpdir.join("django.store")
+        path.write_binary(b"\x00" * 100)
+        with pytest.raises(ValueError):
+            CatalogStore(str(path))
+
+
+class TestStoreTranslations:
+    @pytest.fixture
+    def translations(self, tmpdir):
+        path = tmpdir.join("ru", "LC_MESSAGES", "django.store")
+        path.dirpath().ensure(dir=True)
+        write(path, build_catalog()).close()
+        return StoreTranslations(str(tmpdir))
+
+    def test_active_language(self, translations):
+        with translation.override("ru"):
+            assert translations.gettext("Save") == "Сохранить"
+            assert translations.pgettext("verb", "Open") == "Открыть"
+        with translation.override("ru-ua"):
+            assert translations.gettext("Save") == "Сохранить"
+        with translation.override("de"):
+            assert translations.gettext("Save") == "Save"
+            assert translations.ngettext("file", "files", 2) == "files"
+            assert translations.npgettext("cart", "item", "items", 1) == "item"
+
+    def test_reload(self, translations, tmpdir):
+        with translation.override("ru"):
+            assert translations.gettext("Save") == "Сохранить"
+            catalog = Catalog(locale="ru")
+            catalog.add("Save", "Записать")
+            buf = BytesIO()
+            write_store(buf, catalog)
+            path = tmpdir.join("ru", "LC_MESSAGES", "django.store")
+            atomic_write(str(path), buf.getvalue())
+            assert translations.gettext("Save") == "Сохранить"
+            translations.reload()
+            assert translations.gettext("Save") == "Записать"
+
+    def test_install_django(self, translations, settings):
+        # Changing LANGUAGES has Django reset its translations afterwards
+        settings.LANGUAGES = [("en-us", "English"), ("ru", "Russian")]
+        assert translations.install_django() == ["ru"]
+        warmup(languages=["en-us", "ru"])
+
+        ru = trans_real._translations["ru"]
+        assert isinstance(ru, StoreDjangoTranslation)
+        assert isinstance(ru._catalog, StoreCatalog)
+        assert "Message 42" not in ru._fallback._catalog
+        with translation.override("ru"):
+            assert translation.get_language() == "ru"
+            assert translation.gettext("Save") == "Сохранить"
+            assert translation.pgettext("adjective", "Open") == "Открытый"
+            assert (
+                translation.ngettext("%(num)s file", "%(num)s files", 5)
+                == "%(num)s файлов"
+            )
+            assert (
+                translation.npgettext("cart", "one item", "%(num)s items", 2)
+                == "%(num)s предмета"
+            )
+            # Django's own catalogs are still there
+            assert translation.gettext("This field is required.") != (
+                "This field is required."
+            )
+            assert translation.gettext("Untranslated") == "Untranslated"
+            assert translation.ngettext("thing", "things", 2) == "things"
+
+    @pytest.mark.parametrize("cache_size", [0, 10])
+    def test_jinja2(self, translations, settings, cache_size):
+        settings.PUENTE = dict(settings.PUENTE, TRANSLATION_CACHE_SIZE=cache_size)
+        env = Environment(autoescape=True, extensions=["puente.ext.i18n"])
+        env.install_gettext_translations(translations, newstyle=True)
+        tmpl = env.from_string(
+            '{{ _("Save") }} {{ pgettext("verb", "Open") }} '
+            '{{ npgettext("cart", "one item", "%(num)s items", 5) }}'
+        )
+        with translation.override("ru"):
+            assert tmpl.render() == "Сохранить Открыть 5 предметов"
+        if ext.translation_cache is not None:
+            ext.translation_cache.clear()
@@ -0,0 +1,164 @@
+import pytest
+
+from babel.messages.catalog import Catalog
+from babel.messages.mofile import write_mo
+from django.core.management.base import CommandError
+from django.utils import translation
+from jinja2 import Environment
+
+from puente import untranslated
+from puente.commands import untranslated_report_command
+from puente.untranslated import (
+    FileSink,
+    UntranslatedTracker,
+    find_dumps,
+    read_dumps,
+)
+
+
+class ListSink:
+    def __init__(self):
+        self.dumps = []
+
+    def emit(self, dump):
+        self.dumps.append(dump)
+
+
+@pytest.fixture
+def catalog(tmpdir, settings):
+    catalog = Catalog(locale="fr")
+    catalog.add("Hello", "Bonjour")
+    catalog.add("Open", "Ouvrir", context="verb")
+    catalog.add("OK", "OK")
+    mo_dir = tmpdir.mkdir("locale").mkdir("fr").mkdir("LC_MESSAGES")
+    with open(str(mo_dir.join("django.mo")), "wb") as fp:
+        write_mo(fp, catalog)
+    settings.LOCALE_PATHS = [str(tmpdir.join("locale"))]
+
+
+@pytest.fixture
+def sampled(settings, catalog):
+    settings.PUENTE = dict(settings.PUENTE, UNTRANSLATED_SAMPLE_RATE=1.0)
+    tracker = untranslated.get_tracker()
+    tracker.sink = ListSink()
+    yield tracker
+    settings.PUENTE = dict(settings.PUENTE, UNTRANSLATED_SAMPLE_RATE=0)
+
+
+def build_environment():
+    env = Environment(autoescape=True, extensions=["puente.ext.i18n"])
+    env.install_gettext_translations(translation, newstyle=True)
+    return env
+
+
+class TestUntranslatedTracker:
+    def test_off_by_default(self, settings):
+        settings.PUENTE = {}
+        assert untranslated.get_tracker() is None
+        env = build_environment()
+        for name in ["gettext", "ngettext", "pgettext", "npgettext"]:
+            assert not hasattr(env.globals[name], "puente_tracked")
+
+    def test_records_untranslated(self, sampled):
+        tmpl = build_environment().from_string(
+            '{{ _("Hello") }} {{ _("Goodbye") }} {{ pgettext("verb", "Open") }} '
+            '{{ pgettext("verb", "Close") }} {{ ngettext("file", "files", 2) }} '
+            '{{ _("Goodbye") }}'
+        )
+        with translation.override("fr"):
+            assert tmpl.render() == "Bonjour Goodbye Ouvrir Close files Goodbye"
+        assert sampled.counts == {
+            ("fr", None, "Goodbye"): 2,
+            ("fr", "verb", "Close"): 1,
+            ("fr", None, "file"): 1,
+        }
+
+    def test_same_as_source_string(self, sampled):
+        tmpl = build_environment().from_string('{{ _("OK") }}')
+        with translation.override("fr"):
+            assert tmpl.render() == "OK"
+        assert sampled.counts == {}
+
+    def test_source_language(self, sampled):
+        tmpl = build_environment().from_string(
+            '{{ _("Hello") }} {{ _("Goodbye") }} {{ pgettext("verb", "Open") }}'
+        )
+        for language in ["en-us", "en-US"]:
+            with translation.override(language):
+                assert tmpl.render() == "Hello Goodbye Open"
+        assert sampled.counts == {}
+
+    def test_skip_languages(self, settings, catalog):
+        settings.PUENTE = dict(
+            settings.PUENTE,
+            UNTRANSLATED_SAMPLE_RATE=1.0,
+            UNTRANSLATED_SKIP_LANGUAGES=["fr"],
+        )
+        try:
+            tracker = untranslated.get_tracker()
+            assert tracker.skip_languages == {"en-us", "fr"}
+        finally:
+            settings.PUENTE = dict(settings.PUENTE, UNTRANSLATED_SAMPLE_RATE=0)
+
+    def test_max_entries(self):
+        tracker = UntranslatedTracker(ListSink(), 1.0, max_entries=2)
+        for msgid in ["a", "b", "c", "a"]:
+            tracker.record("fr", None, msgid)
+        assert tracker.counts == {("fr", None, "a"): 2, ("fr", None, "b"): 1}
+        assert tracker.dropped == 1
+
+    def test_flushes_after_interval(self):
+        sink = ListSink()
+        tracker = UntranslatedTracker(sink, 0.5, flush_interval=0)
+        tracker.record("fr", None, "Goodbye")
+        assert tracker.counts == {}
+        [dump] = sink.dumps
+        assert dump["sample_rate"] == 0.5
+        assert dump["entries"] == [["fr", None, "Goodbye", 1]]
+
+    def test_flush_nothing(self):
+        sink = ListSink()
+        UntranslatedTracker(sink, 1.0).flush()
+        assert sink.dumps == []
+
+
+class TestDumps:
+    def test_round_trip(self, tmpdir):
+        directory = str(tmpdir.join("dumps"))
+        tracker = UntranslatedTracker(FileSink(directory), 0.5)
+        tracker.record("fr", None, "Goodbye")
+        tracker.record("fr", "verb", "Close")
+        tracker.flush()
+        tracker.sample_rate = 0.25
+        tracker.record("fr", None, "Goodbye")
+        tracker.flush()
+
+        paths = find_dumps(directory)
+        assert len(paths) == 1
+        assert read_dumps(paths) == {
+            ("fr", None, "Goodbye"): 6,
+            ("fr", "verb", "Close"): 2,
+        }
+
+    def test_report(self, tmpdir, capsys):
+        directory = str(tmpdir)
+        tracker = UntranslatedTracker(FileSink(directory), 0.1)
+        for msgid in ["Goodbye", "Goodbye", "Close"]:
+            tracker.record("fr", None, msgid)
+        tracker.record("de", "verb", "Close")
+        tracker.flush()
+
+        ranked = untranslated_report_command(find_dumps(directory), top=2)
+        assert ranked == [
+            (("fr", None, "Goodbye"), 20),
+            (("fr", None, "Close"), 10),
+        ]
+        ranked = untranslated_report_command(find_dumps(directory), locale="de")
+        assert ranked == [(("de", "verb", "Close"), 10)]
+        out = capsys.readouterr().out
+        assert "20  fr        Goodbye" in out
+        assert "Close [verb]" in out
+
+    def test_report_no_dumps(self):
+        with pytest.raises(CommandError):
+            untranslated_report_command([])
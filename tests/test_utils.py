@@ -1,4 +1,4 @@
-from puente.utils import collapse_whitespace, generate_keywords
+from puente.utils import atomic_write, collapse_whitespace, generate_keywords
 
 
 class TestGenerateKeywords:
@@ -40,3 +40,17 @@ def test_collapse_whitespace():
     ]
     for text, expected in data:
         assert collapse_whitespace(text) == expected
+
+
+def test_atomic_write(tmpdir):
+    path = tmpdir.join("foo.txt")
+    atomic_write(str(path), b"first")
+    assert path.read_binary() == b"first"
+
+    path.chmod(0o640)
+    atomic_write(str(path), b"second")
+    assert path.read_binary() == b"second"
+    assert path.stat().mode & 0o777 == 0o640
+
+    # No temp files left behind
+    assert tmpdir.listdir() == [path]
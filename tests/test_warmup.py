@@ -0,0 +1,94 @@
+from django.core import management
+from django.test import TestCase
+from django.utils.translation import trans_real
+
+from jinja2 import FileSystemBytecodeCache
+
+from puente.commands import warmup_command
+from puente.ext import get_translated_environment
+from puente.warmup import find_jinja2_engine, post_fork, warmup
+
+
+class TestManageWarmup(TestCase):
+    def test_help(self):
+        try:
+            management.call_command("puente_warmup", "--help")
+        except SystemExit:
+            # Calling --help causes it to call sys.exit(0) which
+            # will otherwise exit.
+            pass
+
+
+class TestWarmup:
+    def setup_templates(self, tmpdir, settings, extension="puente.ext.i18n"):
+        tmpdir.join("templates", "index.html").write(
+            "{% trans %}Hello{% endtrans %}", ensure=True
+        )
+        tmpdir.join("templates", "sub", "page.html").write(
+            '{% extends "index.html" %}', ensure=True
+        )
+        tmpdir.join("templates", "broken.html").write("{% if %}", ensure=True)
+        tmpdir.join("bytecode").ensure(dir=True)
+        settings.TEMPLATES = [
+            {
+                "BACKEND": "django.template.backends.jinja2.Jinja2",
+                "DIRS": [str(tmpdir.join("templates"))],
+                "OPTIONS": {
+                    "extensions": [extension],
+                    "bytecode_cache": FileSystemBytecodeCache(
+                        str(tmpdir.join("bytecode"))
+                    ),
+                },
+            }
+        ]
+        settings.LANGUAGES = [("de", "German"), ("fr", "French")]
+
+    def test_warmup(self, tmpdir, settings):
+        self.setup_templates(tmpdir, settings)
+        trans_real._translations.pop("fr", None)
+
+        results = warmup()
+
+        assert results["languages"] == ["de", "fr"]
+        assert "fr" in trans_real._translations
+        assert results["templates"] == ["broken.html", "index.html", "sub/page.html"]
+        assert [name for name, error in results["errors"]] == ["broken.html"]
+        assert len(tmpdir.join("bytecode").listdir()) == 2
+        assert set(results["timings"]) == {"catalogs", "discovery", "templates"}
+
+        env = find_jinja2_engine().env
+        assert (env.loader, "index.html") in [
+            (key[0](), key[1]) for key in env.cache.keys()
+        ]
+
+    def test_languages(self, tmpdir, settings):
+        self.setup_templates(tmpdir, settings)
+        assert warmup(languages=["es"])["languages"] == ["es"]
+
+    def test_static_i18n(self, tmpdir, settings):
+        self.setup_templates(tmpdir, settings, "puente.ext.static_i18n")
+        warmup()
+        env = find_jinja2_engine().env
+        for language in ["de", "fr"]:
+            assert len(get_translated_environment(env, language).cache) == 2
+
+    def test_no_jinja2_backend(self, settings):
+        settings.TEMPLATES = []
+        settings.LANGUAGES = [("de", "German")]
+        results = warmup()
+        assert results["templates"] == []
+        assert "templates" not in results["timings"]
+
+    def test_command(self, tmpdir, settings, capsys):
+        self.setup_templates(tmpdir, settings)
+        warmup_command()
+        out = capsys.readouterr().out
+        assert "Can not compile broken.html" in out
+        assert "Loaded catalogs for 2 languages" in out
+        assert "Found 3 templates" in out
+        assert "Compiled 2 templates" in out
+
+    def test_post_fork(self, tmpdir, settings):
+        self.setup_templates(tmpdir, settings)
+        post_fork(server=None, worker=None)
+        assert len(tmpdir.join("bytecode").listdir()) == 2